@@ -0,0 +1,426 @@
+"""Keeping the database in step with the CSV files in mock-data/.
+
+SYNC_TABLES maps each file to its model and a row parser, in dependency
+order. sync_file() makes a table match its whole file; this is
+``load_mock_data --sync-mode``. CSVFileState lets ``watch_csv_changes``
+apply a new version of a file incrementally:
+
+- A file whose bytes equal the last synced version is skipped.
+- Otherwise the bytes before and after the edit are found by binary search
+  over slices of the old and new contents, which compares in C. The edit
+  region is widened to whole lines, then to whole CSV records (a quoted
+  field may span lines).
+- Only the records in that region are parsed. Their fingerprints (the
+  tuple of raw fields) are compared by id, and only inserted, updated and
+  deleted rows are written.
+
+Derived state (rollups, current vitals, cached responses) is refreshed for
+the users and buckets the written rows touch. A HealthData edit older than
+a user's dashboard snapshot leaves the snapshot as it is.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from django.db import transaction
+from accounts.models import User, EmergencyContact
+from cardiocare.cache import invalidate_user
+from cardiocare.sync import apply_changes, sync_table
+from emergency_system.models import EmergencyResponse
+from health_monitoring.models import (
+    AIAnalysis, CurrentVitals, ECGReading, HealthAlert, HealthData, HealthHistoryMessage, numeric_values
+)
+from health_monitoring.rollups import rebuild_rollups, record_rollups
+from health_monitoring.vitals import METRIC_FIELDS, rebuild_current_vitals
+from health_monitoring.waveform import csv_waveform_fields
+
+# Above this many changed HealthData rows a user's rollups are rebuilt rather than patched bucket by bucket
+ROLLUP_PATCH_LIMIT = 10000
+LOOKUP_BATCH_SIZE = 500
+
+
+def parse_timestamp(value):
+    """Aware datetime from an ISO 8601 CSV value; None for an empty or 'null' value"""
+    if not value or value == 'null':
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class KnownIds(dict):
+    """Ids of each referenced table, read on first use. Drop a model's entry once its table changes."""
+
+    def __missing__(self, model):
+        ids = self[model] = set(model.objects.values_list('id', flat=True))
+        return ids
+
+
+def user_fields(row, known):
+    return {
+        'email': row['email'],
+        'username': row['email'],
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'provider': row['provider'],
+        'provider_id': row['provider_id'],
+        'date_of_birth': datetime.strptime(row['date_of_birth'], '%Y-%m-%d').date() if row['date_of_birth'] else None,
+        'gender': row['gender'],
+        'height': float(row['height']) if row['height'] else None,
+        'weight': float(row['weight']) if row['weight'] else None,
+        'emergency_auto_call': row['emergency_auto_call'].lower() == 'true',
+        'emergency_whatsapp': row['emergency_whatsapp'].lower() == 'true',
+        'emergency_ai_voice': row['emergency_ai_voice'].lower() == 'true',
+    }
+
+
+def emergency_contact_fields(row, known):
+    return {
+        'user_id': int(row['user_id']),
+        'name': row['name'],
+        'phone': row['phone'],
+        'relationship': row['relationship'],
+        'priority': int(row['priority']),
+        'is_active': row['is_active'].lower() == 'true',
+    }
+
+
+def health_data_fields(row, known):
+    value = json.loads(row['value'])
+    primary_value, secondary_value = numeric_values(row['data_type'], value)
+    return {
+        'user_id': int(row['user_id']),
+        'data_type': row['data_type'],
+        'value': value,
+        'primary_value': primary_value,
+        'secondary_value': secondary_value,
+        'unit': row['unit'],
+        'source': row['source'],
+        'recorded_at': parse_timestamp(row['recorded_at']),
+    }
+
+
+def ecg_reading_fields(row, known):
+    return {
+        'user_id': int(row['user_id']),
+        **csv_waveform_fields(row),
+        'heart_rate': int(row['heart_rate']),
+        'duration': int(row['duration']),
+        'quality_score': float(row['quality_score']),
+        'anomalies_detected': json.loads(row['anomalies_detected']),
+        'recorded_at': parse_timestamp(row['recorded_at']),
+    }
+
+
+def ai_analysis_fields(row, known):
+    return {
+        'user_id': int(row['user_id']),
+        'health_data': json.loads(row['health_data']),
+        'risk_level': row['risk_level'],
+        'analysis_result': row['analysis_result'],
+        'prediction': row['prediction'],
+        'confidence_score': float(row['confidence_score']),
+        'recommendations': json.loads(row['recommendations']),
+        'time_to_emergency': row['time_to_emergency'] if row['time_to_emergency'] != 'null' else None,
+    }
+
+
+def health_alert_fields(row, known):
+    # An alert whose analysis is not in the table keeps no link to it
+    analysis_id = None
+    if row['ai_analysis_id'] and row['ai_analysis_id'] != 'null' and int(row['ai_analysis_id']) in known[AIAnalysis]:
+        analysis_id = int(row['ai_analysis_id'])
+    return {
+        'user_id': int(row['user_id']),
+        'alert_type': row['alert_type'],
+        'title': row['title'],
+        'message': row['message'],
+        'status': row['status'],
+        'severity': row['severity'],
+        'ai_analysis_id': analysis_id,
+        'emergency_call_initiated': row['emergency_call_initiated'].lower() == 'true',
+        'contacts_notified': row['contacts_notified'].lower() == 'true',
+        'resolved_at': parse_timestamp(row['resolved_at']),
+    }
+
+
+def emergency_response_fields(row, known):
+    return {
+        'user_id': int(row['user_id']),
+        'response_type': row['response_type'],
+        'recipient': row['recipient'],
+        'message': row['message'],
+        'status': row['status'],
+        'external_id': row['external_id'],
+        'sent_at': parse_timestamp(row['sent_at']),
+        'delivered_at': parse_timestamp(row['delivered_at']),
+    }
+
+
+def health_history_message_fields(row, known):
+    return {
+        'user_id': int(row['user_id']),
+        'message_type': row['message_type'],
+        'content': row['content'],
+        'attachments': json.loads(row['attachments']),
+        'timestamp': parse_timestamp(row['timestamp']),
+    }
+
+
+# file -> (model, parser), parents before children. A parser turns a CSV row into values keyed by field attname.
+SYNC_TABLES = {
+    'users.csv': (User, user_fields),
+    'emergency_contacts.csv': (EmergencyContact, emergency_contact_fields),
+    'health_data.csv': (HealthData, health_data_fields),
+    'ecg_readings.csv': (ECGReading, ecg_reading_fields),
+    'ai_analyses.csv': (AIAnalysis, ai_analysis_fields),
+    'health_alerts.csv': (HealthAlert, health_alert_fields),
+    'emergency_responses.csv': (EmergencyResponse, emergency_response_fields),
+    'health_history_messages.csv': (HealthHistoryMessage, health_history_message_fields),
+}
+
+# Tables whose rows feed CurrentVitals
+VITALS_MODELS = (User, HealthData, ECGReading, AIAnalysis)
+
+
+def dependents(model):
+    """Files whose rows point at ``model``'s rows"""
+    return [
+        file_name for file_name, (other, _) in SYNC_TABLES.items()
+        if any(field.many_to_one and field.related_model is model for field in other._meta.concrete_fields)
+    ]
+
+
+def parse_rows(records, parse, known, counts):
+    """(id, values) pairs for CSV rows (dicts). Rows of unknown users are skipped and counted."""
+    for row in records:
+        if 'user_id' in row and int(row['user_id']) not in known[User]:
+            counts['skipped'] += 1
+            continue
+        yield int(row['id']), parse(row, known)
+
+
+def sync_file(data_dir, file_name, known):
+    """Make a table match its whole CSV file. Returns counts, or None if the file does not exist."""
+    model, parse = SYNC_TABLES[file_name]
+    file_path = os.path.join(data_dir, file_name)
+    if not os.path.exists(file_path):
+        return None
+
+    with open(file_path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        id_column = next(reader).index('id')
+        csv_ids = {int(row[id_column]) for row in reader}
+
+    counts = {'skipped': 0}
+
+    def rows():
+        with open(file_path, 'r', newline='') as file:
+            yield from parse_rows(csv.DictReader(file), parse, known, counts)
+
+    counts.update(sync_table(model, csv_ids, rows()))
+    known.pop(model, None)
+    return counts
+
+
+def refresh_users(user_ids, rollups=True, vitals=True):
+    """Rebuild dashboard snapshots (and rollups) and drop cached responses for users"""
+    for user_id in user_ids:
+        if vitals:
+            rebuild_current_vitals(user_id)
+        if rollups:
+            rebuild_rollups(user_id)
+        invalidate_user(user_id)
+
+
+def _in_batches(queryset, ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        yield from queryset.filter(pk__in=ids[start:start + LOOKUP_BATCH_SIZE])
+
+
+def _common_prefix(a, b):
+    """Length of the prefix two sequences share; each probe compares a slice in C"""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a, b, limit):
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _inside_quotes(content, offset):
+    """Whether a quoted field is still open at byte ``offset``.
+
+    A well-formed file closes every quote, so the shorter side is counted.
+    """
+    if offset <= len(content) // 2:
+        return content.count(b'"', 0, offset) % 2 == 1
+    return content.count(b'"', offset) % 2 == 1
+
+
+def _first_line(content):
+    end = content.find(b'\n')
+    return content if end == -1 else content[:end]
+
+
+def _next_line(content, offset):
+    """Offset of the first line start at or after ``offset``"""
+    if offset == 0 or content[offset - 1:offset] == b'\n':
+        return offset
+    end = content.find(b'\n', offset)
+    return len(content) if end == -1 else end + 1
+
+
+def _records(region):
+    """Raw field lists of a byte range that holds whole records"""
+    return [row for row in csv.reader(io.StringIO(region.decode(), newline='')) if row]
+
+
+class CSVFileState:
+    """The last synced version of one CSV file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.content = None
+
+    def read(self):
+        """Current bytes of the file, or None if it does not exist"""
+        try:
+            with open(self.path, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def commit(self, content):
+        """Record ``content`` as synced"""
+        self.content = content
+
+    def diff(self, content):
+        """(changed rows, deleted ids) between the synced version and ``content``.
+
+        Changed rows are dicts of the inserted and updated records. Returns
+        None when there is no synced version or the header changed; the
+        whole file must then be synced.
+        """
+        old, new = self.content, content
+        if old is None:
+            return None
+        old_header, new_header = _first_line(old), _first_line(new)
+        # Line endings may change with the editor; only a different column list forces a full sync
+        if not new_header.strip() or old_header.rstrip(b'\r') != new_header.rstrip(b'\r'):
+            return None
+
+        # The edit lies between the bytes both versions start and end with, widened to whole
+        # lines and then to whole records: neither edge may fall inside a quoted field
+        start = new.rfind(b'\n', 0, _common_prefix(old, new)) + 1
+        while start > len(new_header) + 1 and _inside_quotes(new, start):
+            start = new.rfind(b'\n', 0, start - 1) + 1
+
+        end = _next_line(new, len(new) - _common_suffix(old, new, min(len(old), len(new)) - start))
+        while end < len(new) and _inside_quotes(new, end):
+            end = _next_line(new, end + 1)
+        # Everything after ``end`` is the same in both versions
+        old_end = len(old) - (len(new) - end)
+
+        old_start = max(start, len(old_header) + 1)
+        new_start = max(start, len(new_header) + 1)
+        header = next(csv.reader([new_header.decode()]))
+        id_column = header.index('id')
+        before = {
+            int(row[id_column]): tuple(row) for row in _records(old[old_start:max(old_end, old_start)])
+        }
+        after = {
+            int(row[id_column]): tuple(row) for row in _records(new[new_start:max(end, new_start)])
+        }
+        changed = [dict(zip(header, row)) for pk, row in after.items() if before.get(pk) != row]
+        return changed, set(before) - set(after)
+
+
+def _touched(model, ids):
+    """User ids (and HealthData rows, for rollups) that rows ``ids`` belong to right now"""
+    if model is User:
+        return set(ids), []
+    if model is HealthData:
+        readings = list(_in_batches(HealthData.objects.only('user_id', 'data_type', 'recorded_at'), ids))
+        return {reading.user_id for reading in readings}, readings
+    return {row['user_id'] for row in _in_batches(model.objects.values('pk', 'user_id'), ids)}, []
+
+
+def _stale_vitals(readings):
+    """Users whose snapshot may show one of ``readings``: an older reading of a type never does"""
+    user_ids = {reading.user_id for reading in readings}
+    snapshots = {vitals.pk: vitals for vitals in _in_batches(CurrentVitals.objects.all(), user_ids)}
+    stale = set()
+    for reading in readings:
+        if reading.data_type not in METRIC_FIELDS:
+            continue
+        shown_at = getattr(snapshots.get(reading.user_id), METRIC_FIELDS[reading.data_type][0], None)
+        if shown_at is None or reading.recorded_at >= shown_at:
+            stale.add(reading.user_id)
+    return stale
+
+
+def apply_file(data_dir, file_name, state, known):
+    """Bring a table up to date with its file's changes since ``state`` was committed.
+
+    Returns (counts, resynced files) or None when the file is missing or
+    byte-identical. When an edit adds or removes ids, tables referencing
+    this one are re-synced in full, since rows skipped for an unknown
+    parent or cascaded away with one may now belong.
+    """
+    model, parse = SYNC_TABLES[file_name]
+    content = state.read()
+    if content is None or content == state.content:
+        return None
+
+    change = state.diff(content)
+    resynced = []
+    with transaction.atomic():
+        if change is None:
+            counts = sync_file(data_dir, file_name, known)
+            user_ids = set(User.objects.values_list('id', flat=True))
+            refresh_users(user_ids, rollups=model is HealthData, vitals=model in VITALS_MODELS)
+        else:
+            rows, deleted = change
+            counts = {'skipped': 0}
+            rows = list(parse_rows(rows, parse, known, counts))
+            ids = {pk for pk, _ in rows} | deleted
+            user_ids, readings = _touched(model, ids)
+
+            counts.update(apply_changes(model, rows, deleted))
+            known.pop(model, None)
+
+            after_ids, after_readings = _touched(model, {pk for pk, _ in rows})
+            user_ids |= after_ids
+            if model is User:
+                user_ids -= deleted
+            if model is HealthData and len(ids) > ROLLUP_PATCH_LIMIT:
+                refresh_users(user_ids, vitals=True)
+            else:
+                record_rollups(readings + after_readings)
+                stale = _stale_vitals(readings + after_readings) if model is HealthData else user_ids
+                refresh_users(stale & user_ids, rollups=False, vitals=model in VITALS_MODELS)
+                refresh_users(user_ids - stale, rollups=False, vitals=False)
+
+        if counts['created'] or counts['deleted']:
+            for dependent in dependents(model):
+                sync_file(data_dir, dependent, known)
+                resynced.append(dependent)
+            if resynced:
+                refresh_users(set(User.objects.values_list('id', flat=True)))
+
+    state.commit(content)
+    return counts, resynced
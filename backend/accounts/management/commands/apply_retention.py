@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from health_monitoring.retention import apply_retention
+
+
+class Command(BaseCommand):
+    help = 'Expire raw health data into rollups, prune old rollups and archive old ECG strips (run daily)'
+
+    def handle(self, *args, **options):
+        stats = apply_retention()
+
+        if stats['partitions_created']:
+            self.stdout.write(f"Created partitions: {', '.join(stats['partitions_created'])}")
+
+        health_data = stats['health_data']
+        if health_data:
+            self.stdout.write(
+                f"HealthData before {health_data['cutoff']}: {health_data['rolled_up_minutes']} minute buckets "
+                f"rolled up, {health_data['deleted']} rows deleted"
+            )
+            if health_data.get('dropped_partitions'):
+                self.stdout.write(f"  dropped partitions: {', '.join(health_data['dropped_partitions'])}")
+
+        for resolution, deleted in stats['rollups'].items():
+            self.stdout.write(f"Rollups ({resolution}): {deleted} expired buckets deleted")
+
+        ecg = stats['ecg']
+        if ecg:
+            self.stdout.write(
+                f"ECG before {ecg['cutoff']}: {ecg['archived']} waveforms archived, "
+                f"{ecg['deleted_chunks']} session chunks deleted"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Retention applied'))
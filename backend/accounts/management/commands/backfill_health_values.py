@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from health_monitoring.models import NUMERIC_VALUE_FIELDS, HealthData
+
+
+class Command(BaseCommand):
+    help = 'Fill the typed primary_value/secondary_value columns of HealthData from the JSON value'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of readings updated per transaction'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute every reading, not only those without a primary value'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        readings = HealthData.objects.filter(data_type__in=list(NUMERIC_VALUE_FIELDS)).order_by('id')
+        if not options['all']:
+            readings = readings.filter(primary_value__isnull=True)
+        readings = readings.only('id', 'data_type', 'value')
+
+        filled = 0
+        last_id = 0
+        while True:
+            batch = list(readings.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+
+            for reading in batch:
+                reading.fill_numeric_values()
+
+            with transaction.atomic():
+                HealthData.objects.bulk_update(batch, ['primary_value', 'secondary_value'])
+
+            filled += sum(1 for reading in batch if reading.primary_value is not None)
+            last_id = batch[-1].id
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Filled typed values for {filled} health readings')
+        )
@@ -0,0 +1,44 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts.models import User
+from health_monitoring.rollups import ROLLUP_FIELDS, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Build or rebuild the minute/hour/day HealthData rollups from the raw readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Only process this user ID (can be repeated)'
+        )
+        parser.add_argument(
+            '--data-type',
+            choices=sorted(ROLLUP_FIELDS),
+            action='append',
+            dest='data_types',
+            help='Only process this data type (can be repeated)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Only rebuild the last N days (default: all history)'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or list(User.objects.values_list('id', flat=True))
+        since = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+
+        total = 0
+        for user_id in user_ids:
+            written = rebuild_rollups(user_id, options['data_types'], since)
+            total += written
+            self.stdout.write(f"User {user_id}: {written} minute buckets")
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt rollups for {len(user_ids)} users ({total} minute buckets)')
+        )
@@ -0,0 +1,113 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from accounts.models import User
+from cardiocare.renderers import ORJSONRenderer
+from cardiocare.rows import fetch
+from health_monitoring.models import HealthAlert
+from health_monitoring.views import ALERT_FIELDS
+
+
+def instance_rows(queryset):
+    """How the list views built responses before cardiocare/rows.py"""
+    return [{
+        'id': alert.id,
+        'type': alert.alert_type,
+        'title': alert.title,
+        'message': alert.message,
+        'status': alert.status,
+        'severity': alert.severity,
+        'occurrences': alert.occurrences,
+        'created_at': alert.created_at.isoformat(),
+        'resolved_at': alert.resolved_at.isoformat() if alert.resolved_at else None
+    } for alert in queryset]
+
+
+class Command(BaseCommand):
+    help = 'Per-row cost of building and rendering a list response: model instances + JSONRenderer vs projected rows + ORJSONRenderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1000,
+            help='Alerts per response'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Timed runs per variant (best run is reported)'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print machine-readable JSON'
+        )
+
+    def handle(self, *args, **options):
+        # The sample rows are written and measured inside a transaction that is rolled back
+        with transaction.atomic():
+            results = self.run(options['rows'], options['repeat'])
+            transaction.set_rollback(True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{results['rows']} rows, best of {results['repeat']} runs, microseconds per row:")
+        for name in ('before', 'after'):
+            variant = results[name]
+            self.stdout.write(
+                f"  {name:6}  build {variant['build_us']:7.2f}  render {variant['render_us']:7.2f}  "
+                f"total {variant['total_us']:7.2f}  ({variant['description']})"
+            )
+        self.stdout.write(f"  speedup {results['speedup']}x, identical output: {results['identical']}")
+
+    def run(self, rows, repeat):
+        user = User.objects.create(username='serialization-benchmark', email='serialization-benchmark@example.com')
+        HealthAlert.objects.bulk_create([
+            HealthAlert(
+                user=user,
+                alert_type=('emergency', 'warning', 'info')[number % 3],
+                title=f'Alert {number}',
+                message='Elevated heart rate detected during rest period',
+                status=('active', 'resolved')[number % 2],
+                severity=('low', 'medium', 'high')[number % 3],
+            )
+            for number in range(rows)
+        ])
+        queryset = HealthAlert.objects.filter(user=user).order_by('-created_at', '-id')
+
+        variants = {
+            # .all() so every run queries the database instead of reusing a result cache
+            'before': ('model instances + JSONRenderer', lambda: instance_rows(queryset.all()), JSONRenderer()),
+            'after': ('values_list() rows + ORJSONRenderer', lambda: fetch(queryset.all(), ALERT_FIELDS), ORJSONRenderer()),
+        }
+        results = {'rows': rows, 'repeat': repeat}
+        outputs = {}
+        for name, (description, build, renderer) in variants.items():
+            build_times = []
+            render_times = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                data = build()
+                built = time.perf_counter()
+                outputs[name] = renderer.render(data)
+                build_times.append(built - started)
+                render_times.append(time.perf_counter() - built)
+
+            build_us = min(build_times) / rows * 1e6
+            render_us = min(render_times) / rows * 1e6
+            results[name] = {
+                'description': description,
+                'build_us': round(build_us, 2),
+                'render_us': round(render_us, 2),
+                'total_us': round(build_us + render_us, 2),
+            }
+
+        results['speedup'] = round(results['before']['total_us'] / results['after']['total_us'], 1)
+        results['identical'] = outputs['before'] == outputs['after']
+        return results
@@ -5,6 +5,7 @@ from datetime import datetime
 from django.core.management.base import BaseCommand
 from accounts.models import User, EmergencyContact
 from health_monitoring.models import HealthData, ECGReading, AIAnalysis, HealthAlert, HealthHistoryMessage
+from health_monitoring.waveform import encode_csv_waveform
 from emergency_system.models import EmergencyResponse
 
 class Command(BaseCommand):
@@ -97,16 +98,18 @@ class Command(BaseCommand):
         with open(file_path, 'w', newline='') as file:
             writer = csv.writer(file)
             writer.writerow([
-                'id', 'user_id', 'data_type', 'value', 'unit', 
-                'source', 'recorded_at', 'created_at'
+                'id', 'user_id', 'data_type', 'value', 'primary_value', 'secondary_value',
+                'unit', 'source', 'recorded_at', 'created_at'
             ])
             
             for data in HealthData.objects.all():
                 writer.writerow([
                     data.id,
-                    data.user.id,
+                    data.user_id,
                     data.data_type,
                     json.dumps(data.value),
+                    '' if data.primary_value is None else data.primary_value,
+                    '' if data.secondary_value is None else data.secondary_value,
                     data.unit,
                     data.source,
                     data.recorded_at.isoformat(),
@@ -120,15 +123,21 @@ class Command(BaseCommand):
         with open(file_path, 'w', newline='') as file:
             writer = csv.writer(file)
             writer.writerow([
-                'id', 'user_id', 'waveform_data', 'heart_rate', 'duration',
+                'id', 'user_id', 'waveform_data', 'sample_format', 'sample_rate',
+                'gain', 'lead', 'heart_rate', 'duration',
                 'quality_score', 'anomalies_detected', 'recorded_at', 'created_at'
             ])
             
             for reading in ECGReading.objects.all():
+                waveform, sample_format = encode_csv_waveform(reading)
                 writer.writerow([
                     reading.id,
                     reading.user.id,
-                    json.dumps(reading.waveform_data),
+                    waveform,
+                    sample_format,
+                    reading.sample_rate,
+                    reading.gain,
+                    reading.lead,
                     reading.heart_rate,
                     reading.duration,
                     reading.quality_score,
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+from datetime import timedelta
+import httpx
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+DEFAULT_PATHS = [
+    '/api/health/current-metrics/',
+    '/api/health/analysis/',
+    '/api/health/alerts/',
+    '/api/health/history/messages/',
+    '/api/emergency/contacts/',
+]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Load-test the read API at high concurrency (compare the WSGI and ASGI deployments)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://localhost:8000',
+            help='Server base URL'
+        )
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help='Endpoint to request (repeatable; defaults to the health and emergency read endpoints)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=200,
+            help='Requests kept in flight'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=5000,
+            help='Total requests to send'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='Per-request timeout in seconds'
+        )
+        parser.add_argument(
+            '--header',
+            action='append',
+            default=[],
+            help='Extra "Name: value" request header (repeatable), e.g. "X-Forwarded-Proto: https" behind the TLS proxy'
+        )
+        auth = parser.add_mutually_exclusive_group()
+        auth.add_argument(
+            '--token',
+            help='Bearer token to send'
+        )
+        auth.add_argument(
+            '--user',
+            help='Email of a user to mint a short-lived access token for (needs the server database)'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print machine-readable JSON'
+        )
+
+    def mint_token(self, email):
+        from oauth2_provider.models import AccessToken
+
+        try:
+            user = get_user_model().objects.get(email=email)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user with email {email}")
+        return AccessToken.objects.create(
+            user=user,
+            token=secrets.token_urlsafe(30),
+            expires=timezone.now() + timedelta(hours=1),
+            scope='read write'
+        ).token
+
+    def handle(self, *args, **options):
+        token = options['token'] or (self.mint_token(options['user']) if options['user'] else None)
+        headers = dict(header.split(':', 1) for header in options['header'])
+        headers = {name.strip(): value.strip() for name, value in headers.items()}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        # httpx logs every request at INFO
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        paths = options['paths'] or DEFAULT_PATHS
+
+        results = asyncio.run(self.run(
+            options['url'].rstrip('/'),
+            paths,
+            headers,
+            options['concurrency'],
+            options['requests'],
+            options['timeout']
+        ))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{results['requests']} requests at concurrency {results['concurrency']} "
+            f"in {results['elapsed_s']} s: {results['throughput']} req/s"
+        ))
+        self.stdout.write(
+            f"  latency ms: p50 {results['p50_ms']}, p95 {results['p95_ms']}, "
+            f"p99 {results['p99_ms']}, max {results['max_ms']}"
+        )
+        self.stdout.write(f"  status codes: {results['status_codes']}")
+        if results['errors']:
+            self.stdout.write(self.style.WARNING(f"  transport errors: {results['errors']}"))
+
+    async def run(self, base_url, paths, headers, concurrency, total, timeout):
+        latencies = []
+        status_codes = {}
+        errors = {}
+        counter = iter(range(total))
+
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=timeout, limits=limits) as client:
+
+            async def user_loop():
+                for number in counter:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.get(paths[number % len(paths)])
+                    except httpx.HTTPError as e:
+                        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                        continue
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user_loop() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': total,
+            'concurrency': concurrency,
+            'elapsed_s': round(elapsed, 2),
+            'throughput': round(len(latencies) / elapsed, 1) if elapsed else None,
+            'p50_ms': round(percentile(latencies, 0.50), 1) if latencies else None,
+            'p95_ms': round(percentile(latencies, 0.95), 1) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99), 1) if latencies else None,
+            'max_ms': round(latencies[-1], 1) if latencies else None,
+            'status_codes': {str(code): count for code, count in sorted(status_codes.items())},
+            'errors': errors,
+        }
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from health_monitoring.models import ECGReading
+
+
+class Command(BaseCommand):
+    help = 'Convert legacy JSON ECG waveforms to the packed binary format'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of readings converted per transaction'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        legacy = ECGReading.objects.filter(waveform_blob__isnull=True, archive_path='').order_by('id')
+
+        converted = 0
+        last_id = 0
+        while True:
+            batch = list(legacy.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+
+            for reading in batch:
+                reading.set_waveform(reading.waveform_data or [], sample_rate=reading.sample_rate)
+
+            # duration is left as recorded on the original row
+            with transaction.atomic():
+                ECGReading.objects.bulk_update(batch, [
+                    'waveform_data', 'waveform_blob', 'sample_format', 'sample_rate',
+                    'sample_count', 'gain', 'lead',
+                ])
+
+            converted += len(batch)
+            last_id = batch[-1].id
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Packed {converted} ECG waveforms')
+        )
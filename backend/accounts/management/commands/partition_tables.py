@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from health_monitoring import partitions
+
+
+class Command(BaseCommand):
+    help = 'Convert HealthData and ECGReading to monthly partitions and create upcoming ones (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Rebuild plain tables as partitioned tables (locks each table while its rows are copied)'
+        )
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=settings.PARTITION_MONTHS_AHEAD,
+            help='Months of partitions to create ahead of time'
+        )
+
+    def handle(self, *args, **options):
+        if not partitions.supported():
+            raise CommandError(
+                f'Partitioning needs PostgreSQL; on {connection.vendor} apply_retention keeps the tables bounded'
+            )
+
+        now = timezone.now()
+        for model in partitions.PARTITIONED_MODELS:
+            table = model._meta.db_table
+            if not partitions.is_partitioned(model):
+                if not options['convert']:
+                    self.stdout.write(self.style.WARNING(f'{table} is not partitioned; run with --convert'))
+                    continue
+                partitions.convert_to_partitioned(model, now, options['months_ahead'])
+                self.stdout.write(f'Converted {table}')
+
+            created = partitions.ensure_partitions(model, now, options['months_ahead'])
+            existing = partitions.partitions(model)
+            self.stdout.write(
+                f"{table}: {len(existing)} monthly partitions ({existing[0][0]} to {existing[-1][0]})"
+                + (f", created {', '.join(created)}" if created else '')
+            )
+
+        self.stdout.write(self.style.SUCCESS('Partitions up to date'))
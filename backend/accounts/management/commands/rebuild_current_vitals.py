@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from accounts.models import User
+from health_monitoring.vitals import diff_current_vitals, rebuild_current_vitals
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify the per-user current vitals snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Only process this user ID (can be repeated)'
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Report snapshots that disagree with the time-series tables without writing'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or list(User.objects.values_list('id', flat=True))
+
+        if not options['check']:
+            for user_id in user_ids:
+                rebuild_current_vitals(user_id)
+            self.stdout.write(
+                self.style.SUCCESS(f'Rebuilt current vitals for {len(user_ids)} users')
+            )
+            return
+
+        inconsistent = 0
+        for user_id in user_ids:
+            differences = diff_current_vitals(user_id)
+            if differences:
+                inconsistent += 1
+                for field, (stored, expected) in differences.items():
+                    self.stdout.write(f"User {user_id}: {field} is {stored!r}, expected {expected!r}")
+
+        if inconsistent:
+            self.stdout.write(
+                self.style.ERROR(f'{inconsistent} of {len(user_ids)} snapshots are inconsistent')
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'All {len(user_ids)} snapshots are consistent')
+            )
@@ -0,0 +1,47 @@
+import asyncio
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from health_monitoring.async_worker import RedisJobSource, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run the asyncio AI analysis worker (used when ANALYSIS_EXECUTOR=async)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.ANALYSIS_WORKER_CONCURRENCY,
+            help='Maximum analyses in flight in this process'
+        )
+        parser.add_argument(
+            '--per-user-limit',
+            type=int,
+            default=settings.ANALYSIS_PER_USER_LIMIT,
+            help='Maximum analyses in flight for any single user'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.ANALYSIS_BATCH_SIZE,
+            help='Routine readings assessed per model request (1 disables batching)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Analysis worker started (concurrency {options['concurrency']}, "
+                f"per user {options['per_user_limit']}); press Ctrl+C to stop"
+            )
+        )
+        asyncio.run(self.serve(options['concurrency'], options['per_user_limit'], options['batch_size']))
+        self.stdout.write(self.style.SUCCESS('Analysis worker stopped'))
+
+    async def serve(self, concurrency, per_user_limit, batch_size):
+        source = RedisJobSource()
+        loop = asyncio.get_running_loop()
+        # Stop taking new jobs and let the in-flight ones finish
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, source.stop)
+        await run_worker(source, concurrency, per_user_limit, batch_size)
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from cardiocare.celery import app
+
+
+class Command(BaseCommand):
+    help = 'Start a Celery worker for one queue profile (see CELERY_WORKER_PROFILES)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'profile',
+            choices=sorted(settings.CELERY_WORKER_PROFILES),
+            help='Queue profile to serve'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Override the profile concurrency'
+        )
+        parser.add_argument(
+            '--loglevel',
+            default='info',
+            help='Celery log level'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Print the worker command line without starting it'
+        )
+
+    def worker_argv(self, profile, concurrency=None, loglevel='info'):
+        config = settings.CELERY_WORKER_PROFILES[profile]
+        return [
+            'worker',
+            f'--hostname={profile}@%h',
+            f"--queues={','.join(config['queues'])}",
+            f"--concurrency={concurrency or config['concurrency']}",
+            f"--prefetch-multiplier={config['prefetch_multiplier']}",
+            # Hand tasks only to idle child processes so one slow task cannot hold others back
+            '-O', 'fair',
+            f'--loglevel={loglevel}',
+        ]
+
+    def handle(self, *args, **options):
+        argv = self.worker_argv(options['profile'], options['concurrency'], options['loglevel'])
+
+        if options['dry_run']:
+            self.stdout.write('celery -A cardiocare ' + ' '.join(argv))
+            return
+
+        try:
+            app.worker_main(argv)
+        except KeyboardInterrupt:
+            self.stdout.write('\nWorker stopped')
+        except Exception as e:
+            raise CommandError(f"Worker failed: {str(e)}")
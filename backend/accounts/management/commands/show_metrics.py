@@ -0,0 +1,46 @@
+import json
+from django.core.management.base import BaseCommand
+from cardiocare.celery import app
+from cardiocare.http_client import upstream_stats
+from cardiocare.queues import queue_stats
+from emergency_system.notifications import notification_stats
+from health_monitoring.alerts import alert_stats
+from health_monitoring.analysis_cache import cache_stats
+from health_monitoring.batching import batch_stats
+from health_monitoring.events import event_stats
+from health_monitoring.triage import triage_stats
+
+
+class Command(BaseCommand):
+    help = 'Print pipeline metrics such as the triage escalation rate, AI result cache hits, upstream HTTP health and Celery queue waits'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print machine-readable JSON'
+        )
+
+    def collect(self):
+        return {
+            'triage': triage_stats(),
+            'ai_cache': cache_stats(),
+            'analysis_batches': batch_stats(),
+            'upstreams': upstream_stats(),
+            'queues': queue_stats(app),
+            'alerts': alert_stats(),
+            'notifications': notification_stats(),
+            'events': event_stats(),
+        }
+
+    def handle(self, *args, **options):
+        collected = self.collect()
+
+        if options['json']:
+            self.stdout.write(json.dumps(collected, indent=2))
+            return
+
+        for section, values in collected.items():
+            self.stdout.write(self.style.SUCCESS(section))
+            for name, value in values.items():
+                self.stdout.write(f"  {name}: {value}")
@@ -5,41 +5,70 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from django.core.management.base import BaseCommand
 from django.core.management import call_command
+from django.db import close_old_connections
+from accounts.csv_sync import SYNC_TABLES, CSVFileState, KnownIds, apply_file
+
+
+class ChangeQueue:
+    """Collects changed file names and hands them over as one batch.
+
+    A batch is released once no event has arrived for ``quiet`` seconds, or
+    ``max_wait`` seconds after its first event if writes keep coming.
+    Editors that save through a temp file, or a script rewriting several
+    CSVs, therefore cause one sync per burst.
+    """
+
+    def __init__(self, quiet, max_wait):
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self.pending = set()
+        self.first_event = self.last_event = 0
+        self.condition = threading.Condition()
+
+    def add(self, file_name):
+        with self.condition:
+            now = time.monotonic()
+            if not self.pending:
+                self.first_event = now
+            self.pending.add(file_name)
+            self.last_event = now
+            self.condition.notify()
+
+    def take(self, timeout=1.0):
+        """The next batch of file names, or an empty set if none was ready within ``timeout``"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if self.pending:
+                    due = min(self.last_event + self.quiet, self.first_event + self.max_wait)
+                    if now >= due:
+                        batch, self.pending = self.pending, set()
+                        return batch
+                    wait = min(due, deadline) - now
+                else:
+                    wait = deadline - now
+                if wait <= 0:
+                    return set()
+                self.condition.wait(wait)
+
 
 class CSVFileHandler(FileSystemEventHandler):
-    def __init__(self, command_instance):
-        self.command_instance = command_instance
-        self.last_reload = 0
-        self.reload_delay = 2  # Wait 2 seconds before reloading to avoid multiple triggers
+    def __init__(self, queue):
+        self.queue = queue
 
-    def on_modified(self, event):
-        if event.is_directory:
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in ('created', 'modified', 'moved'):
             return
-        
-        if event.src_path.endswith('.csv'):
-            current_time = time.time()
-            if current_time - self.last_reload > self.reload_delay:
-                self.last_reload = current_time
-                self.command_instance.stdout.write(
-                    f"CSV file changed: {event.src_path}"
-                )
-                # Reload data with sync mode
-                threading.Timer(1.0, self.reload_data).start()
-
-    def reload_data(self):
-        try:
-            self.command_instance.stdout.write("Reloading data from CSV files...")
-            call_command('load_mock_data', '--sync-mode')
-            self.command_instance.stdout.write(
-                self.command_instance.style.SUCCESS("Data reloaded successfully!")
-            )
-        except Exception as e:
-            self.command_instance.stdout.write(
-                self.command_instance.style.ERROR(f"Error reloading data: {str(e)}")
-            )
+        # Editors often save by writing a temp file and renaming it over the CSV
+        path = getattr(event, 'dest_path', '') or event.src_path
+        file_name = os.path.basename(path)
+        if file_name in SYNC_TABLES:
+            self.queue.add(file_name)
+
 
 class Command(BaseCommand):
-    help = 'Watch CSV files for changes and automatically reload data'
+    help = 'Watch CSV files for changes and apply only the changed rows'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -48,10 +77,22 @@ class Command(BaseCommand):
             default='mock-data',
             help='Directory containing CSV files to watch'
         )
+        parser.add_argument(
+            '--quiet-period',
+            type=float,
+            default=0.5,
+            help='Seconds without events before a burst of changes is applied'
+        )
+        parser.add_argument(
+            '--max-wait',
+            type=float,
+            default=5.0,
+            help='Apply changes at least this often while events keep arriving'
+        )
 
     def handle(self, *args, **options):
         data_dir = options['data_dir']
-        
+
         if not os.path.exists(data_dir):
             self.stdout.write(
                 self.style.ERROR(f"Directory not found: {data_dir}")
@@ -61,21 +102,55 @@ class Command(BaseCommand):
         self.stdout.write(f"Watching CSV files in: {data_dir}")
         self.stdout.write("Press Ctrl+C to stop watching...")
 
-        # Initial load
-        call_command('load_mock_data', '--sync-mode', '--data-dir', data_dir)
-
-        # Set up file watcher
-        event_handler = CSVFileHandler(self)
+        # Watch before the initial sync so no edit made during it is missed
+        queue = ChangeQueue(options['quiet_period'], options['max_wait'])
         observer = Observer()
-        observer.schedule(event_handler, data_dir, recursive=False)
+        observer.schedule(CSVFileHandler(queue), data_dir, recursive=False)
         observer.start()
 
+        # Snapshot first: an edit between snapshot and sync is applied again, which is harmless
+        states = {}
+        for file_name in SYNC_TABLES:
+            state = states[file_name] = CSVFileState(os.path.join(data_dir, file_name))
+            content = state.read()
+            if content is not None:
+                state.commit(content)
+        call_command('load_mock_data', '--sync-mode', '--data-dir', data_dir)
+
         try:
             while True:
-                time.sleep(1)
+                changed = queue.take()
+                if changed:
+                    self.apply_changes(data_dir, states, changed)
         except KeyboardInterrupt:
             observer.stop()
             self.stdout.write("\nStopping CSV file watcher...")
-        
+
         observer.join()
         self.stdout.write("CSV file watcher stopped.")
+
+    def apply_changes(self, data_dir, states, changed):
+        """Apply a batch of changed files, parents first"""
+        close_old_connections()
+        known = KnownIds()
+        for file_name in SYNC_TABLES:
+            if file_name not in changed:
+                continue
+            started = time.perf_counter()
+            try:
+                result = apply_file(data_dir, file_name, states[file_name], known)
+            except Exception as e:
+                # The file's state is left as it was, so the next save retries the same diff
+                self.stdout.write(self.style.ERROR(f"Error syncing {file_name}: {str(e)}"))
+                continue
+            if result is None:
+                continue
+
+            counts, resynced = result
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stdout.write(
+                f"{file_name}: {counts['created']} inserted, {counts['updated']} updated, "
+                f"{counts['deleted']} deleted in {elapsed:.0f} ms"
+                + (f", {counts['skipped']} skipped (user not found)" if counts['skipped'] else "")
+                + (f"; re-synced {', '.join(resynced)}" if resynced else "")
+            )
@@ -0,0 +1,18 @@
+"""Cached-response invalidation for user writes, including last_login updates on login"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from cardiocare.cache import PROFILE, invalidate, invalidate_user
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate(PROFILE, instance.id))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_user(instance.id))
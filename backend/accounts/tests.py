@@ -0,0 +1,97 @@
+import os
+import tempfile
+from django.test import SimpleTestCase, TestCase
+from health_monitoring.models import HealthHistoryMessage
+from .csv_sync import CSVFileState, KnownIds, apply_file, sync_file
+from .models import User
+
+HEADER = b'id,user_id,message_type,content,attachments,timestamp,created_at\r\n'
+
+
+def message(pk, content, message_type='user'):
+    quoted = content.replace('"', '""')
+    return f'{pk},1,{message_type},"{quoted}","[]",2024-01-24T10:0{pk}:00Z,2024-01-24T10:0{pk}:00Z\r\n'.encode()
+
+
+def messages_csv(*records):
+    return HEADER + b''.join(message(pk, content) for pk, content in records)
+
+
+class CSVFileStateDiffTests(SimpleTestCase):
+    def diff(self, old, new):
+        state = CSVFileState('unused.csv')
+        state.commit(old)
+        return state.diff(new)
+
+    def contents(self, change):
+        changed, deleted = change
+        return {int(row['id']): row['content'] for row in changed}, deleted
+
+    def test_edit_inside_a_quoted_multi_line_record(self):
+        old = messages_csv((1, 'first'), (2, 'line one\n"quoted" line two\nline three'), (3, 'third'))
+        new = messages_csv((1, 'first'), (2, 'line one\n"quoted" line 2\nline three'), (3, 'third'))
+
+        self.assertEqual(self.contents(self.diff(old, new)), ({2: 'line one\n"quoted" line 2\nline three'}, set()))
+
+    def test_record_that_becomes_multi_line(self):
+        old = messages_csv((1, 'first'), (2, 'second'), (3, 'third'))
+        new = messages_csv((1, 'first'), (2, 'second,\nnow two lines'), (3, 'third'))
+
+        self.assertEqual(self.contents(self.diff(old, new)), ({2: 'second,\nnow two lines'}, set()))
+
+    def test_inserts_and_deletes(self):
+        old = messages_csv((1, 'first'), (2, 'second'), (3, 'third'))
+        new = messages_csv((1, 'first'), (3, 'third'), (4, 'fourth'), (5, 'fifth'))
+
+        self.assertEqual(self.contents(self.diff(old, new)), ({4: 'fourth', 5: 'fifth'}, {2}))
+
+    def test_deleting_the_last_record(self):
+        old = messages_csv((1, 'first'), (2, 'second'))
+
+        self.assertEqual(self.contents(self.diff(old, messages_csv((1, 'first')))), ({}, {2}))
+
+    def test_line_ending_change_alone_changes_no_rows(self):
+        old = messages_csv((1, 'first'), (2, 'second'))
+
+        self.assertEqual(self.diff(old, old.replace(b'\r\n', b'\n')), ([], set()))
+
+    def test_new_header_or_no_synced_version_needs_a_full_sync(self):
+        old = messages_csv((1, 'first'))
+
+        self.assertIsNone(self.diff(old, old.replace(b'content,attachments', b'attachments,content')))
+        self.assertIsNone(CSVFileState('unused.csv').diff(old))
+
+
+class ApplyFileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(id=1, username='csv', email='csv@example.com')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_dir = directory.name
+        self.path = os.path.join(self.data_dir, 'health_history_messages.csv')
+        self.write(messages_csv((1, 'first'), (2, 'two\nlines'), (3, 'third')))
+        sync_file(self.data_dir, 'health_history_messages.csv', KnownIds())
+        self.state = CSVFileState(self.path)
+        self.state.commit(self.state.read())
+
+    def write(self, content):
+        with open(self.path, 'wb') as file:
+            file.write(content)
+
+    def apply(self):
+        return apply_file(self.data_dir, 'health_history_messages.csv', self.state, KnownIds())
+
+    def test_only_changed_rows_are_written(self):
+        self.write(messages_csv((1, 'first'), (2, 'two\nedited lines'), (4, 'fourth')))
+
+        counts, resynced = self.apply()
+
+        self.assertEqual(counts, {'skipped': 0, 'created': 1, 'updated': 1, 'deleted': 1})
+        self.assertEqual(resynced, [])
+        self.assertEqual(
+            dict(HealthHistoryMessage.objects.values_list('id', 'content')),
+            {1: 'first', 2: 'two\nedited lines', 4: 'fourth'}
+        )
+
+    def test_unchanged_file_is_skipped(self):
+        self.assertIsNone(self.apply())
@@ -5,9 +5,10 @@ from rest_framework.response import Response
 from django.contrib.auth import authenticate, login
 from django.conf import settings
 from django.utils import timezone
-import requests
 import json
 import logging
+from cardiocare.cache import PROFILE, cached_response
+from cardiocare.http_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -104,11 +105,12 @@ def google_fit_callback(request):
         )
         flow.redirect_uri = f"{settings.CORS_ALLOWED_ORIGINS[0]}/auth/google/callback"
         
-        flow.fetch_token(code=code)
+        google = get_client('google')
+        flow.fetch_token(code=code, timeout=google.timeout)
         credentials = flow.credentials
         
         # Get user info
-        user_info_response = requests.get(
+        user_info_response = google.get(
             'https://www.googleapis.com/oauth2/v2/userinfo',
             headers={'Authorization': f'Bearer {credentials.token}'}
         )
@@ -168,6 +170,7 @@ def apple_health_auth(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response(PROFILE)
 def user_profile(request):
     """Get current user profile"""
     user = request.user
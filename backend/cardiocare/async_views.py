@@ -0,0 +1,80 @@
+"""Async read endpoints.
+
+DRF 3.14's @api_view only dispatches synchronous functions, so the GET
+endpoints that are pure database reads are written as coroutines and wrapped
+with async_api_view instead. It authenticates with the same DRF
+authentication classes, answers with the same status codes and renders the
+returned DRF Response with the project's JSON renderer, so clients cannot
+tell the two apart. Under ASGI these views await the async ORM on the event
+loop instead of holding a worker thread per request.
+"""
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def authenticate(request):
+    """The DRF user for a plain Django request (OAuth2 token or session).
+
+    Synchronous; call through sync_to_async from async code.
+    """
+    drf_request = Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    return drf_request.user, drf_request
+
+
+def _render(data, status_code, headers=None):
+    response = HttpResponse(
+        api_settings.DEFAULT_RENDERER_CLASSES[0]().render(data) if data is not None else b'',
+        status=status_code,
+        content_type='application/json'
+    )
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def async_api_view(allow_anonymous=False):
+    """Serve a coroutine view returning a DRF Response.
+
+    The view receives the Django request with ``request.user`` set to the
+    authenticated DRF user.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                user, drf_request = await sync_to_async(authenticate)(request)
+            except exceptions.APIException as e:
+                return _render({'detail': e.detail}, e.status_code)
+
+            if not allow_anonymous and not user.is_authenticated:
+                # Same choice as DRF: 401 with a challenge if the first authenticator offers one
+                detail = {'detail': 'Authentication credentials were not provided.'}
+                challenge = drf_request.authenticators[0].authenticate_header(drf_request) if drf_request.authenticators else None
+                if challenge:
+                    return _render(detail, status.HTTP_401_UNAUTHORIZED, {'WWW-Authenticate': challenge})
+                return _render(detail, status.HTTP_403_FORBIDDEN)
+
+            if request.method not in SAFE_METHODS:
+                return _render(
+                    {'detail': f'Method "{request.method}" not allowed.'},
+                    status.HTTP_405_METHOD_NOT_ALLOWED,
+                    {'Allow': ', '.join(SAFE_METHODS)}
+                )
+
+            request.user = user
+            response = await view(request, *args, **kwargs)
+            headers = {name: value for name, value in response.items() if name != 'Content-Type'}
+            return _render(response.data, response.status_code, headers)
+
+        return wrapper
+    return decorator
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import json
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+# Per-user cached endpoints, used as key prefixes
+ANALYSIS = 'analysis'
+ALERTS = 'alerts'
+CONTACTS = 'contacts'
+PROFILE = 'profile'
+
+CACHED_ENDPOINTS = (ANALYSIS, ALERTS, CONTACTS, PROFILE)
+
+# View response headers replayed from the cache
+CACHED_HEADERS = ('Link',)
+
+
+def cache_key(endpoint, user_id):
+    return f'api:{endpoint}:{user_id}'
+
+
+def compute_etag(data):
+    payload = json.dumps(data, sort_keys=True, default=str).encode()
+    return f'"{hashlib.md5(payload).hexdigest()}"'
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+def invalidate(endpoint, user_id):
+    """Drop one user's cached response for an endpoint"""
+    cache.delete(cache_key(endpoint, user_id))
+
+
+def invalidate_user(user_id):
+    """Drop every cached response for a user"""
+    cache.delete_many([cache_key(endpoint, user_id) for endpoint in CACHED_ENDPOINTS])
+
+
+def cached_response(endpoint):
+    """Cache a GET view's successful response per user, with ETag support.
+
+    Apply below @api_view (or @async_api_view for coroutine views) so the
+    wrapped function receives the authenticated user.
+    Anonymous and parameterized requests (filters, later pages) bypass the
+    cache. Writers must call invalidate() for the same endpoint when the
+    underlying rows change, unless a post_save/post_delete receiver does it
+    (accounts/receivers.py, health_monitoring/receivers.py).
+    """
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            return _async_cached(endpoint, view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated or request.GET:
+                return view(request, *args, **kwargs)
+
+            key = cache_key(endpoint, request.user.id)
+            entry = cache.get(key)
+
+            if entry is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                entry = _cache_entry(response)
+                cache.set(key, entry, settings.API_CACHE_TIMEOUT)
+
+            return _cached_reply(request, entry)
+
+        return wrapper
+    return decorator
+
+
+def _cache_entry(response):
+    return {
+        'data': response.data,
+        'etag': compute_etag(response.data),
+        'headers': {name: value for name, value in response.items() if name in CACHED_HEADERS},
+    }
+
+
+def _cached_reply(request, entry):
+    if etag_matches(request, entry['etag']):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(entry['data'])
+        for name, value in entry.get('headers', {}).items():
+            response[name] = value
+
+    response['ETag'] = entry['etag']
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _async_cached(endpoint, view):
+    """cached_response for coroutine views (apply below @async_api_view)"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated or request.GET:
+            return await view(request, *args, **kwargs)
+
+        key = cache_key(endpoint, request.user.id)
+        entry = await cache.aget(key)
+
+        if entry is None:
+            response = await view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = _cache_entry(response)
+            await cache.aset(key, entry, settings.API_CACHE_TIMEOUT)
+
+        return _cached_reply(request, entry)
+
+    return wrapper
@@ -13,6 +13,9 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+# Queue wait-time instrumentation (signal handlers)
+import cardiocare.queues  # noqa: E402,F401
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
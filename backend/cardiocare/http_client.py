@@ -0,0 +1,317 @@
+"""Shared outbound HTTP client for third-party APIs.
+
+One pooled keep-alive session per upstream, connect/read timeouts, bounded
+retries with jittered exponential backoff and a per-upstream circuit
+breaker. A POST whose response never arrived is not resent unless the
+upstream sets retry_non_idempotent, since it may already have taken effect.
+Upstreams are configured in settings.HTTP_UPSTREAMS.
+AsyncUpstreamClient applies the same policy to httpx for asyncio code.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from django.conf import settings
+from cardiocare import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# A request with any other method may have taken effect before a read timeout
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+DEFAULTS = {
+    'connect_timeout': 3.05,
+    'read_timeout': 10,
+    'retries': 2,
+    'backoff': 0.5,  # seconds, doubled per attempt
+    'max_backoff': 8,
+    'failure_threshold': 5,  # consecutive failures before the circuit opens
+    'reset_timeout': 30,  # seconds before a trial request is let through
+    'pool_size': 20,
+    'retry_non_idempotent': False,  # resend a POST whose response never arrived (it may run twice)
+}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without touching the network while an upstream's circuit is open"""
+
+
+def _failed_to_connect(error):
+    """Whether a requests error was raised before any of the request was sent"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # requests wraps urllib3's MaxRetryError, whose reason is the original error
+    cause = error.args[0] if error.args else None
+    return isinstance(cause, NewConnectionError) or isinstance(getattr(cause, 'reason', None), NewConnectionError)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one upstream, local to the process.
+
+    Once ``reset_timeout`` has passed, a single trial request is let
+    through; the rest are refused until it records its outcome. A trial
+    that never reports back is replaced after another ``reset_timeout``.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            if self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout:
+                return False
+            self.trial_started_at = now
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started_at = None
+
+    def record_failure(self):
+        """Count a failure. Returns True if it opened a closed circuit."""
+        with self.lock:
+            self.failures += 1
+            self.trial_started_at = None
+            was_closed = self.opened_at is None
+            if self.failures >= self.failure_threshold or not was_closed:
+                # A failed half-open trial re-opens the circuit for another period
+                self.opened_at = time.monotonic()
+                return was_closed
+            return False
+
+
+class BaseUpstreamClient:
+    def __init__(self, name, config, breaker=None):
+        self.name = name
+        self.config = {**DEFAULTS, **config}
+        self.breaker = breaker or CircuitBreaker(self.config['failure_threshold'], self.config['reset_timeout'])
+
+    @property
+    def timeout(self):
+        return (self.config['connect_timeout'], self.config['read_timeout'])
+
+    def _backoff(self, attempt):
+        delay = min(self.config['backoff'] * (2 ** attempt), self.config['max_backoff'])
+        # Full jitter spreads retries from many workers apart
+        return random.uniform(0, delay)
+
+    def _short_circuit(self):
+        if not self.breaker.allow():
+            metrics.increment(f'http.{self.name}.short_circuited')
+            raise CircuitOpenError(f'{self.name} circuit is open')
+
+    def _record_failure(self):
+        if self.breaker.record_failure():
+            metrics.increment(f'http.{self.name}.circuit_opened')
+            logger.error(f"{self.name} circuit opened after repeated failures")
+
+    def _accept(self, response):
+        """Record a final (non-retryable) response with the breaker"""
+        if response.status_code >= 500:
+            self._record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _may_resend(self, method, delivered):
+        """Whether a failed attempt can be repeated; ``delivered`` when the upstream may have acted on it"""
+        return not delivered or method.upper() in IDEMPOTENT_METHODS or self.config['retry_non_idempotent']
+
+    def _give_up(self, error):
+        self._record_failure()
+        raise error
+
+
+class UpstreamClient(BaseUpstreamClient):
+    def __init__(self, name, config):
+        super().__init__(name, config)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.config['pool_size'],
+            max_retries=0,
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """Send a request, retrying connection errors and retryable statuses.
+
+        Raises CircuitOpenError immediately while the circuit is open, and
+        requests exceptions (including HTTPError via raise_for_status) once
+        retries are exhausted.
+        """
+        self._short_circuit()
+
+        kwargs.setdefault('timeout', self.timeout)
+        attempts = self.config['retries'] + 1
+
+        for attempt in range(attempts):
+            metrics.increment(f'http.{self.name}.requests')
+            started = time.monotonic()
+            delivered = False
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                response = None
+                # Only a failure to connect proves the upstream never saw the request
+                delivered = not _failed_to_connect(e)
+            finally:
+                metrics.observe(f'http.{self.name}.latency', (time.monotonic() - started) * 1000)
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return self._accept(response)
+
+            metrics.increment(f'http.{self.name}.errors')
+            if response is not None:
+                error = requests.HTTPError(f'{response.status_code} from {self.name}', response=response)
+
+            if attempt + 1 < attempts and self._may_resend(method, delivered):
+                metrics.increment(f'http.{self.name}.retries')
+                logger.warning(f"{self.name} request failed ({error}), retrying")
+                time.sleep(self._backoff(attempt))
+            else:
+                break
+
+        self._give_up(error)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+class AsyncUpstreamClient(BaseUpstreamClient):
+    """httpx counterpart of UpstreamClient for use inside an event loop.
+
+    Shares the circuit breaker of the process's synchronous client for the
+    same upstream. Must be created and closed on the loop that uses it.
+    """
+
+    def __init__(self, name, config, max_connections=100, breaker=None):
+        super().__init__(name, config, breaker)
+        connect_timeout, read_timeout = self.timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def request(self, method, url, **kwargs):
+        """Same contract as UpstreamClient.request, raising httpx errors"""
+        self._short_circuit()
+
+        attempts = self.config['retries'] + 1
+
+        for attempt in range(attempts):
+            metrics.increment(f'http.{self.name}.requests')
+            started = time.monotonic()
+            delivered = False
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                error = e
+                response = None
+                delivered = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+            finally:
+                metrics.observe(f'http.{self.name}.latency', (time.monotonic() - started) * 1000)
+
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return self._accept(response)
+
+            metrics.increment(f'http.{self.name}.errors')
+            if response is not None:
+                error = httpx.HTTPStatusError(
+                    f'{response.status_code} from {self.name}', request=response.request, response=response
+                )
+
+            if attempt + 1 < attempts and self._may_resend(method, delivered):
+                metrics.increment(f'http.{self.name}.retries')
+                logger.warning(f"{self.name} request failed ({error}), retrying")
+                await asyncio.sleep(self._backoff(attempt))
+            else:
+                break
+
+        self._give_up(error)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    """Process-wide client for a configured upstream, created on first use"""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = UpstreamClient(name, settings.HTTP_UPSTREAMS.get(name, {}))
+                _clients[name] = client
+    return client
+
+
+def get_async_client(name, max_connections=100):
+    """New asyncio client for a configured upstream; the caller closes it"""
+    return AsyncUpstreamClient(
+        name,
+        settings.HTTP_UPSTREAMS.get(name, {}),
+        max_connections=max_connections,
+        breaker=get_client(name).breaker,
+    )
+
+
+def upstream_stats():
+    stats = {}
+    for name in settings.HTTP_UPSTREAMS:
+        counters = metrics.get_counters([
+            f'http.{name}.requests',
+            f'http.{name}.errors',
+            f'http.{name}.retries',
+            f'http.{name}.short_circuited',
+            f'http.{name}.circuit_opened',
+        ])
+        stats[name] = {
+            **{key.rsplit('.', 1)[1]: value for key, value in counters.items()},
+            'latency': metrics.get_timing(f'http.{name}.latency'),
+            # Breakers live in each worker process; this is only the calling process's view
+            'circuit_this_process': _clients[name].breaker.state if name in _clients else 'closed',
+        }
+    return stats
@@ -0,0 +1,43 @@
+"""Process-independent counters kept in the Django cache.
+
+With Redis configured every worker and web process shares the same numbers;
+with the in-memory cache they are per process, which is enough for tests.
+"""
+from django.core.cache import cache
+
+PREFIX = 'metrics:'
+
+
+def increment(name, amount=1):
+    key = PREFIX + name
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key, amount)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, amount, None)
+        return amount
+
+
+def observe(name, milliseconds):
+    """Record one timing sample as a count and a running total"""
+    increment(f'{name}.count')
+    increment(f'{name}.total_ms', int(milliseconds))
+
+
+def get_counters(names):
+    values = cache.get_many([PREFIX + name for name in names])
+    return {name: values.get(PREFIX + name, 0) for name in names}
+
+
+def get_timing(name):
+    counters = get_counters([f'{name}.count', f'{name}.total_ms'])
+    count = counters[f'{name}.count']
+    return {
+        'count': count,
+        'avg_ms': round(counters[f'{name}.total_ms'] / count, 1) if count else None,
+    }
+
+
+def reset(names):
+    cache.delete_many([PREFIX + name for name in names])
@@ -0,0 +1,81 @@
+"""Keyset (cursor) pagination for list endpoints.
+
+A page is the ``limit`` rows that follow a cursor in (timestamp, id) order.
+It is found with a range condition on an index rather than OFFSET, so a
+deep page costs the same as the first. The cursor is an opaque URL-safe
+encoding of the last row's (timestamp, id). The next page's URL goes in a
+Link header (RFC 8288), so response bodies stay plain lists.
+"""
+import base64
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from .rows import afetch
+
+CURSOR_PARAM = 'cursor'
+LIMIT_PARAM = 'limit'
+MAX_LIMIT = 200
+
+
+def encode_cursor(timestamp, pk):
+    raw = json.dumps([timestamp.isoformat(), pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from a cursor; ValueError if it was not made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, pk = json.loads(raw)
+        parsed = parse_datetime(timestamp)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if parsed is None or not isinstance(pk, int):
+        raise ValueError('Invalid cursor')
+    return parsed, pk
+
+
+def page_limit(request, default):
+    raw = request.GET.get(LIMIT_PARAM)
+    if raw is None:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    return limit
+
+
+def keyset_queryset(queryset, field, request, descending=True):
+    """``queryset`` ordered by (field, id) and narrowed to the rows after the request's cursor"""
+    cursor = request.GET.get(CURSOR_PARAM)
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        direction = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{direction}': timestamp}) | Q(**{field: timestamp, f'id__{direction}': pk})
+        )
+    prefix = '-' if descending else ''
+    return queryset.order_by(f'{prefix}{field}', f'{prefix}id')
+
+
+async def keyset_page(queryset, fields, field, limit):
+    """Fetch one page of a keyset_queryset as projected rows (see rows.afetch).
+
+    ``field`` and ``id`` must be response keys in ``fields``. Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    rows = await afetch(queryset[:limit + 1], fields)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][field], rows[-1]['id'])
+
+
+def next_link(request, cursor):
+    """Link header value for the page after ``cursor``, keeping the other query parameters"""
+    query = request.GET.copy()
+    query[CURSOR_PARAM] = cursor
+    return f'<{request.build_absolute_uri(request.path)}?{query.urlencode()}>; rel="next"'
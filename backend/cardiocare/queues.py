@@ -0,0 +1,72 @@
+"""Celery queue instrumentation.
+
+Every published task is stamped with its enqueue time; when a worker picks
+it up the wait is recorded per queue, and waits over the queue's SLO (see
+settings.CELERY_QUEUE_WAIT_SLO_MS) are counted. queue_stats() adds the
+current broker depth so show_metrics can show whether emergency tasks keep
+their dispatch SLO while the analysis queue is flooded.
+"""
+import logging
+import time
+from celery.signals import before_task_publish, task_prerun
+from django.conf import settings
+from cardiocare import metrics
+
+logger = logging.getLogger(__name__)
+
+ENQUEUED_AT_HEADER = 'enqueued_at'
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    if headers is not None:
+        headers[ENQUEUED_AT_HEADER] = time.time()
+
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+    request = task.request
+    enqueued_at = getattr(request, ENQUEUED_AT_HEADER, None)
+    if enqueued_at is None or request.is_eager:
+        return
+
+    queue = (request.delivery_info or {}).get('routing_key') or settings.CELERY_TASK_DEFAULT_QUEUE
+    wait_ms = max(time.time() - enqueued_at, 0) * 1000
+    metrics.observe(f'celery.{queue}.wait', wait_ms)
+
+    slo_ms = settings.CELERY_QUEUE_WAIT_SLO_MS.get(queue)
+    if slo_ms is not None and wait_ms > slo_ms:
+        metrics.increment(f'celery.{queue}.slo_breaches')
+        logger.warning(f"{task.name} waited {wait_ms:.0f} ms on {queue} (SLO {slo_ms} ms)")
+
+
+def queue_depths(app):
+    """Messages waiting in each configured queue, None if the broker is unreachable"""
+    depths = {}
+    try:
+        with app.connection_for_read() as connection:
+            for queue in settings.CELERY_TASK_QUEUES:
+                try:
+                    with connection.channel() as channel:
+                        depths[queue.name] = channel.queue_declare(queue=queue.name, passive=True).message_count
+                except connection.channel_errors:
+                    # Not declared yet: nothing has been published to it
+                    depths[queue.name] = 0
+    except Exception as e:
+        logger.error(f"Error reading queue depths: {str(e)}")
+        return {queue.name: None for queue in settings.CELERY_TASK_QUEUES}
+    return depths
+
+
+def queue_stats(app):
+    depths = queue_depths(app)
+    stats = {}
+    for queue in settings.CELERY_TASK_QUEUES:
+        name = queue.name
+        stats[name] = {
+            'depth': depths[name],
+            'wait': metrics.get_timing(f'celery.{name}.wait'),
+            'slo_ms': settings.CELERY_QUEUE_WAIT_SLO_MS.get(name),
+            'slo_breaches': metrics.get_counters([f'celery.{name}.slo_breaches'])[f'celery.{name}.slo_breaches'],
+        }
+    return stats
@@ -0,0 +1,69 @@
+"""JSON rendering with orjson.
+
+ORJSONRenderer writes the same bytes as DRF's JSONRenderer with the
+project's settings: compact separators, UTF-8 output, and U+2028/U+2029
+escaped. It is several times faster on list responses.
+Datetimes are rendered as datetime.isoformat() ("+00:00", not DRF's "Z"),
+matching the strings the views have always built by hand. Views can
+therefore hand rows from the queryset to Response unchanged (see
+cardiocare/rows.py).
+
+orjson formats very small and very large floats differently from the json
+module (0.00001 vs 1e-05). Those responses go through the json module instead. So does
+anything orjson cannot encode, such as integers beyond 64 bits or non-string
+dict keys.
+Indented output (``Accept: application/json; indent=4``) does too.
+NaN and infinity render as null where the json module would refuse them.
+"""
+import datetime
+import re
+import orjson
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+# orjson formats some floats unlike the json module: 9e-05 as 0.00009, 1e-06
+# as 1e-6 and 1e+16 as 1e16. The exponent forms are found by their "e" (with a
+# digit before it); a literal first character keeps the scan fast. Strings
+# that happen to match just take the slow path.
+EXPONENT = re.compile(rb'e[-1-9]')
+DIGITS = frozenset(b'0123456789')
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    """DRF's encoder with datetimes as plain isoformat()"""
+
+    def default(self, obj):
+        if isinstance(obj, datetime.datetime):
+            return obj.isoformat()
+        return super().default(obj)
+
+
+_default = JSONEncoder().default
+
+
+def _has_unlike_floats(ret):
+    if b'.0000' in ret:
+        return True
+    return any(match.start() and ret[match.start() - 1] in DIGITS for match in EXPONENT.finditer(ret))
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    encoder_class = JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.ensure_ascii or not self.compact or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_default)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if _has_unlike_floats(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        # DRF escapes U+2028 and U+2029; both start with the byte 0xe2
+        if b'\xe2' in ret:
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
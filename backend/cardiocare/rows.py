@@ -0,0 +1,20 @@
+"""Projected rows for list endpoints.
+
+A list view declares its response keys once, as an ordered mapping of
+response key to model field. Rows come back from values_list() as tuples and
+are zipped into dicts. No model instances are built and nothing is copied
+field by field. Datetimes stay datetime objects; ORJSONRenderer writes them
+exactly as isoformat() would.
+"""
+
+
+def fetch(queryset, fields):
+    """List of response dicts for ``queryset``; ``fields`` maps response key to model field"""
+    keys = tuple(fields)
+    return [dict(zip(keys, row)) for row in queryset.values_list(*fields.values())]
+
+
+async def afetch(queryset, fields):
+    """fetch() for async views"""
+    keys = tuple(fields)
+    return [dict(zip(keys, row)) async for row in queryset.values_list(*fields.values())]
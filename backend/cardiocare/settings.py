@@ -1,6 +1,9 @@
 import os
+import socket
 import dj_database_url
 from pathlib import Path
+from kombu import Queue
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -60,6 +63,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'cardiocare.wsgi.application'
+ASGI_APPLICATION = 'cardiocare.asgi.application'
 
 # Database
 if os.getenv('DATABASE_URL'):
@@ -116,7 +120,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'cardiocare.renderers.ORJSONRenderer',  # same bytes as DRF's JSONRenderer, see renderers.py
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
@@ -131,6 +135,12 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOW_ALL_ORIGINS = DEBUG  # Only in development
+CORS_EXPOSE_HEADERS = ['Link']  # next-page URL of the paginated list endpoints
+CORS_ALLOW_HEADERS = [
+    *default_headers,
+    'last-event-id',  # event stream reconnects resume from here
+    'idempotency-key',  # emergency alert retries
+]
 
 # OAuth2 settings
 OAUTH2_PROVIDER = {
@@ -155,9 +165,112 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER', '')
 TWILIO_WHATSAPP_NUMBER = os.getenv('TWILIO_WHATSAPP_NUMBER', 'whatsapp:+14155238886')
+TWILIO_TIMEOUT = int(os.getenv('TWILIO_TIMEOUT', '10'))  # seconds per API call
 
 # OpenRouter AI settings
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
+OPENROUTER_URL = os.getenv('OPENROUTER_URL', 'https://openrouter.ai/api/v1/chat/completions')
+
+# Outbound HTTP clients (see cardiocare/http_client.py); timeouts in seconds
+HTTP_UPSTREAMS = {
+    'openrouter': {
+        'connect_timeout': 3.05,
+        'read_timeout': int(os.getenv('OPENROUTER_READ_TIMEOUT', '30')),
+        'retries': 2,
+        'retry_non_idempotent': False,  # a timed-out completion may still be billed
+        'failure_threshold': 5,
+        'reset_timeout': 30,
+    },
+    'google': {
+        'connect_timeout': 3.05,
+        'read_timeout': 10,
+        'retries': 2,
+        'failure_threshold': 5,
+        'reset_timeout': 30,
+    },
+}
+
+# Seconds after its last trigger during which new emergencies fold into an active alert
+ALERT_COALESCE_WINDOW = int(os.getenv('ALERT_COALESCE_WINDOW', '600'))
+
+# Emergency contacts messaged in parallel per alert
+EMERGENCY_NOTIFY_CONCURRENCY = int(os.getenv('EMERGENCY_NOTIFY_CONCURRENCY', '10'))
+
+# Estimated prompt tokens per AI analysis (see health_monitoring/prompts.py)
+AI_PROMPT_TOKEN_BUDGET = int(os.getenv('AI_PROMPT_TOKEN_BUDGET', '1500'))
+
+# AI analysis results (see health_monitoring/analysis_cache.py)
+AI_RESULT_CACHE_TIMEOUT = int(os.getenv('AI_RESULT_CACHE_TIMEOUT', '21600'))
+AI_RESULT_CACHE_MAX_ENTRIES = int(os.getenv('AI_RESULT_CACHE_MAX_ENTRIES', '10000'))
+
+# Cache: Redis when configured, in-process memory otherwise (development and tests)
+CACHE_URL = os.getenv('CACHE_URL', os.getenv('REDIS_URL'))
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        },
+        # Size is bounded by the Redis maxmemory setting (allkeys-lru)
+        'ai_results': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'ai',
+            'TIMEOUT': AI_RESULT_CACHE_TIMEOUT,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'ai_results': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'ai-results',
+            'TIMEOUT': AI_RESULT_CACHE_TIMEOUT,
+            'OPTIONS': {'MAX_ENTRIES': AI_RESULT_CACHE_MAX_ENTRIES},
+        },
+    }
+
+# Seconds a per-user API response stays cached (see cardiocare/cache.py)
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', '300'))
+
+# Health data ingestion
+HEALTH_DATA_BULK_MAX_ITEMS = int(os.getenv('HEALTH_DATA_BULK_MAX_ITEMS', '5000'))
+
+# Trend API over HealthData rollups (see health_monitoring/rollups.py)
+HEALTH_TRENDS_MAX_POINTS = 500  # buckets per field; picks minute, hour or day resolution
+HEALTH_TRENDS_DEFAULT_DAYS = 7
+
+# Retention (see health_monitoring/retention.py, run by manage.py apply_retention).
+# Days kept per tier; None keeps it forever.
+HEALTH_DATA_RETENTION_DAYS = int(os.getenv('HEALTH_DATA_RETENTION_DAYS', '365'))  # raw readings; rollups outlive them
+HEALTH_ROLLUP_RETENTION_DAYS = {'minute': 35, 'hour': 800, 'day': None}
+ECG_WAVEFORM_RETENTION_DAYS = int(os.getenv('ECG_WAVEFORM_RETENTION_DAYS', '90'))  # then strips move to ECG_ARCHIVE_DIR
+ECG_ARCHIVE_DIR = os.getenv('ECG_ARCHIVE_DIR', str(BASE_DIR / 'archive' / 'ecg'))
+# Monthly partitions created ahead of time on PostgreSQL (see health_monitoring/partitions.py)
+PARTITION_MONTHS_AHEAD = 3
+
+# AI analysis executor: 'celery' runs analyze_health_data tasks, 'async' queues
+# jobs for the run_analysis_worker command (see health_monitoring/async_worker.py)
+ANALYSIS_EXECUTOR = os.getenv('ANALYSIS_EXECUTOR', 'celery')
+ANALYSIS_QUEUE_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+ANALYSIS_QUEUE_KEY = 'analysis:pending'
+# Jobs a worker has taken but not finished sit in a list named after it and are
+# requeued when a worker with the same name starts, so keep it stable across restarts
+ANALYSIS_WORKER_NAME = os.getenv('ANALYSIS_WORKER_NAME', socket.gethostname())
+ANALYSIS_WORKER_CONCURRENCY = int(os.getenv('ANALYSIS_WORKER_CONCURRENCY', '200'))
+ANALYSIS_PER_USER_LIMIT = int(os.getenv('ANALYSIS_PER_USER_LIMIT', '4'))
+# Routine (non-urgent) readings per batched model request and how long to wait for a batch to fill
+ANALYSIS_BATCH_SIZE = int(os.getenv('ANALYSIS_BATCH_SIZE', '8'))
+ANALYSIS_BATCH_WAIT_MS = int(os.getenv('ANALYSIS_BATCH_WAIT_MS', '250'))
+
+# Server-sent events (see health_monitoring/events.py); disabled without Redis
+EVENTS_REDIS_URL = os.getenv('EVENTS_REDIS_URL', os.getenv('REDIS_URL'))
+EVENTS_STREAM_MAXLEN = int(os.getenv('EVENTS_STREAM_MAXLEN', '500'))  # events kept per user for resuming
+EVENTS_QUEUE_SIZE = 100  # undelivered events per connection before the client is told to resync
+EVENTS_KEEPALIVE = 15  # seconds between keepalive comments
+EVENTS_RETRY_MS = 3000
 
 # Celery settings
 CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -167,6 +280,43 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Task routing: life-critical alerts never queue behind routine analyses.
+# A worker started without -Q consumes every queue; production runs one
+# worker per CELERY_WORKER_PROFILES entry (manage.py run_celery_worker).
+CELERY_TASK_QUEUES = (
+    Queue('emergency'),
+    Queue('analysis'),
+    Queue('sync'),
+    Queue('bulk-import'),
+)
+CELERY_TASK_DEFAULT_QUEUE = 'analysis'
+# With the Redis broker priority 0 is served first within a queue
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_TASK_ROUTES = {
+    'health_monitoring.tasks.trigger_emergency_alert': {'queue': 'emergency', 'priority': 0},
+    'health_monitoring.tasks.send_emergency_notifications': {'queue': 'emergency', 'priority': 0},
+    'health_monitoring.tasks.analyze_health_data': {'queue': 'analysis'},
+    'health_monitoring.tasks.analyze_ecg_window': {'queue': 'analysis'},
+    'health_monitoring.tasks.import_health_data': {'queue': 'bulk-import', 'priority': 9},
+    'cardiocare.celery.debug_task': {'queue': 'sync'},
+}
+CELERY_WORKER_PROFILES = {
+    'emergency': {'queues': ['emergency'], 'concurrency': 4, 'prefetch_multiplier': 1},
+    'analysis': {'queues': ['analysis'], 'concurrency': 8, 'prefetch_multiplier': 4},
+    'sync': {'queues': ['sync'], 'concurrency': 2, 'prefetch_multiplier': 1},
+    'bulk-import': {'queues': ['bulk-import'], 'concurrency': 2, 'prefetch_multiplier': 1},
+}
+# Longest acceptable wait between publish and start, per queue (see cardiocare/queues.py)
+CELERY_QUEUE_WAIT_SLO_MS = {
+    'emergency': 1000,
+    'analysis': 30000,
+}
+
 # Security settings for production
 if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
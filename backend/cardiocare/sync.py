@@ -0,0 +1,146 @@
+"""Set-based sync of a table with an external snapshot, such as a CSV export.
+
+sync_table() makes a model's table hold exactly the rows of the snapshot.
+Ids only in the table are deleted, ids only in the snapshot are inserted and
+ids in both are overwritten. Existing ids are read with one query. Writes go
+out in batches through bulk_create(update_conflicts=True), one multi-row
+INSERT ... ON CONFLICT (id) DO UPDATE per batch. apply_changes() writes and
+deletes only given rows, for callers that already know what changed.
+
+Some tables have no unique index on id alone, such as a PostgreSQL table
+partitioned on (id, recorded_at) (see health_monitoring/partitions.py). Some
+databases cannot target a conflict at all. In both cases there is nothing
+for ON CONFLICT to name, so new rows go through plain bulk_create and
+existing rows through bulk_update.
+
+Like bulk_create, this skips Model.save() and signals. Derived fields must be
+part of the row values.
+"""
+from itertools import islice
+from django.core.management.color import no_style
+from django.db import connection
+from django.utils import timezone
+
+BATCH_SIZE = 2000
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def upserts_on_pk(model):
+    """Whether ``model`` can be written with ON CONFLICT on its primary key"""
+    if not connection.features.supports_update_conflicts_with_target:
+        return False
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    pk = [model._meta.pk.column]
+    return any(
+        (constraint['primary_key'] or constraint['unique']) and constraint['columns'] == pk
+        for constraint in constraints.values()
+    )
+
+
+def _update_fields(model, batch):
+    """Names of the fields overwritten on existing rows: every column some row in the batch sets.
+
+    auto_now fields are refreshed on every write; auto_now_add fields and the
+    primary key are only ever set on insert.
+    """
+    attnames = set().union(*batch.values())
+    return [
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key and not getattr(field, 'auto_now_add', False)
+        and (field.attname in attnames or getattr(field, 'auto_now', False))
+    ]
+
+
+def _delete(model, ids, batch_size):
+    deleted = 0
+    for start in range(0, len(ids), batch_size):
+        _, per_model = model.objects.filter(pk__in=ids[start:start + batch_size]).delete()
+        deleted += per_model.get(model._meta.label, 0)
+    return deleted
+
+
+def _write(model, rows, existing, batch_size):
+    """Write (id, values) pairs; ``existing`` holds the ids already in the table. Returns the written ids.
+
+    Fields missing from a row get their default on insert. On update, a field
+    no row of the batch sets keeps its stored value; one that only some rows
+    set is written with its default for the others.
+    """
+    upsert = upserts_on_pk(model)
+    pk = model._meta.pk
+    auto_now = [field.attname for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+    written = set()
+    for batch in _batches(rows, batch_size):
+        # One row per id, so no statement touches a row twice
+        batch = dict(batch)
+        update_fields = _update_fields(model, batch)
+        objects = {key: model(**{pk.attname: key, **values}) for key, values in batch.items()}
+
+        if upsert:
+            model.objects.bulk_create(
+                objects.values(), batch_size=batch_size,
+                update_conflicts=True, unique_fields=[pk.name], update_fields=update_fields
+            )
+        else:
+            new = [obj for key, obj in objects.items() if key not in existing and key not in written]
+            model.objects.bulk_create(new, batch_size=batch_size)
+            stored = [obj for key, obj in objects.items() if key in existing or key in written]
+            if stored and update_fields:
+                # bulk_update does not run pre_save(), so auto_now is filled in here
+                now = timezone.now()
+                for obj in stored:
+                    for attname in auto_now:
+                        setattr(obj, attname, now)
+                model.objects.bulk_update(stored, update_fields, batch_size=batch_size)
+        written.update(batch)
+    return written
+
+
+def sync_table(model, ids, rows, batch_size=BATCH_SIZE):
+    """Make ``model``'s table hold exactly the snapshot.
+
+    ``ids`` is the set of every id in the snapshot. ``rows`` yields
+    (id, values) pairs, with values keyed by field attname (``user_id``, not
+    ``user``); ids in ``ids`` without a row are left as they are. A later row
+    for an id wins. Returns counts of created, updated and deleted rows.
+    """
+    existing = set(model.objects.values_list('pk', flat=True))
+
+    # Deleting first frees unique keys that a renumbered row may take over
+    stale = sorted(existing - ids)
+    deleted = _delete(model, stale, batch_size)
+    existing -= set(stale)
+
+    written = _write(model, rows, existing, batch_size)
+    return {'created': len(written - existing), 'updated': len(written & existing), 'deleted': deleted}
+
+
+def apply_changes(model, rows, deleted_ids, batch_size=BATCH_SIZE):
+    """Write ``rows`` ((id, values) pairs) and delete ``deleted_ids``, leaving every other row alone.
+
+    The table is only read for the ids involved. Returns the same counts
+    as sync_table().
+    """
+    rows = dict(rows)
+    deleted = _delete(model, sorted(deleted_ids), batch_size)
+    ids = sorted(rows)
+    existing = set()
+    for start in range(0, len(ids), batch_size):
+        existing.update(model.objects.filter(pk__in=ids[start:start + batch_size]).values_list('pk', flat=True))
+
+    written = _write(model, rows.items(), existing, batch_size)
+    return {'created': len(written - existing), 'updated': len(written & existing), 'deleted': deleted}
+
+
+def reset_sequences(models):
+    """Move id sequences past the explicit ids a sync wrote (PostgreSQL; a no-op elsewhere)"""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
@@ -0,0 +1,212 @@
+import datetime
+from decimal import Decimal
+from unittest import mock
+import requests
+from rest_framework.renderers import JSONRenderer
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from health_monitoring.alerts import raise_emergency_alert
+from health_monitoring.models import HealthAlert
+from accounts.models import EmergencyContact
+from . import sync
+from .http_client import CircuitBreaker, UpstreamClient
+from .renderers import JSONEncoder, ORJSONRenderer
+from .rows import fetch
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_half_open_admits_a_single_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        self.assertTrue(breaker.record_failure())
+        self.assertFalse(breaker.allow())
+
+        breaker.opened_at -= 30
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+
+
+class RetryTests(SimpleTestCase):
+    def upstream(self, error=None, **config):
+        client = UpstreamClient('test', {'retries': 2, 'backoff': 0, **config})
+        client.session.request = mock.Mock(side_effect=error or requests.ReadTimeout('no response'))
+        return client
+
+    def test_post_is_not_resent_after_the_connection_drops_mid_request(self):
+        client = self.upstream(requests.ConnectionError('Connection aborted.'))
+        with self.assertRaises(requests.ConnectionError):
+            client.post('http://upstream.invalid/')
+        self.assertEqual(client.session.request.call_count, 1)
+
+    def test_post_is_resent_when_no_connection_was_made(self):
+        refused = NewConnectionError(None, 'Connection refused')
+        for error in (requests.ConnectionError(MaxRetryError(None, '/', refused)), requests.ConnectTimeout('connect')):
+            client = self.upstream(error)
+            with self.assertRaises(requests.ConnectionError):
+                client.post('http://upstream.invalid/')
+            self.assertEqual(client.session.request.call_count, 3)
+
+    def test_post_is_not_resent_after_a_read_timeout(self):
+        client = self.upstream()
+        with self.assertRaises(requests.ReadTimeout):
+            client.post('http://upstream.invalid/')
+        self.assertEqual(client.session.request.call_count, 1)
+
+    def test_get_and_opted_in_post_are_retried(self):
+        for method, config in (('get', {}), ('post', {'retry_non_idempotent': True})):
+            client = self.upstream(**config)
+            with self.assertRaises(requests.ReadTimeout):
+                getattr(client, method)('http://upstream.invalid/')
+            self.assertEqual(client.session.request.call_count, 3)
+
+
+class CachedResponseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='etag', email='etag@example.com')
+        self.client.force_login(self.user)
+
+    def test_repeat_is_served_from_the_cache_and_revalidates_with_the_etag(self):
+        first = self.client.get('/api/auth/profile/', secure=True)
+        get_user_model().objects.filter(id=self.user.id).update(first_name='Unseen')
+        cached = self.client.get('/api/auth/profile/', secure=True)
+        revalidated = self.client.get('/api/auth/profile/', secure=True, headers={'If-None-Match': first['ETag']})
+
+        self.assertEqual(cached.json(), first.json())
+        self.assertEqual(cached['Cache-Control'], 'private, no-cache')
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], first['ETag'])
+
+    def test_parameterized_requests_bypass_the_cache(self):
+        self.client.get('/api/health/alerts/', secure=True)
+        # The invalidating receiver runs on commit, which never comes inside this test
+        HealthAlert.objects.create(user=self.user, alert_type='emergency', title='Alert', message='', severity='high')
+
+        self.assertEqual(len(self.client.get('/api/health/alerts/?limit=5', secure=True).json()), 1)
+        self.assertEqual(self.client.get('/api/health/alerts/', secure=True).json(), [])
+
+    def test_link_header_is_replayed_from_the_cache(self):
+        HealthAlert.objects.bulk_create([
+            HealthAlert(user=self.user, alert_type='emergency', title='Alert', message='', severity='high')
+            for _ in range(25)
+        ])
+
+        first = self.client.get('/api/health/alerts/', secure=True)
+        cached = self.client.get('/api/health/alerts/', secure=True)
+
+        self.assertIn('rel="next"', first['Link'])
+        self.assertEqual(cached['Link'], first['Link'])
+
+
+class CacheInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='cached', email='cached@example.com')
+        self.client.force_login(self.user)
+
+    def get(self, path):
+        return self.client.get(path, secure=True).json()
+
+    def test_alert_writes_clear_the_cached_alert_list(self):
+        self.assertEqual(self.get('/api/health/alerts/'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alert, _ = raise_emergency_alert(self.user.id, 'high', 'Alert', 'Heart rate high')
+        self.assertEqual([item['severity'] for item in self.get('/api/health/alerts/')], ['high'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            raise_emergency_alert(self.user.id, 'critical', 'Alert', 'Heart rate critical')
+        self.assertEqual([item['severity'] for item in self.get('/api/health/alerts/')], ['critical'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alert.delete()
+        self.assertEqual(self.get('/api/health/alerts/'), [])
+
+    def test_profile_changes_and_logins_clear_the_cached_profile(self):
+        first_login = self.get('/api/auth/profile/')['last_login']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Renamed'
+            self.user.save()
+        self.assertEqual(self.get('/api/auth/profile/')['name'], 'Renamed ')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.user)
+        self.assertNotEqual(self.get('/api/auth/profile/')['last_login'], first_login)
+
+
+class SyncTableTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='synced', email='synced@example.com')
+        for contact_id, name in ((1, 'Kept'), (2, 'Stale'), (3, 'Edited')):
+            EmergencyContact.objects.create(id=contact_id, user=self.user, name=name, phone='555', relationship='x')
+
+    def rows(self, names):
+        return [(contact_id, {'user_id': self.user.id, 'name': name, 'phone': '555', 'relationship': 'x'})
+                for contact_id, name in names]
+
+    def test_counts_and_contents_after_a_sync(self):
+        names = [(1, 'Kept'), (3, 'Renamed'), (4, 'New'), (3, 'Renamed again')]
+
+        counts = sync.sync_table(EmergencyContact, {1, 3, 4}, self.rows(names), batch_size=2)
+
+        self.assertEqual(counts, {'created': 1, 'updated': 2, 'deleted': 1})
+        self.assertEqual(
+            dict(EmergencyContact.objects.values_list('id', 'name')), {1: 'Kept', 3: 'Renamed again', 4: 'New'}
+        )
+
+    def test_fields_set_by_any_row_of_a_batch_are_updated(self):
+        rows = self.rows([(1, 'Kept'), (3, 'Edited')])
+        rows[1][1]['priority'] = 3
+
+        with mock.patch.object(sync, 'upserts_on_pk', return_value=False):
+            counts = sync.apply_changes(EmergencyContact, rows, [2])
+
+        self.assertEqual(counts, {'created': 0, 'updated': 2, 'deleted': 1})
+        self.assertEqual(EmergencyContact.objects.get(id=3).priority, 3)
+
+
+class ReferenceRenderer(JSONRenderer):
+    encoder_class = JSONEncoder
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    cases = {
+        'scalars': [None, True, False, 0, -7, 2 ** 63 - 1, '', 'plain'],
+        'floats': [0.1, 1.5, -2.25, 1e-05, 9e-05, 0.00001234, 1e-06, 1e16, 1.7976931348623157e308, 123456789.125],
+        'text': ['caf\u00e9', '\u2028 and \u2029', 'emoji \U0001f493', 'quote " and \\ and \n', '\x00\x1f'],
+        'datetimes': [
+            datetime.datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+            datetime.datetime(2026, 1, 2, 3, 4, 5),
+            datetime.date(2026, 1, 2),
+        ],
+        'beyond orjson': [2 ** 70, {1: 'int key'}, Decimal('1.10')],
+        'nested': {'rows': [{'id': 1, 'value': {'bpm': 72.0}, 'tags': []}], 'empty': {}},
+    }
+
+    def test_output_matches_drf_byte_for_byte(self):
+        for name, data in self.cases.items():
+            with self.subTest(name):
+                self.assertEqual(ORJSONRenderer().render(data), ReferenceRenderer().render(data))
+
+    def test_indented_output_matches_drf(self):
+        data = self.cases['nested']
+        media_type = 'application/json; indent=4'
+        self.assertEqual(ORJSONRenderer().render(data, media_type), ReferenceRenderer().render(data, media_type))
+
+    def test_non_finite_floats_render_as_null(self):
+        self.assertEqual(ORJSONRenderer().render([float('nan'), float('inf')]), b'[null,null]')
+
+    def test_projected_rows_keep_the_declared_key_order(self):
+        queryset = mock.Mock()
+        queryset.values_list.return_value = [(1, 'high'), (2, 'low')]
+
+        rows = fetch(queryset, {'id': 'id', 'level': 'severity'})
+
+        queryset.values_list.assert_called_once_with('id', 'severity')
+        self.assertEqual(ORJSONRenderer().render(rows), b'[{"id":1,"level":"high"},{"id":2,"level":"low"}]')
@@ -3,6 +3,6 @@ from .models import EmergencyResponse
 
 @admin.register(EmergencyResponse)
 class EmergencyResponseAdmin(admin.ModelAdmin):
-    list_display = ('user', 'response_type', 'recipient', 'status', 'created_at')
+    list_display = ('user', 'response_type', 'recipient', 'status', 'health_alert', 'created_at')
     list_filter = ('response_type', 'status', 'created_at')
     search_fields = ('user__email', 'recipient', 'message')
@@ -19,6 +19,9 @@ class EmergencyResponse(models.Model):
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='emergency_responses')
+    health_alert = models.ForeignKey(
+        'health_monitoring.HealthAlert', on_delete=models.SET_NULL, null=True, blank=True, related_name='responses'
+    )
     response_type = models.CharField(max_length=20, choices=RESPONSE_TYPES)
     recipient = models.CharField(max_length=255)  # phone number or email
     message = models.TextField()
@@ -32,5 +35,11 @@ class EmergencyResponse(models.Model):
     sent_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
     
+    # Idempotency-Key of the trigger_emergency request that created this record
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='emergency_response_idempotency_key'),
+        ]
@@ -0,0 +1,90 @@
+"""Concurrent emergency contact notification with a delivery ledger.
+
+One EmergencyResponse row per contact is written up front in a single
+bulk_create, messages are sent from a bounded thread pool, and the rows are
+updated from the send results in a single bulk_update. The time until the
+last contact has been attempted is recorded as notifications.fanout.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils import timezone
+from cardiocare import metrics
+from .models import EmergencyResponse
+
+COUNTERS = ['notifications.sent', 'notifications.failed']
+
+
+def twilio_client():
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.rest import Client
+
+    http_client = TwilioHttpClient(timeout=settings.TWILIO_TIMEOUT, pool_connections=True)
+    return Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, http_client=http_client)
+
+
+def _send_whatsapp(client, response):
+    try:
+        message = client.messages.create(
+            body=response.message,
+            from_=settings.TWILIO_WHATSAPP_NUMBER,
+            to=f'whatsapp:{response.recipient}'
+        )
+        return response, message.sid, None
+    except Exception as e:
+        return response, None, str(e)
+
+
+def notify_contacts(user, contacts, message_body, health_alert=None, client=None):
+    """Send a WhatsApp message to every contact concurrently.
+
+    Returns the EmergencyResponse rows with their final status.
+    """
+    contacts = list(contacts)
+    if not contacts:
+        return []
+
+    responses = EmergencyResponse.objects.bulk_create([
+        EmergencyResponse(
+            user=user,
+            health_alert=health_alert,
+            response_type='whatsapp',
+            recipient=contact.phone,
+            message=message_body,
+            status='pending',
+            response_data={'contact_id': contact.id, 'contact_name': contact.name}
+        )
+        for contact in contacts
+    ])
+
+    client = client or twilio_client()
+    started = time.monotonic()
+    workers = min(settings.EMERGENCY_NOTIFY_CONCURRENCY, len(responses))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda response: _send_whatsapp(client, response), responses))
+    metrics.observe('notifications.fanout', (time.monotonic() - started) * 1000)
+
+    sent_at = timezone.now()
+    for response, external_id, error in results:
+        name = response.response_data['contact_name']
+        if error is None:
+            response.status = 'sent'
+            response.external_id = external_id
+            response.sent_at = sent_at
+            metrics.increment('notifications.sent')
+            print(f"WhatsApp sent to {name}: {external_id}")
+        else:
+            response.status = 'failed'
+            response.response_data = {**response.response_data, 'error': error}
+            metrics.increment('notifications.failed')
+            print(f"Failed to send WhatsApp to {name}: {error}")
+
+    EmergencyResponse.objects.bulk_update(responses, ['status', 'external_id', 'response_data', 'sent_at'])
+    return responses
+
+
+def notification_stats():
+    return {
+        **metrics.get_counters(COUNTERS),
+        'fanout': metrics.get_timing('notifications.fanout'),
+    }
@@ -0,0 +1,82 @@
+import threading
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from accounts.models import EmergencyContact
+from .models import EmergencyResponse
+from .notifications import notify_contacts
+
+User = get_user_model()
+
+
+class TriggerEmergencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='emergency', email='emergency@example.com')
+        self.client.force_login(self.user)
+
+    def trigger(self, **headers):
+        return self.client.post(
+            '/api/emergency/alert/', {'emergency_type': 'cardiac_emergency'},
+            content_type='application/json', secure=True, headers=headers
+        )
+
+    @mock.patch('emergency_system.views.trigger_emergency_alert')
+    def test_repeated_idempotency_key_returns_the_original_response(self, alert_task):
+        first = self.trigger(**{'Idempotency-Key': 'press-1'})
+        repeat = self.trigger(**{'Idempotency-Key': 'press-1'})
+
+        self.assertEqual(repeat.json(), first.json())
+        self.assertEqual(EmergencyResponse.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(alert_task.delay.call_count, 1)
+
+    @mock.patch('emergency_system.views.trigger_emergency_alert')
+    def test_requests_without_a_key_are_separate_emergencies(self, alert_task):
+        first = self.trigger()
+        second = self.trigger()
+
+        self.assertNotEqual(first.json()['emergency_id'], second.json()['emergency_id'])
+        self.assertEqual(alert_task.delay.call_count, 2)
+
+
+class FakeMessages:
+    """Twilio messages API that only answers once every contact is being messaged at the same time"""
+
+    def __init__(self, parties, failing):
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.failing = failing
+
+    def create(self, body, from_, to):
+        self.barrier.wait()
+        if to in self.failing:
+            raise RuntimeError('invalid number')
+        return mock.Mock(sid=f'SM-{to}')
+
+
+@override_settings(EMERGENCY_NOTIFY_CONCURRENCY=8, TWILIO_WHATSAPP_NUMBER='whatsapp:+1000')
+class NotifyContactsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='patient', email='patient@example.com')
+        self.contacts = [
+            EmergencyContact.objects.create(user=self.user, name=name, phone=phone, relationship='family')
+            for name, phone in (('Ana', '+1001'), ('Ben', '+1002'), ('Cy', '+1003'))
+        ]
+
+    def test_contacts_are_messaged_concurrently_and_every_attempt_recorded(self):
+        client = mock.Mock(messages=FakeMessages(parties=3, failing={'whatsapp:+1002'}))
+
+        notify_contacts(self.user, self.contacts, 'Emergency', client=client)
+
+        ledger = {
+            response.recipient: response
+            for response in EmergencyResponse.objects.filter(user=self.user)
+        }
+        self.assertEqual({phone: response.status for phone, response in ledger.items()},
+                         {'+1001': 'sent', '+1002': 'failed', '+1003': 'sent'})
+        self.assertEqual(ledger['+1001'].external_id, 'SM-whatsapp:+1001')
+        self.assertIsNotNone(ledger['+1003'].sent_at)
+        self.assertEqual(ledger['+1002'].response_data['error'], 'invalid number')
+        self.assertEqual(ledger['+1002'].response_data['contact_name'], 'Ben')
+
+    def test_no_contacts_writes_nothing(self):
+        self.assertEqual(notify_contacts(self.user, [], 'Emergency', client=mock.Mock()), [])
+        self.assertFalse(EmergencyResponse.objects.exists())
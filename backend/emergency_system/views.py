@@ -1,10 +1,30 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from .models import EmergencyResponse
 from health_monitoring.tasks import trigger_emergency_alert
 from accounts.models import EmergencyContact
+from cardiocare.async_views import async_api_view
+from cardiocare.cache import CONTACTS, cached_response, invalidate
+from cardiocare.rows import afetch
+
+# Response key -> model field, in response order (see cardiocare/rows.py)
+CONTACT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'phone': 'phone',
+    'relationship': 'relationship',
+    'priority': 'priority',
+}
+
+def emergency_triggered(emergency_response):
+    return Response({
+        'success': True,
+        'emergency_id': emergency_response.id,
+        'message': 'Emergency alert triggered successfully'
+    })
 
 @api_view(['POST'])
 def trigger_emergency(request):
@@ -13,25 +33,47 @@ def trigger_emergency(request):
     emergency_type = request.data.get('emergency_type', 'cardiac_emergency')
     patient_data = request.data.get('patient_data', {})
     location = request.data.get('location', 'Unknown location')
+    idempotency_key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key') or None
+    
+    if idempotency_key is not None and not (isinstance(idempotency_key, str) and len(idempotency_key) <= 255):
+        return Response(
+            {'error': 'idempotency_key must be a string of at most 255 characters'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     try:
+        # A retried request gets the original answer and triggers nothing new
+        if idempotency_key:
+            original = EmergencyResponse.objects.filter(user=user, idempotency_key=idempotency_key).first()
+            if original:
+                return emergency_triggered(original)
+        
         # Create emergency response record
-        emergency_response = EmergencyResponse.objects.create(
-            user=user,
-            response_type='whatsapp',
-            recipient='emergency_contacts',
-            message=f"Emergency detected: {emergency_type}",
-            status='pending'
-        )
+        try:
+            with transaction.atomic():
+                emergency_response = EmergencyResponse.objects.create(
+                    user=user,
+                    response_type='whatsapp',
+                    recipient='emergency_contacts',
+                    message=f"Emergency detected: {emergency_type}",
+                    status='pending',
+                    idempotency_key=idempotency_key
+                )
+        except IntegrityError:
+            # The same key committed by a concurrent retry between the lookup and the insert
+            if not idempotency_key:
+                raise
+            return emergency_triggered(EmergencyResponse.objects.get(user=user, idempotency_key=idempotency_key))
         
-        # Trigger emergency alert
-        trigger_emergency_alert.delay(user.id, None)
+        # Trigger emergency alert; the key also keeps a redelivered task from alerting twice
+        trigger_emergency_alert.delay(
+            user.id,
+            None,
+            emergency_type=emergency_type,
+            idempotency_key=f'manual:{user.id}:{idempotency_key}' if idempotency_key else None
+        )
         
-        return Response({
-            'success': True,
-            'emergency_id': emergency_response.id,
-            'message': 'Emergency alert triggered successfully'
-        })
+        return emergency_triggered(emergency_response)
         
     except Exception as e:
         return Response(
@@ -39,23 +81,14 @@ def trigger_emergency(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-@api_view(['GET'])
-def get_emergency_contacts(request):
+@async_api_view()
+@cached_response(CONTACTS)
+async def get_emergency_contacts(request):
     """Get user's emergency contacts"""
     user = request.user
     contacts = EmergencyContact.objects.filter(user=user, is_active=True).order_by('priority')
     
-    contact_data = []
-    for contact in contacts:
-        contact_data.append({
-            'id': contact.id,
-            'name': contact.name,
-            'phone': contact.phone,
-            'relationship': contact.relationship,
-            'priority': contact.priority
-        })
-    
-    return Response(contact_data)
+    return Response(await afetch(contacts, CONTACT_FIELDS))
 
 @api_view(['POST'])
 def update_emergency_contact(request, contact_id):
@@ -68,6 +101,7 @@ def update_emergency_contact(request, contact_id):
         contact.relationship = request.data.get('relationship', contact.relationship)
         contact.priority = request.data.get('priority', contact.priority)
         contact.save()
+        invalidate(CONTACTS, request.user.id)
         
         return Response({
             'id': contact.id,
@@ -100,6 +134,7 @@ def add_emergency_contact(request):
             relationship=request.data.get('relationship'),
             priority=request.data.get('priority', 5)
         )
+        invalidate(CONTACTS, request.user.id)
         
         return Response({
             'id': contact.id,
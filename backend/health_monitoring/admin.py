@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import HealthData, ECGReading, AIAnalysis, HealthAlert
+from .models import HealthData, ECGReading, ECGSession, AIAnalysis, CurrentVitals, HealthAlert, HealthDataRollup
 
 @admin.register(HealthData)
 class HealthDataAdmin(admin.ModelAdmin):
@@ -13,14 +13,32 @@ class ECGReadingAdmin(admin.ModelAdmin):
     list_filter = ('recorded_at', 'quality_score')
     search_fields = ('user__email',)
 
+@admin.register(ECGSession)
+class ECGSessionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'status', 'sample_rate', 'sample_count', 'started_at', 'closed_at')
+    list_filter = ('status', 'started_at')
+    search_fields = ('user__email',)
+
 @admin.register(AIAnalysis)
 class AIAnalysisAdmin(admin.ModelAdmin):
-    list_display = ('user', 'risk_level', 'confidence_score', 'created_at')
-    list_filter = ('risk_level', 'created_at')
+    list_display = ('user', 'risk_level', 'confidence_score', 'served_from_cache', 'created_at')
+    list_filter = ('risk_level', 'served_from_cache', 'created_at')
     search_fields = ('user__email', 'analysis_result')
 
+@admin.register(CurrentVitals)
+class CurrentVitalsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'heart_rate', 'systolic', 'diastolic', 'spo2', 'temperature', 'risk_level', 'updated_at')
+    list_filter = ('risk_level',)
+    search_fields = ('user__email',)
+
+@admin.register(HealthDataRollup)
+class HealthDataRollupAdmin(admin.ModelAdmin):
+    list_display = ('user', 'data_type', 'field', 'resolution', 'bucket_start', 'count', 'minimum', 'maximum')
+    list_filter = ('data_type', 'resolution')
+    search_fields = ('user__email',)
+
 @admin.register(HealthAlert)
 class HealthAlertAdmin(admin.ModelAdmin):
-    list_display = ('user', 'alert_type', 'status', 'severity', 'created_at')
+    list_display = ('user', 'alert_type', 'status', 'severity', 'occurrences', 'last_triggered_at', 'created_at')
     list_filter = ('alert_type', 'status', 'severity', 'created_at')
     search_fields = ('user__email', 'title', 'message')
@@ -0,0 +1,126 @@
+"""Emergency alert coalescing.
+
+Repeated abnormal readings fold into the user's active emergency alert while
+it has been triggered within ALERT_COALESCE_WINDOW seconds (a sliding
+window). The alert's severity only ever escalates, and contacts are messaged
+again only when it does. Idempotency keys make redelivered or retried
+triggers no-ops, and claim_notification() lets exactly one worker notify for
+each severity level.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from cardiocare import metrics
+from .events import publish
+from .models import AlertTrigger, HealthAlert
+from .triage import SEVERITY_ORDER
+
+User = get_user_model()
+
+COUNTERS = ['alerts.created', 'alerts.coalesced', 'alerts.escalated', 'alerts.duplicate', 'alerts.notify_claimed']
+
+
+def _is_higher(severity, than):
+    return SEVERITY_ORDER.index(severity) > SEVERITY_ORDER.index(than) if than in SEVERITY_ORDER else True
+
+
+def raise_emergency_alert(user_id, severity, title, message, ai_analysis=None, idempotency_key=None, now=None):
+    """Create or coalesce the user's emergency alert.
+
+    Returns (alert, notify) where ``notify`` is True when the alert is new or
+    its severity went up, i.e. contacts should hear about it.
+    """
+    now = now or timezone.now()
+    try:
+        with transaction.atomic():
+            # Serializes triggers per user so two workers cannot both create an alert
+            User.objects.select_for_update().only('id').get(id=user_id)
+
+            if idempotency_key:
+                trigger = AlertTrigger.objects.filter(key=idempotency_key).select_related('alert').first()
+                if trigger:
+                    metrics.increment('alerts.duplicate')
+                    return trigger.alert, False
+
+            alert = (
+                HealthAlert.objects
+                .filter(
+                    user_id=user_id,
+                    alert_type='emergency',
+                    status='active',
+                    last_triggered_at__gte=now - timedelta(seconds=settings.ALERT_COALESCE_WINDOW),
+                )
+                .order_by('-last_triggered_at')
+                .first()
+            )
+
+            if alert is None:
+                alert = HealthAlert.objects.create(
+                    user_id=user_id,
+                    alert_type='emergency',
+                    title=title,
+                    message=message,
+                    severity=severity,
+                    ai_analysis=ai_analysis,
+                    last_triggered_at=now
+                )
+                metrics.increment('alerts.created')
+                notify = True
+            else:
+                alert.occurrences += 1
+                alert.last_triggered_at = now
+                fields = ['occurrences', 'last_triggered_at']
+                notify = _is_higher(severity, alert.severity)
+                if notify:
+                    alert.severity = severity
+                    alert.title = title
+                    alert.message = message
+                    fields += ['severity', 'title', 'message']
+                    if ai_analysis is not None:
+                        alert.ai_analysis = ai_analysis
+                        fields.append('ai_analysis')
+                    metrics.increment('alerts.escalated')
+                alert.save(update_fields=fields)
+                metrics.increment('alerts.coalesced')
+
+            if idempotency_key:
+                AlertTrigger.objects.create(key=idempotency_key, alert=alert)
+
+            publish(user_id, 'alert', {
+                'id': alert.id,
+                'type': alert.alert_type,
+                'title': alert.title,
+                'message': alert.message,
+                'status': alert.status,
+                'severity': alert.severity,
+                'occurrences': alert.occurrences,
+                'created_at': alert.created_at,
+                'resolved_at': alert.resolved_at,
+            })
+            return alert, notify
+
+    except IntegrityError:
+        # The same key committed from another worker between our check and insert
+        if not idempotency_key:
+            raise
+        metrics.increment('alerts.duplicate')
+        return AlertTrigger.objects.select_related('alert').get(key=idempotency_key).alert, False
+
+
+def claim_notification(alert_id, severity):
+    """Atomically take the job of notifying contacts about ``severity``.
+
+    True for exactly one caller per alert and severity level; False if the
+    contacts were already told about this severity or a higher one.
+    """
+    lower = [''] + SEVERITY_ORDER[:SEVERITY_ORDER.index(severity)] if severity in SEVERITY_ORDER else ['']
+    claimed = HealthAlert.objects.filter(id=alert_id, notified_severity__in=lower).update(notified_severity=severity) == 1
+    if claimed:
+        metrics.increment('alerts.notify_claimed')
+    return claimed
+
+
+def alert_stats():
+    return metrics.get_counters(COUNTERS)
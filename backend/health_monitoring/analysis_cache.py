@@ -0,0 +1,77 @@
+"""Content-addressed cache of AI analysis results.
+
+Results are keyed on a hash of the OpenRouter request built from the
+clinical inputs only (no request timestamp or user id), so retries,
+duplicate uploads and mock-data re-syncs reuse an earlier answer instead of
+paying for another LLM call. Entries live in the 'ai_results' cache: a
+bounded LRU in memory, or Redis (run with an allkeys-lru maxmemory policy),
+and expire after AI_RESULT_CACHE_TIMEOUT seconds.
+"""
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import caches
+from cardiocare import metrics
+
+# Per-request fields that do not change the clinical picture
+VOLATILE_FIELDS = ('timestamp', 'user_id')
+
+COUNTERS = ['ai_cache.hit', 'ai_cache.miss', 'ai_cache.store']
+
+
+def clinical_inputs(health_data):
+    return {key: value for key, value in health_data.items() if key not in VOLATILE_FIELDS}
+
+
+def analysis_fingerprint(payload):
+    """SHA-256 of the canonical JSON of an OpenRouter request payload"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _cache():
+    return caches['ai_results']
+
+
+def _key(fingerprint):
+    return f'ai_result:{fingerprint}'
+
+
+def _hit(fingerprint, result):
+    if result is None:
+        metrics.increment('ai_cache.miss')
+        return None
+    metrics.increment('ai_cache.hit')
+    return {**result, 'cached': True, 'fingerprint': fingerprint}
+
+
+def lookup(fingerprint):
+    """Cached analysis for ``fingerprint`` marked ``cached``, or None"""
+    return _hit(fingerprint, _cache().get(_key(fingerprint)))
+
+
+async def alookup(fingerprint):
+    return _hit(fingerprint, await _cache().aget(_key(fingerprint)))
+
+
+def store(fingerprint, result):
+    """Remember a successful model answer"""
+    metrics.increment('ai_cache.store')
+    _cache().set(_key(fingerprint), result, settings.AI_RESULT_CACHE_TIMEOUT)
+    return {**result, 'fingerprint': fingerprint}
+
+
+async def astore(fingerprint, result):
+    metrics.increment('ai_cache.store')
+    await _cache().aset(_key(fingerprint), result, settings.AI_RESULT_CACHE_TIMEOUT)
+    return {**result, 'fingerprint': fingerprint}
+
+
+def cache_stats():
+    counters = metrics.get_counters(COUNTERS)
+    lookups = counters['ai_cache.hit'] + counters['ai_cache.miss']
+    return {
+        'lookups': lookups,
+        'hit_rate': round(counters['ai_cache.hit'] / lookups, 3) if lookups else None,
+        **counters,
+    }
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class HealthMonitoringConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'health_monitoring'
+
+    def ready(self):
+        from . import receivers  # noqa: F401
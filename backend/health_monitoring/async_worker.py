@@ -0,0 +1,288 @@
+"""Asyncio executor for AI analyses.
+
+An analyze_health_data Celery task holds a whole worker process while it
+waits on OpenRouter. This worker keeps up to ANALYSIS_WORKER_CONCURRENCY
+requests in flight from a single process instead. Jobs are queued in a Redis
+list by enqueue_analysis and scheduled round-robin across users, with at
+most ANALYSIS_PER_USER_LIMIT in flight per user so one bursty patient cannot
+starve everyone else. Routine readings are micro-batched (see batching.py).
+Database work runs through sync_to_async and results are stored exactly as
+the Celery task stores them.
+
+A job stays in a per-worker processing list from the moment it is taken
+until it finishes, so jobs held by a worker that crashed are requeued when it
+starts again.
+"""
+import asyncio
+import json
+import logging
+from collections import OrderedDict, deque
+import redis
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from cardiocare import metrics
+from cardiocare.http_client import CircuitOpenError, get_async_client
+from . import analysis_cache
+from .analysis_cache import analysis_fingerprint
+from .batching import AnalysisBatcher
+from .tasks import (
+    build_openrouter_request, fallback_analysis, parse_openrouter_response,
+    prepare_analysis, store_analysis
+)
+
+logger = logging.getLogger(__name__)
+
+_redis = None
+
+# Seconds between attempts to reach the queue after a Redis error, doubling up to the maximum
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+
+
+def push_job(user_id, ecg_reading_id=None):
+    """Queue an analysis for run_analysis_worker"""
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.ANALYSIS_QUEUE_URL)
+    job = {'user_id': user_id, 'ecg_reading_id': ecg_reading_id}
+    _redis.rpush(settings.ANALYSIS_QUEUE_KEY, json.dumps(job))
+
+
+def database(func):
+    """Run ORM and CPU work in the thread pool, recycling stale connections.
+
+    thread_sensitive=False keeps concurrent analyses from queueing behind one
+    another on the single shared sync thread.
+    """
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper, thread_sensitive=False)
+
+
+async def call_openrouter_ai_async(client, health_data):
+    """Async counterpart of tasks.call_openrouter_ai"""
+    if not settings.OPENROUTER_API_KEY:
+        return fallback_analysis(health_data)
+
+    headers, payload = build_openrouter_request(health_data)
+
+    fingerprint = analysis_fingerprint(payload)
+    cached = await analysis_cache.alookup(fingerprint)
+    if cached:
+        return cached
+
+    try:
+        response = await client.post(settings.OPENROUTER_URL, headers=headers, json=payload)
+        response.raise_for_status()
+        return await analysis_cache.astore(fingerprint, parse_openrouter_response(response.json()))
+
+    except CircuitOpenError:
+        return fallback_analysis(health_data)
+
+    except Exception as e:
+        logger.error(f"Error calling OpenRouter AI: {str(e)}")
+        return fallback_analysis(health_data)
+
+
+async def analyze(job, assess):
+    """One analysis: prepare and triage, ``assess`` escalated readings, store"""
+    user_id = job['user_id']
+    health_data, analysis_result = await database(prepare_analysis)(user_id, job.get('ecg_reading_id'))
+    if analysis_result is None:
+        analysis_result = await assess(health_data)
+    return await database(store_analysis)(user_id, health_data, analysis_result)
+
+
+class RedisJobSource:
+    """Takes jobs queued by push_job, keeping each one until it is acked.
+
+    BLMOVE hands a job over to this worker's processing list atomically;
+    ack() removes it once it has run. Whatever is left in the processing list
+    when the worker starts belonged to a previous run that never finished it
+    and goes back to the head of the queue.
+    """
+
+    def __init__(self, url=None, key=None, poll_timeout=1, worker_name=None):
+        self.redis = aioredis.Redis.from_url(url or settings.ANALYSIS_QUEUE_URL)
+        self.key = key or settings.ANALYSIS_QUEUE_KEY
+        self.processing_key = f'{self.key}:processing:{worker_name or settings.ANALYSIS_WORKER_NAME}'
+        self.poll_timeout = poll_timeout
+        self.stopped = False
+        self.recovered = False
+        self.payloads = {}  # id(job) -> the payload to remove on ack
+
+    async def _recover(self):
+        requeued = 0
+        while await self.redis.lmove(self.processing_key, self.key, 'RIGHT', 'LEFT') is not None:
+            requeued += 1
+        if requeued:
+            metrics.increment('analysis_worker.requeued', requeued)
+            logger.warning(f"Requeued {requeued} unfinished analysis jobs from {self.processing_key}")
+        self.recovered = True
+
+    async def get(self):
+        """Next job, or None once stop() has been called.
+
+        Redis errors are logged and retried with backoff; the client
+        reconnects on the next command.
+        """
+        delay = RECONNECT_DELAY
+        while not self.stopped:
+            try:
+                if not self.recovered:
+                    await self._recover()
+                payload = await self.redis.blmove(self.key, self.processing_key, self.poll_timeout, 'LEFT', 'RIGHT')
+            except redis.RedisError as e:
+                logger.error(f"Error reading analysis queue: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+            delay = RECONNECT_DELAY
+            if payload is not None:
+                job = json.loads(payload)
+                self.payloads[id(job)] = payload
+                return job
+        return None
+
+    async def ack(self, job):
+        """Drop a finished job from the processing list"""
+        payload = self.payloads.pop(id(job))
+        try:
+            await self.redis.lrem(self.processing_key, 1, payload)
+        except redis.RedisError as e:
+            # The job stays in the processing list and runs again after a restart
+            logger.error(f"Error acknowledging analysis job {job}: {str(e)}")
+
+    def stop(self):
+        self.stopped = True
+
+    async def aclose(self):
+        await self.redis.aclose()
+
+
+class FairScheduler:
+    """Runs jobs with a global and a per-user in-flight limit.
+
+    Ready users are served round-robin. At most ``max_backlog`` jobs are
+    pulled off the source ahead of being started, so a stopped worker leaves
+    the rest of the queue in Redis. Each job is acked on the source, if it
+    supports that, once it has finished or failed.
+    """
+
+    def __init__(self, handler, concurrency, per_user_limit, max_backlog=None):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.per_user_limit = per_user_limit
+        self.max_backlog = max_backlog or concurrency
+        self.pending = OrderedDict()  # user_id -> deque of jobs
+        self.in_flight = {}
+        self.running = 0
+        self.backlog = 0
+        self.exhausted = False
+        self.changed = asyncio.Condition()
+        self.ack = None
+
+    def _ready_user(self):
+        for user_id in self.pending:
+            if self.in_flight.get(user_id, 0) < self.per_user_limit:
+                return user_id
+        return None
+
+    def _can_start(self):
+        return self.running < self.concurrency and self._ready_user() is not None
+
+    def _pop(self):
+        user_id = self._ready_user()
+        jobs = self.pending.pop(user_id)
+        job = jobs.popleft()
+        if jobs:
+            # Back of the line until every other ready user has had a turn
+            self.pending[user_id] = jobs
+        self.backlog -= 1
+        self.running += 1
+        self.in_flight[user_id] = self.in_flight.get(user_id, 0) + 1
+        return job
+
+    async def _feed(self, source):
+        try:
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(lambda: self.backlog < self.max_backlog)
+                job = await source.get()
+                if job is None:
+                    break
+                async with self.changed:
+                    self.pending.setdefault(job['user_id'], deque()).append(job)
+                    self.backlog += 1
+                    self.changed.notify_all()
+        finally:
+            async with self.changed:
+                self.exhausted = True
+                self.changed.notify_all()
+
+    async def _run(self, job):
+        started = asyncio.get_running_loop().time()
+        try:
+            await self.handler(job)
+            metrics.increment('analysis_worker.completed')
+        except Exception as e:
+            metrics.increment('analysis_worker.failed')
+            logger.error(f"Error in analysis job {job}: {str(e)}")
+        finally:
+            metrics.observe('analysis_worker.duration', (asyncio.get_running_loop().time() - started) * 1000)
+            if self.ack is not None:
+                await self.ack(job)
+            async with self.changed:
+                self.running -= 1
+                user_id = job['user_id']
+                self.in_flight[user_id] -= 1
+                if not self.in_flight[user_id]:
+                    del self.in_flight[user_id]
+                self.changed.notify_all()
+
+    async def run(self, source):
+        """Schedule jobs from ``source`` until it is exhausted and all jobs finish"""
+        self.ack = getattr(source, 'ack', None)
+        feeder = asyncio.create_task(self._feed(source))
+        tasks = set()
+        try:
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(
+                        lambda: self._can_start() or (self.exhausted and not self.backlog)
+                    )
+                    if not self._can_start():
+                        break
+                    job = self._pop()
+                task = asyncio.create_task(self._run(job))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            feeder.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_worker(source=None, concurrency=None, per_user_limit=None, batch_size=None):
+    concurrency = concurrency or settings.ANALYSIS_WORKER_CONCURRENCY
+    source = source or RedisJobSource()
+    client = get_async_client('openrouter', max_connections=concurrency)
+    batcher = AnalysisBatcher(client, call_openrouter_ai_async, max_size=batch_size)
+
+    async def handler(job):
+        return await analyze(job, batcher.submit)
+
+    scheduler = FairScheduler(handler, concurrency, per_user_limit or settings.ANALYSIS_PER_USER_LIMIT)
+    try:
+        await scheduler.run(source)
+    finally:
+        await batcher.aclose()
+        await client.aclose()
+        if hasattr(source, 'aclose'):
+            await source.aclose()
@@ -0,0 +1,123 @@
+"""Micro-batching of routine AI analyses for the asyncio worker.
+
+Escalated readings that triage did not find urgent wait up to
+ANALYSIS_BATCH_WAIT_MS for others to arrive and are then assessed together
+in one multi-patient OpenRouter request of at most ANALYSIS_BATCH_SIZE
+cases. Urgent readings (triage decision 'abnormal') are never queued; they
+go out immediately in a request of their own, so batching cannot delay
+them.
+"""
+import asyncio
+import logging
+from django.conf import settings
+from cardiocare import metrics
+from cardiocare.http_client import CircuitOpenError
+from . import analysis_cache
+from .analysis_cache import analysis_fingerprint
+from .tasks import (
+    build_openrouter_batch_request, build_openrouter_request, fallback_analysis,
+    parse_openrouter_batch_response
+)
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ['analysis_batch.requests', 'analysis_batch.cases', 'analysis_batch.urgent', 'analysis_batch.missing']
+
+
+def is_urgent(health_data):
+    return health_data.get('triage', {}).get('decision') == 'abnormal'
+
+
+class AnalysisBatcher:
+    def __init__(self, client, call_single, max_size=None, max_wait_ms=None):
+        self.client = client
+        self.call_single = call_single  # async (client, health_data) -> analysis result
+        self.max_size = max_size or settings.ANALYSIS_BATCH_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.ANALYSIS_BATCH_WAIT_MS) / 1000.0
+        self.pending = []  # (health_data, fingerprint, future)
+        self.timer = None
+        self.sending = set()
+
+    async def submit(self, health_data):
+        """Analysis result for one escalated reading"""
+        if not settings.OPENROUTER_API_KEY or self.max_size < 2:
+            return await self.call_single(self.client, health_data)
+        if is_urgent(health_data):
+            metrics.increment('analysis_batch.urgent')
+            return await self.call_single(self.client, health_data)
+
+        _, payload = build_openrouter_request(health_data)
+        fingerprint = analysis_fingerprint(payload)
+        cached = await analysis_cache.alookup(fingerprint)
+        if cached:
+            return cached
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((health_data, fingerprint, future))
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_wait, self.flush)
+        return await future
+
+    def flush(self):
+        """Send everything queued so far as one request"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def _send(self, batch):
+        try:
+            if len(batch) == 1:
+                health_data, _, future = batch[0]
+                future.set_result(await self.call_single(self.client, health_data))
+                return
+
+            results = await self._request([health_data for health_data, _, _ in batch])
+            missing = []
+            for (health_data, fingerprint, future), result in zip(batch, results):
+                if result is None:
+                    missing.append((health_data, future))
+                else:
+                    future.set_result(await analysis_cache.astore(fingerprint, result))
+
+            if missing:
+                # Cases the model skipped are retried on their own
+                metrics.increment('analysis_batch.missing', len(missing))
+                answers = await asyncio.gather(*(self.call_single(self.client, hd) for hd, _ in missing))
+                for (_, future), answer in zip(missing, answers):
+                    future.set_result(answer)
+
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                logger.error(f"Error in analysis batch: {str(e)}")
+            for health_data, _, future in batch:
+                if not future.done():
+                    future.set_result(fallback_analysis(health_data))
+
+    async def _request(self, cases):
+        metrics.increment('analysis_batch.requests')
+        metrics.increment('analysis_batch.cases', len(cases))
+        headers, payload = build_openrouter_batch_request(cases)
+        response = await self.client.post(settings.OPENROUTER_URL, headers=headers, json=payload)
+        response.raise_for_status()
+        return parse_openrouter_batch_response(response.json(), len(cases))
+
+    async def aclose(self):
+        self.flush()
+        if self.sending:
+            await asyncio.gather(*self.sending, return_exceptions=True)
+
+
+def batch_stats():
+    counters = metrics.get_counters(COUNTERS)
+    requests = counters['analysis_batch.requests']
+    return {
+        'average_batch': round(counters['analysis_batch.cases'] / requests, 2) if requests else None,
+        **counters,
+    }
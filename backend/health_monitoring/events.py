@@ -0,0 +1,232 @@
+"""Per-user server-sent events for the dashboard.
+
+publish() runs on the write paths (vitals.py, alerts.py). Once the
+transaction commits it appends the event to the user's Redis stream, capped
+at EVENTS_STREAM_MAXLEN entries, and announces it on a pub/sub channel. The
+stream entry id is the SSE event id, so a reconnecting client sending
+Last-Event-ID gets everything it missed replayed from the stream.
+
+Each ASGI process keeps a single pattern subscription (EventBroker) and
+fans announcements out to its connected clients, so any web or worker
+process can publish to clients connected anywhere. A dropped subscription is
+re-established with backoff, after which every client replays the stream
+from the last event it sent. Without EVENTS_REDIS_URL publishing is a no-op
+and clients keep polling the REST endpoints.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from cardiocare import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PATTERN = 'events:user:*'
+
+COUNTERS = ['events.published', 'events.connections', 'events.overflows', 'events.reconnects']
+
+# Put on a client's queue when it falls too far behind; the client must refetch
+OVERFLOW = object()
+# Put on every client's queue once a lost subscription is back; the client replays what it missed
+RECONNECTED = object()
+
+# Seconds before resubscribing after the pub/sub connection drops, doubling up to the maximum
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+
+_redis = None
+
+
+def stream_key(user_id):
+    return f'events:stream:{user_id}'
+
+
+def channel(user_id):
+    return f'events:user:{user_id}'
+
+
+def _client():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.EVENTS_REDIS_URL, decode_responses=True)
+    return _redis
+
+
+def publish(user_id, event_type, data):
+    """Send an event to the user's connected clients after the current transaction commits"""
+    if not settings.EVENTS_REDIS_URL:
+        return
+    transaction.on_commit(lambda: _publish_now(user_id, event_type, data))
+
+
+def _publish_now(user_id, event_type, data):
+    try:
+        payload = json.dumps(data, cls=DjangoJSONEncoder)
+        client = _client()
+        event_id = client.xadd(
+            stream_key(user_id),
+            {'type': event_type, 'data': payload},
+            maxlen=settings.EVENTS_STREAM_MAXLEN,
+            approximate=True
+        )
+        client.publish(channel(user_id), json.dumps({'id': event_id, 'type': event_type, 'data': payload}))
+        metrics.increment('events.published')
+    except redis.RedisError as e:
+        # Push is best effort: clients resynchronize over REST when they reconnect
+        logger.warning(f"Error publishing {event_type} event for user {user_id}: {str(e)}")
+
+
+def _event_key(event_id):
+    milliseconds, sequence = event_id.split('-')
+    return int(milliseconds), int(sequence)
+
+
+def format_event(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'
+
+
+class EventBroker:
+    """One pub/sub subscription per process, fanned out to local client queues"""
+
+    def __init__(self, url=None):
+        self.redis = aioredis.Redis.from_url(url or settings.EVENTS_REDIS_URL, decode_responses=True)
+        self.subscribers = defaultdict(set)
+        self.listener = None
+
+    def subscribe(self, user_id):
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.create_task(self._listen())
+        queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        self.subscribers[user_id].discard(queue)
+        if not self.subscribers[user_id]:
+            del self.subscribers[user_id]
+
+    def _deliver(self, user_id, item):
+        for queue in list(self.subscribers.get(user_id, ())):
+            if queue.full():
+                # Slow client: stop feeding it and let it resync
+                self.subscribers[user_id].discard(queue)
+                metrics.increment('events.overflows')
+                queue.get_nowait()
+                queue.put_nowait(OVERFLOW)
+            else:
+                queue.put_nowait(item)
+
+    async def _listen(self):
+        """Fan out announcements for as long as the process runs, resubscribing after a drop"""
+        delay = RECONNECT_DELAY
+        subscribed_before = False
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe(CHANNEL_PATTERN)
+                if subscribed_before:
+                    metrics.increment('events.reconnects')
+                    for user_id in list(self.subscribers):
+                        self._deliver(user_id, RECONNECTED)
+                subscribed_before = True
+                delay = RECONNECT_DELAY
+                async for message in pubsub.listen():
+                    if message['type'] != 'pmessage':
+                        continue
+                    user_id = int(message['channel'].rsplit(':', 1)[1])
+                    self._deliver(user_id, json.loads(message['data']))
+            except redis.RedisError as e:
+                logger.warning(f"Event subscription lost, retrying in {delay}s: {str(e)}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                except redis.RedisError:
+                    pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    async def replay(self, user_id, last_event_id):
+        """Events after ``last_event_id``, or None if some were already trimmed"""
+        first = await self.redis.xrange(stream_key(user_id), count=1)
+        if first and _event_key(first[0][0]) > _event_key(last_event_id):
+            return None
+        entries = await self.redis.xrange(stream_key(user_id), min=f'({last_event_id}')
+        return [{'id': event_id, **fields} for event_id, fields in entries]
+
+
+async def _missed(broker, user_id, last_event_id):
+    """Stream entries after ``last_event_id``, or None when the client has to resync"""
+    if not last_event_id:
+        return None
+    try:
+        return await broker.replay(user_id, last_event_id)
+    except (ValueError, redis.RedisError):
+        return None
+
+
+_brokers = {}
+
+
+def get_broker():
+    """The broker for the running event loop"""
+    loop = asyncio.get_running_loop()
+    broker = _brokers.get(loop)
+    if broker is None:
+        broker = _brokers[loop] = EventBroker()
+    return broker
+
+
+async def event_stream(user_id, last_event_id=None):
+    """SSE body for one client: missed events first, then live ones"""
+    broker = get_broker()
+    queue = broker.subscribe(user_id)
+    metrics.increment('events.connections')
+    try:
+        yield f'retry: {settings.EVENTS_RETRY_MS}\n\n'
+
+        if last_event_id:
+            missed = await _missed(broker, user_id, last_event_id)
+            if missed is None:
+                yield 'event: resync\ndata: {}\n\n'
+                last_event_id = None
+            else:
+                for event in missed:
+                    yield format_event(event['id'], event['type'], event['data'])
+                    last_event_id = event['id']
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=settings.EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+
+            if event is OVERFLOW:
+                yield 'event: resync\ndata: {}\n\n'
+                return
+            if event is RECONNECTED:
+                # Announcements sent while the subscription was down are only in the stream
+                missed = await _missed(broker, user_id, last_event_id)
+                if missed is None:
+                    yield 'event: resync\ndata: {}\n\n'
+                    continue
+                for event in missed:
+                    yield format_event(event['id'], event['type'], event['data'])
+                    last_event_id = event['id']
+                continue
+            # Already sent during replay
+            if last_event_id and _event_key(event['id']) <= _event_key(last_event_id):
+                continue
+            yield format_event(event['id'], event['type'], event['data'])
+            last_event_id = event['id']
+    finally:
+        broker.unsubscribe(user_id, queue)
+
+
+def event_stats():
+    return metrics.get_counters(COUNTERS)
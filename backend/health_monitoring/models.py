@@ -1,8 +1,111 @@
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import F, OuterRef, Subquery, Window
+from django.db.models.functions import RowNumber
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+import numpy as np
+from .signal import analyze_waveform
+from .waveform import (
+    DEFAULT_GAIN, DEFAULT_LEAD, DEFAULT_SAMPLE_RATE, SAMPLE_FORMATS,
+    pack_waveform, read_archive, unpack_waveform, waveform_fields
+)
 
 User = get_user_model()
 
+# data_type -> keys in HealthData.value copied to (primary_value, secondary_value)
+NUMERIC_VALUE_FIELDS = {
+    'heart_rate': ('bpm', None),
+    'blood_pressure': ('systolic', 'diastolic'),
+    'spo2': ('percentage', None),
+    'temperature': ('fahrenheit', None),
+    'steps': ('count', None),
+    'sleep': ('minutes', None),
+    'weight': ('kg', None),
+}
+
+def numeric_value(value, key):
+    """A number from a HealthData.value dict, or None"""
+    if key is None or not isinstance(value, dict):
+        return None
+    try:
+        number = float(value.get(key))
+    except (TypeError, ValueError):
+        return None
+    return number if np.isfinite(number) else None
+
+def numeric_values(data_type, value):
+    """(primary_value, secondary_value) for a reading; see NUMERIC_VALUE_FIELDS"""
+    primary_key, secondary_key = NUMERIC_VALUE_FIELDS.get(data_type, (None, None))
+    return numeric_value(value, primary_key), numeric_value(value, secondary_key)
+
+class CoveringIndex(models.Index):
+    """Index with INCLUDE columns that are only handed to the schema editor.
+
+    The schema editor leaves them out on backends without covering indexes,
+    and no model carries ``include`` for models.W040 to flag on SQLite.
+    """
+
+    def __init__(self, *args, covering=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.covering = tuple(covering)
+
+    def deconstruct(self):
+        path, args, kwargs = super().deconstruct()
+        kwargs['covering'] = self.covering
+        return path, args, kwargs
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        index = self.clone()
+        index.include = self.covering
+        return super(CoveringIndex, index).create_sql(model, schema_editor, using=using, **kwargs)
+
+class HealthDataQuerySet(models.QuerySet):
+    def latest_per_type(self, user, data_types=None):
+        """Latest reading of each data type for a user, fetched in one query.
+
+        Uses DISTINCT ON for PostgreSQL, a ROW_NUMBER() window where the
+        backend supports it, and a correlated subquery otherwise. Returns a
+        dict mapping data_type to HealthData.
+        """
+        queryset = self.filter(user=user)
+        if data_types:
+            queryset = queryset.filter(data_type__in=data_types)
+
+        connection = connections[self.db]
+        if connection.vendor == 'postgresql':
+            latest = queryset.order_by('data_type', '-recorded_at', '-id').distinct('data_type')
+        elif connection.features.supports_over_clause:
+            latest = queryset.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F('data_type'),
+                    order_by=[F('recorded_at').desc(), F('id').desc()],
+                )
+            ).filter(row_number=1)
+        else:
+            newest = self.model.objects.filter(
+                user=user, data_type=OuterRef('data_type')
+            ).order_by('-recorded_at', '-id').values('pk')[:1]
+            latest = queryset.filter(pk=Subquery(newest))
+
+        return {reading.data_type: reading for reading in latest}
+
+    def threshold(self, data_type, below=None, above=None, since=None, secondary=False):
+        """Readings of a type whose typed value is below or above a limit.
+
+        e.g. ``threshold('spo2', below=92, since=now - timedelta(hours=1))``;
+        runs on health_data_threshold_idx instead of decoding JSON.
+        """
+        column = 'secondary_value' if secondary else 'primary_value'
+        queryset = self.filter(data_type=data_type)
+        if since is not None:
+            queryset = queryset.filter(recorded_at__gte=since)
+        if below is not None:
+            queryset = queryset.filter(**{f'{column}__lt': below})
+        if above is not None:
+            queryset = queryset.filter(**{f'{column}__gt': above})
+        return queryset
+
 class HealthData(models.Model):
     DATA_TYPES = [
         ('heart_rate', 'Heart Rate'),
@@ -18,27 +121,267 @@ class HealthData(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='health_data')
     data_type = models.CharField(max_length=20, choices=DATA_TYPES)
     value = models.JSONField()  # Store flexible health data
+    # Typed copies of the main numbers in value (see NUMERIC_VALUE_FIELDS), set on save
+    primary_value = models.FloatField(null=True, blank=True)
+    secondary_value = models.FloatField(null=True, blank=True)
     unit = models.CharField(max_length=20)
     source = models.CharField(max_length=50)  # google_fit, apple_health, manual
     recorded_at = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = HealthDataQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-recorded_at']
         indexes = [
-            models.Index(fields=['user', 'data_type', 'recorded_at']),
+            # INCLUDE makes the latest-value lookup index-only on PostgreSQL. The unbounded
+            # value JSON stays out: a large one would exceed the btree row size limit.
+            CoveringIndex(
+                fields=['user', 'data_type', '-recorded_at'],
+                covering=['unit', 'source', 'primary_value', 'secondary_value'],
+                name='health_data_latest_idx',
+            ),
+            # Threshold queries such as "SpO2 below 92 in the last hour"
+            models.Index(
+                fields=['data_type', 'recorded_at', 'primary_value'],
+                name='health_data_threshold_idx',
+            ),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'data_type', 'source', 'recorded_at'],
+                name='unique_health_data_reading',
+            ),
+        ]
+
+    def fill_numeric_values(self):
+        """Copy the typed numbers out of value; bulk_create callers must call this themselves"""
+        self.primary_value, self.secondary_value = numeric_values(self.data_type, self.value)
+
+    def save(self, *args, **kwargs):
+        self.fill_numeric_values()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'value' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'primary_value', 'secondary_value'}
+        super().save(*args, **kwargs)
 
 class ECGReading(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ecg_readings')
-    waveform_data = models.JSONField()  # Array of ECG values
+    waveform_data = models.JSONField(null=True, blank=True)  # Legacy array of ECG values, see pack_ecg_waveforms
+    waveform_blob = models.BinaryField(null=True, blank=True)  # Packed samples, see waveform.py
+    archive_path = models.CharField(max_length=255, blank=True)  # Set once the blob moved to ECG_ARCHIVE_DIR (see retention.py)
+    sample_format = models.CharField(max_length=10, default='int16')
+    sample_rate = models.IntegerField(default=DEFAULT_SAMPLE_RATE)  # in Hz
+    sample_count = models.IntegerField(default=0)
+    gain = models.FloatField(default=DEFAULT_GAIN)  # ADC counts per mV
+    lead = models.CharField(max_length=10, default=DEFAULT_LEAD)
     heart_rate = models.IntegerField()
     duration = models.IntegerField()  # in seconds
     quality_score = models.FloatField(default=0.0)
     anomalies_detected = models.JSONField(default=list)
+    session = models.ForeignKey('ECGSession', on_delete=models.SET_NULL, null=True, blank=True, related_name='readings')
     recorded_at = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Latest ECG per user; on a partitioned table only the newest partition is read
+            models.Index(fields=['user', '-recorded_at'], name='ecg_reading_latest_idx'),
+        ]
+
+    @property
+    def waveform(self):
+        """Samples in mV as a float32 NumPy array"""
+        if self.waveform_blob is not None:
+            return unpack_waveform(self.waveform_blob, self.sample_format, self.gain)
+        if self.archive_path:
+            return unpack_waveform(read_archive(self.archive_path), self.sample_format, self.gain)
+        return np.asarray(self.waveform_data or [], dtype=np.float32)
+
+    def set_waveform(self, samples, sample_rate=None, gain=None, lead=None):
+        """Store samples in packed form and update the header fields"""
+        if sample_rate is None:
+            sample_rate = self.sample_rate or DEFAULT_SAMPLE_RATE
+        if sample_rate <= 0:
+            raise ValueError('sample_rate must be positive')
+        fields = waveform_fields(
+            samples,
+            sample_rate=sample_rate,
+            gain=gain or self.gain or DEFAULT_GAIN,
+            lead=lead or self.lead or DEFAULT_LEAD,
+        )
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.duration = self.sample_count // self.sample_rate
+
+    def process_signal(self):
+        """Derive heart rate, quality and anomalies from the stored samples.
+
+        The detected heart rate replaces the client-reported one when beats
+        could be found. Returns the full feature dict from signal.analyze_waveform.
+        """
+        features = analyze_waveform(self.waveform, self.sample_rate)
+        if features['heart_rate'] is not None:
+            self.heart_rate = features['heart_rate']
+        self.quality_score = features['quality_score']
+        self.anomalies_detected = features['anomalies']
+        return features
+
+class ECGSessionConflict(Exception):
+    """A chunk that cannot be applied in the session's current state"""
+
+class ECGSession(models.Model):
+    """A continuous recording streamed in sequence-numbered chunks"""
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('closed', 'Closed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ecg_sessions')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    sample_rate = models.IntegerField(default=DEFAULT_SAMPLE_RATE)  # in Hz
+    gain = models.FloatField(default=DEFAULT_GAIN)  # ADC counts per mV
+    lead = models.CharField(max_length=10, default=DEFAULT_LEAD)
+    window_seconds = models.IntegerField(default=30)  # rolling analysis window
+    heart_rate = models.IntegerField(default=0)  # latest device-reported value
+    next_sequence = models.IntegerField(default=0)
+    sample_count = models.IntegerField(default=0)
+    analyzed_samples = models.IntegerField(default=0)  # samples already handed to analysis
+    started_at = models.DateTimeField(auto_now_add=True)
+    last_chunk_at = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        constraints = [
+            # A zero window would never stop claiming windows, a zero rate divides by zero in analysis
+            models.CheckConstraint(
+                check=models.Q(sample_rate__gt=0, window_seconds__gt=0, gain__gt=0),
+                name='ecg_session_positive_parameters',
+            ),
+        ]
+
+    @property
+    def window_samples(self):
+        return self.window_seconds * self.sample_rate
+
+    def append_chunk(self, sequence, samples=None, payload=None, sample_format='int16', heart_rate=None):
+        """Append one chunk without touching earlier ones.
+
+        Chunks must arrive in order. A resent chunk whose sequence number is
+        already stored is acknowledged as a duplicate. Returns (chunk, created).
+        """
+        if sequence < 0:
+            raise ValueError('sequence must not be negative')
+
+        with transaction.atomic():
+            session = ECGSession.objects.select_for_update().get(pk=self.pk)
+
+            if sequence < session.next_sequence:
+                chunk = session.chunks.filter(sequence=sequence).first()
+                if chunk is None:
+                    # Chunks of closed sessions are removed by retention
+                    raise ECGSessionConflict(f'Chunk {sequence} is no longer stored')
+                return chunk, False
+            if session.status != 'open':
+                raise ECGSessionConflict('Session is closed')
+            if sequence > session.next_sequence:
+                raise ECGSessionConflict(f'Expected chunk {session.next_sequence}, got {sequence}')
+
+            if payload is None:
+                payload, sample_format, count = pack_waveform(samples, session.gain)
+            else:
+                itemsize = SAMPLE_FORMATS[sample_format].itemsize
+                if len(payload) % itemsize:
+                    raise ValueError(f'Payload is not a whole number of {sample_format} samples')
+                count = len(payload) // itemsize
+
+            chunk = ECGChunk.objects.create(
+                session=session,
+                sequence=sequence,
+                start_sample=session.sample_count,
+                sample_count=count,
+                sample_format=sample_format,
+                payload=payload,
+            )
+
+            updates = {
+                'next_sequence': sequence + 1,
+                'sample_count': F('sample_count') + count,
+                'last_chunk_at': timezone.now(),
+            }
+            if heart_rate is not None:
+                updates['heart_rate'] = heart_rate
+            ECGSession.objects.filter(pk=self.pk).update(**updates)
+
+        self.next_sequence = sequence + 1
+        self.sample_count = session.sample_count + count
+        return chunk, True
+
+    def claim_windows(self, final=False):
+        """Reserve every complete analysis window not yet handed out.
+
+        With ``final`` the trailing partial window is claimed as well, as long
+        as it holds at least one second of signal. Returns (start, end) sample
+        ranges.
+        """
+        with transaction.atomic():
+            session = ECGSession.objects.select_for_update().get(pk=self.pk)
+            start = session.analyzed_samples
+            windows = []
+
+            while session.sample_count - start >= session.window_samples:
+                windows.append((start, start + session.window_samples))
+                start += session.window_samples
+
+            if final and session.sample_count - start >= session.sample_rate:
+                windows.append((start, session.sample_count))
+                start = session.sample_count
+
+            if windows:
+                ECGSession.objects.filter(pk=self.pk).update(analyzed_samples=start)
+
+        self.analyzed_samples = start
+        return windows
+
+    def read_samples(self, start, end):
+        """Samples in mV for the half-open range [start, end)"""
+        chunks = self.chunks.filter(
+            start_sample__lt=end,
+            start_sample__gt=start - F('sample_count'),
+        ).order_by('sequence')
+
+        parts = [unpack_waveform(chunk.payload, chunk.sample_format, self.gain) for chunk in chunks]
+        if not parts:
+            return np.zeros(0, dtype=np.float32)
+
+        first_start = chunks[0].start_sample
+        samples = np.concatenate(parts)
+        return samples[start - first_start:end - first_start]
+
+    def close(self):
+        """Close the session and return the remaining windows to analyze"""
+        ECGSession.objects.filter(pk=self.pk, status='open').update(
+            status='closed', closed_at=timezone.now()
+        )
+        self.status = 'closed'
+        return self.claim_windows(final=True)
+
+class ECGChunk(models.Model):
+    session = models.ForeignKey(ECGSession, on_delete=models.CASCADE, related_name='chunks')
+    sequence = models.IntegerField()
+    start_sample = models.IntegerField()  # offset of the first sample in the session
+    sample_count = models.IntegerField()
+    sample_format = models.CharField(max_length=10, default='int16')
+    payload = models.BinaryField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'sequence'], name='unique_ecg_chunk_sequence'),
+        ]
+
 class AIAnalysis(models.Model):
     RISK_LEVELS = [
         ('low', 'Low Risk'),
@@ -55,12 +398,78 @@ class AIAnalysis(models.Model):
     confidence_score = models.FloatField()
     recommendations = models.JSONField(default=list)
     time_to_emergency = models.CharField(max_length=50, null=True, blank=True)
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True)  # Hash of the model request, see analysis_cache.py
+    served_from_cache = models.BooleanField(default=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
 
+class CurrentVitals(models.Model):
+    """Latest value of each dashboard metric, one row per user.
+
+    Maintained on write by health_monitoring.vitals so the dashboard reads a
+    single row instead of scanning HealthData.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='current_vitals')
+    heart_rate = models.FloatField(null=True, blank=True)  # bpm
+    heart_rate_at = models.DateTimeField(null=True, blank=True)
+    systolic = models.FloatField(null=True, blank=True)  # mmHg
+    diastolic = models.FloatField(null=True, blank=True)  # mmHg
+    blood_pressure_at = models.DateTimeField(null=True, blank=True)
+    spo2 = models.FloatField(null=True, blank=True)  # percent
+    spo2_at = models.DateTimeField(null=True, blank=True)
+    temperature = models.FloatField(null=True, blank=True)  # fahrenheit
+    temperature_at = models.DateTimeField(null=True, blank=True)
+    ecg_heart_rate = models.IntegerField(null=True, blank=True)
+    ecg_recorded_at = models.DateTimeField(null=True, blank=True)
+    risk_level = models.CharField(max_length=10, choices=AIAnalysis.RISK_LEVELS, null=True, blank=True)
+    risk_assessed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class HealthDataRollup(models.Model):
+    """Aggregate of one numeric field of HealthData.value over a time bucket.
+
+    Maintained on write by health_monitoring.rollups. The histogram counts
+    values rounded to the field's precision (keys are bin numbers), so
+    buckets merge exactly and percentiles come out at that precision.
+    """
+    RESOLUTIONS = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='health_rollups')
+    data_type = models.CharField(max_length=20, choices=HealthData.DATA_TYPES)
+    field = models.CharField(max_length=20)  # key in HealthData.value, e.g. bpm or systolic
+    resolution = models.CharField(max_length=10, choices=RESOLUTIONS)
+    bucket_start = models.DateTimeField()  # UTC
+    count = models.IntegerField()
+    total = models.FloatField()
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+    histogram = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['bucket_start']
+        indexes = [
+            # Expiry of a whole resolution by age (see retention.py)
+            models.Index(fields=['resolution', 'bucket_start'], name='health_rollup_expiry_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'data_type', 'resolution', 'bucket_start', 'field'],
+                name='unique_health_data_rollup',
+            ),
+        ]
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
 class HealthAlert(models.Model):
     ALERT_TYPES = [
         ('emergency', 'Emergency'),
@@ -88,12 +497,28 @@ class HealthAlert(models.Model):
     # Emergency response
     emergency_call_initiated = models.BooleanField(default=False)
     contacts_notified = models.BooleanField(default=False)
+    notified_severity = models.CharField(max_length=10, blank=True)  # Highest severity contacts were told about
+    
+    # Coalescing, see alerts.py
+    occurrences = models.PositiveIntegerField(default=1)
+    last_triggered_at = models.DateTimeField(null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     resolved_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'alert_type', 'status', '-last_triggered_at'], name='health_alert_active_idx'),
+            # Keyset pages of the alerts endpoint
+            models.Index(fields=['user', '-created_at', '-id'], name='health_alert_page_idx'),
+        ]
+
+class AlertTrigger(models.Model):
+    """Idempotency key of an event already folded into an alert"""
+    key = models.CharField(max_length=255, unique=True)
+    alert = models.ForeignKey(HealthAlert, on_delete=models.CASCADE, related_name='triggers')
+    created_at = models.DateTimeField(auto_now_add=True)
 
 class HealthHistoryMessage(models.Model):
     MESSAGE_TYPES = [
@@ -110,3 +535,7 @@ class HealthHistoryMessage(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pages of the history endpoint
+            models.Index(fields=['user', '-timestamp', '-id'], name='health_history_page_idx'),
+        ]
@@ -0,0 +1,182 @@
+"""Monthly range partitions of HealthData and ECGReading on PostgreSQL.
+
+convert_to_partitioned() rebuilds a table once as PARTITION BY RANGE
+(recorded_at). It has one partition per month and a DEFAULT partition for
+outliers. The primary key becomes (id, recorded_at) because PostgreSQL needs
+the partition key in every unique index. All other indexes and constraints
+keep their names, so the ORM and later migrations see the same table. Each
+partition has its own indexes. Writes and recent reads only touch the newest
+ones, and retention drops whole partitions instead of deleting rows, so index
+size and vacuum work stay flat as history grows.
+
+Nothing references these tables by foreign key, so the conversion is local
+to each table. Only PostgreSQL is supported (see supported()); elsewhere
+retention.py keeps the tables bounded by deleting rows instead.
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+from django.db import connection, transaction
+from .models import ECGReading, HealthData
+
+PARTITIONED_MODELS = (HealthData, ECGReading)
+PARTITION_KEY = 'recorded_at'
+
+
+def supported():
+    return connection.vendor == 'postgresql'
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y%m}'
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def is_partitioned(model):
+    if not supported():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [model._meta.db_table]
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions(model):
+    """(name, month start, month end) of each monthly partition, oldest first"""
+    table = model._meta.db_table
+    pattern = re.compile(rf'^{re.escape(table)}_p(\d{{4}})(\d{{2}})$')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    result = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)
+            result.append((name, month, add_months(month, 1)))
+    return sorted(result, key=lambda partition: partition[1])
+
+
+def create_partition(model, month):
+    """Create the partition for ``month``, moving its rows out of the DEFAULT partition"""
+    table = model._meta.db_table
+    name = partition_name(table, month)
+    lower, upper = month.isoformat(), add_months(month, 1).isoformat()
+    with transaction.atomic(), connection.cursor() as cursor:
+        # PostgreSQL refuses a new partition while DEFAULT holds rows in its range
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE partition_move AS "
+            f"WITH moved AS (DELETE FROM {_quote(table + '_default')} "
+            f"WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *) SELECT * FROM moved",
+            [lower, upper]
+        )
+        cursor.execute(
+            f"CREATE TABLE {_quote(name)} PARTITION OF {_quote(table)} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        )
+        cursor.execute(f"INSERT INTO {_quote(table)} SELECT * FROM partition_move")
+        cursor.execute("DROP TABLE partition_move")
+    return name
+
+
+def ensure_partitions(model, now, months_ahead):
+    """Create any missing partitions from this month to ``months_ahead`` months out"""
+    existing = {month for _, month, _ in partitions(model)}
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(month_start(now), offset)
+        if month not in existing:
+            created.append(create_partition(model, month))
+    return created
+
+
+def drop_partitions_before(model, cutoff):
+    """Detach and drop every partition that ends at or before ``cutoff``"""
+    table = model._meta.db_table
+    dropped = []
+    for name, month, end in partitions(model):
+        if end > cutoff:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {_quote(table)} DETACH PARTITION {_quote(name)}")
+            cursor.execute(f"DROP TABLE {_quote(name)}")
+        dropped.append((name, month, end))
+    return dropped
+
+
+def convert_to_partitioned(model, now, months_ahead):
+    """Rebuild a plain table as a monthly partitioned one, keeping every row.
+
+    Runs in one transaction under an exclusive lock, so writers wait for
+    the copy. Run it in a maintenance window on large tables.
+    """
+    table = model._meta.db_table
+    legacy = f'{table}_unpartitioned'
+    sequence = f'{table}_id_seq'
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {_quote(table)} IN ACCESS EXCLUSIVE MODE")
+        # Secondary indexes and constraints are rebuilt on the new parent under the same names
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)",
+            [table, table]
+        )
+        index_definitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('c', 'f', 'u')",
+            [table]
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(f"SELECT min({PARTITION_KEY}), max(id) FROM {_quote(table)}")
+        first, last_id = cursor.fetchone()
+
+        cursor.execute(f"ALTER TABLE {_quote(table)} RENAME TO {_quote(legacy)}")
+        cursor.execute(
+            f"CREATE TABLE {_quote(table)} (LIKE {_quote(legacy)} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE ({PARTITION_KEY})"
+        )
+        cursor.execute(f"CREATE TABLE {_quote(table + '_default')} PARTITION OF {_quote(table)} DEFAULT")
+        month = month_start(first or now)
+        last_month = add_months(month_start(now), months_ahead)
+        while month <= last_month:
+            cursor.execute(
+                f"CREATE TABLE {_quote(partition_name(table, month))} PARTITION OF {_quote(table)} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            )
+            month = add_months(month, 1)
+
+        cursor.execute(f"INSERT INTO {_quote(table)} SELECT * FROM {_quote(legacy)}")
+        # The identity sequence goes with the old table; ids continue from a plain sequence
+        cursor.execute(f"DROP TABLE {_quote(legacy)}")
+        cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {_quote(sequence)} OWNED BY {_quote(table)}.id")
+        cursor.execute("SELECT setval(%s, %s, %s)", [sequence, last_id or 1, last_id is not None])
+        cursor.execute(f"ALTER TABLE {_quote(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+
+        cursor.execute(
+            f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(table + '_pkey')} "
+            f"PRIMARY KEY (id, {PARTITION_KEY})"
+        )
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {_quote(table)} ADD CONSTRAINT {_quote(name)} {definition}")
+        for definition in index_definitions:
+            cursor.execute(definition)
@@ -0,0 +1,188 @@
+"""Compact, token-budgeted inputs for the OpenRouter analysis prompt.
+
+Raw waveforms cost thousands of tokens the model cannot use. An ECG reading
+is summarized into rhythm features plus downsampled representative beats,
+and recent vitals into per-metric statistics. If the rendered prompt would
+exceed AI_PROMPT_TOKEN_BUDGET, the least important sections are dropped,
+then the longest remaining lists and strings are cut until it fits.
+"""
+import json
+import logging
+import re
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from .models import NUMERIC_VALUE_FIELDS, HealthData
+from .signal import BEAT_WINDOW, beat_windows, qrs_duration
+
+BEAT_SAMPLE_RATE = 50  # Hz for the representative beats sent to the model
+OUTLIER_CORRELATION = 0.9  # beats less similar than this to the median beat are shown too
+
+TREND_HOURS = 24
+TREND_TYPES = ['heart_rate', 'blood_pressure', 'spo2', 'temperature']
+
+# Sections removed, in order, until the prompt fits the budget
+TRIM_ORDER = [
+    ('ecg', 'representative_beats', 'outlier'),
+    ('vitals_trend',),
+    ('ecg', 'representative_beats'),
+    ('ecg', 'hrv'),
+]
+
+MIN_TRUNCATED_TEXT = 32  # characters; shorter strings are left whole
+
+_TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """Rough BPE token count: words, digit runs and punctuation each count once.
+
+    Tends to over-count English slightly, which keeps budgets conservative.
+    """
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def _downsample(beat, sample_rate):
+    step = max(int(round(sample_rate / BEAT_SAMPLE_RATE)), 1)
+    usable = beat[:beat.size - beat.size % step]
+    return np.round(usable.reshape(-1, step).mean(axis=1), 2).tolist()
+
+
+def _rr_stats(rr_ms):
+    if not rr_ms:
+        return None
+    rr = np.asarray(rr_ms)
+    return {
+        'mean': round(float(rr.mean()), 1),
+        'sd': round(float(rr.std()), 1),
+        'min': round(float(rr.min()), 1),
+        'max': round(float(rr.max()), 1),
+    }
+
+
+def ecg_summary(ecg_reading, features):
+    """Feature vector for one reading, from analyze_waveform output"""
+    summary = {
+        'lead': ecg_reading.lead,
+        'duration_s': ecg_reading.duration,
+        'heart_rate': features['heart_rate'],
+        'beat_count': features['beat_count'],
+        'rr_ms': _rr_stats(features['rr_intervals_ms']),
+        'hrv': features['hrv'],
+        'qrs_ms': None,
+        'quality_score': features['quality_score'],
+        'anomalies': features['anomalies'],
+    }
+
+    beats = beat_windows(ecg_reading.waveform, ecg_reading.sample_rate, features['r_peaks'])
+    if len(beats):
+        median_beat = np.median(beats, axis=0)
+        summary['qrs_ms'] = qrs_duration(median_beat, ecg_reading.sample_rate)
+        summary['representative_beats'] = {
+            'sample_rate': BEAT_SAMPLE_RATE,
+            'start_ms': -int(BEAT_WINDOW[0] * 1000),
+            'median': _downsample(median_beat, ecg_reading.sample_rate),
+        }
+        if len(beats) > 2:
+            correlation = np.array([np.corrcoef(beat, median_beat)[0, 1] for beat in beats])
+            least_typical = int(np.argmin(correlation))
+            if correlation[least_typical] < OUTLIER_CORRELATION:
+                summary['representative_beats']['outlier'] = _downsample(beats[least_typical], ecg_reading.sample_rate)
+
+    return summary
+
+
+def vitals_trend(user_id, now=None, hours=TREND_HOURS):
+    """Count, latest, range, mean and change of each vital over the last ``hours``"""
+    now = now or timezone.now()
+    rows = (
+        HealthData.objects
+        .filter(user_id=user_id, data_type__in=TREND_TYPES, recorded_at__gte=now - timedelta(hours=hours))
+        .order_by('recorded_at')
+        .values_list('data_type', 'primary_value', 'secondary_value')
+    )
+
+    series = {}
+    for data_type, primary, secondary in rows:
+        primary_key, secondary_key = NUMERIC_VALUE_FIELDS[data_type]
+        for field, number in ((primary_key, primary), (secondary_key, secondary)):
+            if field is not None and number is not None:
+                # 'heart_rate' rather than 'bpm'; blood pressure keeps systolic/diastolic
+                name = field if secondary_key else data_type
+                series.setdefault(name, []).append(number)
+
+    trend = {}
+    for field, values in series.items():
+        values = np.asarray(values, dtype=np.float64)
+        trend[field] = {
+            'count': int(values.size),
+            'latest': round(float(values[-1]), 1),
+            'min': round(float(values.min()), 1),
+            'max': round(float(values.max()), 1),
+            'mean': round(float(values.mean()), 1),
+            'change': round(float(values[-1] - values[0]), 1),
+        }
+    return trend
+
+
+def render_inputs(inputs):
+    return json.dumps(inputs, separators=(',', ':'), default=str)
+
+
+def _shrinkable(node, parent=None, key=None):
+    """(size, parent, key) of every list with more than one item and every long string below ``node``"""
+    if isinstance(node, dict):
+        for child_key, child in node.items():
+            yield from _shrinkable(child, node, child_key)
+    elif isinstance(node, list):
+        if len(node) > 1:
+            yield len(render_inputs(node)), parent, key
+        for index, child in enumerate(node):
+            yield from _shrinkable(child, node, index)
+    elif isinstance(node, str) and len(node) > MIN_TRUNCATED_TEXT and parent is not None:
+        yield len(node), parent, key
+
+
+def _shrink(inputs):
+    """Halve the largest list or string in ``inputs``, or drop its largest section. False once empty."""
+    candidates = list(_shrinkable(inputs))
+    if candidates:
+        _, parent, key = max(candidates, key=lambda candidate: candidate[0])
+        value = parent[key]
+        parent[key] = value[:len(value) // 2] if isinstance(value, list) else value[:len(value) // 2] + '...'
+        return True
+    if inputs:
+        inputs.pop(max(inputs, key=lambda name: len(render_inputs(inputs[name]))))
+        return True
+    return False
+
+
+def fit_to_budget(inputs, fixed_tokens=0, budget=None):
+    """Copy of ``inputs`` cut down to the budget.
+
+    Sections are dropped in TRIM_ORDER first. Whatever is still too large is
+    then truncated, so the budget is a hard cap on the inputs.
+    """
+    budget = budget or settings.AI_PROMPT_TOKEN_BUDGET
+    inputs = json.loads(render_inputs(inputs))
+
+    def fits():
+        return fixed_tokens + estimate_tokens(render_inputs(inputs)) <= budget
+
+    for path in TRIM_ORDER:
+        if fits():
+            return inputs
+        parent = inputs
+        for key in path[:-1]:
+            parent = parent.get(key) or {}
+        parent.pop(path[-1], None)
+
+    while not fits():
+        if not _shrink(inputs):
+            logger.warning(f"Prompt instructions alone ({fixed_tokens} tokens) exceed AI_PROMPT_TOKEN_BUDGET ({budget})")
+            break
+
+    return inputs
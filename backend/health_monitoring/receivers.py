@@ -0,0 +1,17 @@
+"""Cached-response invalidation for alert writes.
+
+Covers every write that goes through Model.save() or delete(). Bulk writers
+skip signals and drop the cache themselves (see accounts/csv_sync.py
+refresh_users).
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from cardiocare.cache import ALERTS, invalidate
+from .models import HealthAlert
+
+
+@receiver([post_save, post_delete], sender=HealthAlert)
+def alert_changed(sender, instance, **kwargs):
+    # After commit, so a concurrent request cannot cache the old rows again
+    transaction.on_commit(lambda: invalidate(ALERTS, instance.user_id))
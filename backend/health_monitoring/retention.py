@@ -0,0 +1,152 @@
+"""Retention policy for the time-series tables.
+
+Ages are set in settings (None keeps a tier forever):
+
+- Raw HealthData, HEALTH_DATA_RETENTION_DAYS. Expiring rows are first folded
+  into the minute/hour/day rollups (rollups.rollup_range). Then they are
+  removed, so trends keep their statistics after the samples are gone.
+- Rollups, HEALTH_ROLLUP_RETENTION_DAYS per resolution. Minute buckets go
+  first, day buckets are normally kept.
+- ECG strips, ECG_WAVEFORM_RETENTION_DAYS. The packed samples of older
+  readings move to gzip files under ECG_ARCHIVE_DIR. The row keeps its
+  header, heart rate and anomalies, and ECGReading.waveform reads the file
+  back. Chunks of sessions closed before the cutoff are deleted; the
+  session's readings already hold every analysed window.
+
+On a partitioned PostgreSQL table (see partitions.py) the raw cutoff is
+rounded down to a month and expired months are dropped as whole partitions.
+Elsewhere rows are deleted in id-ordered batches, which keeps each
+transaction short.
+"""
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from . import partitions
+from .models import ECGChunk, ECGReading, HealthData, HealthDataRollup
+from .rollups import ROLLUP_FIELDS, bucket_start, raw_retention_start, rollup_range
+from .waveform import write_archive
+
+DELETE_BATCH_SIZE = 5000
+ARCHIVE_BATCH_SIZE = 200
+
+
+def _delete_in_batches(queryset):
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('id').values_list('id', flat=True)[:DELETE_BATCH_SIZE])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(id__in=ids).delete()[0]
+
+
+def downsample_health_data(cutoff):
+    """Bring the rollups of every raw row older than ``cutoff`` up to date.
+
+    ``cutoff`` must be day-aligned. Returns the number of minute buckets
+    written.
+    """
+    expiring = (
+        HealthData.objects
+        .filter(recorded_at__lt=cutoff, data_type__in=list(ROLLUP_FIELDS))
+        .values('user_id', 'data_type')
+        .annotate(first=Min('recorded_at'))
+        .order_by()
+    )
+    return sum(
+        rollup_range(group['user_id'], group['data_type'], bucket_start(group['first'], 'day'), cutoff)
+        for group in expiring
+    )
+
+
+def expire_health_data(now):
+    cutoff = raw_retention_start(now)
+    if cutoff is None:
+        return {}
+
+    partitioned = partitions.is_partitioned(HealthData)
+    if partitioned:
+        cutoff = partitions.month_start(cutoff)
+
+    stats = {'cutoff': cutoff.isoformat(), 'rolled_up_minutes': downsample_health_data(cutoff)}
+    if partitioned:
+        stats['dropped_partitions'] = [name for name, _, _ in partitions.drop_partitions_before(HealthData, cutoff)]
+    # On a partitioned table only the DEFAULT partition can still hold expired rows
+    stats['deleted'] = _delete_in_batches(HealthData.objects.filter(recorded_at__lt=cutoff))
+    return stats
+
+
+def expire_rollups(now):
+    stats = {}
+    for resolution, days in settings.HEALTH_ROLLUP_RETENTION_DAYS.items():
+        if days is not None:
+            stats[resolution] = _delete_in_batches(HealthDataRollup.objects.filter(
+                resolution=resolution,
+                bucket_start__lt=now - timedelta(days=days)
+            ))
+    return stats
+
+
+def archive_path(reading):
+    return os.path.join(
+        str(reading.user_id), f'{reading.recorded_at:%Y-%m}', f'{reading.id}.{reading.sample_format}.gz'
+    )
+
+
+def archive_ecg_waveforms(now):
+    """Move the samples of ECG readings past retention to compressed files"""
+    days = settings.ECG_WAVEFORM_RETENTION_DAYS
+    if days is None:
+        return {}
+    cutoff = now - timedelta(days=days)
+
+    pending = ECGReading.objects.filter(recorded_at__lt=cutoff, archive_path='').order_by('id')
+    archived = 0
+    last_id = 0
+    while True:
+        batch = list(pending.filter(id__gt=last_id)[:ARCHIVE_BATCH_SIZE])
+        if not batch:
+            break
+
+        for reading in batch:
+            if reading.waveform_blob is None:
+                # Legacy JSON rows are packed on the way out
+                reading.set_waveform(reading.waveform_data or [], sample_rate=reading.sample_rate)
+            write_archive(archive_path(reading), bytes(reading.waveform_blob))
+            reading.archive_path = archive_path(reading)
+            reading.waveform_blob = None
+            reading.waveform_data = None
+
+        # The files are in place before any row points at them
+        with transaction.atomic():
+            ECGReading.objects.bulk_update(batch, [
+                'archive_path', 'waveform_blob', 'waveform_data', 'sample_format', 'sample_count', 'gain', 'lead',
+            ])
+
+        archived += len(batch)
+        last_id = batch[-1].id
+
+    chunks = _delete_in_batches(ECGChunk.objects.filter(session__status='closed', session__closed_at__lt=cutoff))
+    return {'cutoff': cutoff.isoformat(), 'archived': archived, 'deleted_chunks': chunks}
+
+
+def maintain_partitions(now):
+    """Create the coming months' partitions of every partitioned table"""
+    created = []
+    for model in partitions.PARTITIONED_MODELS:
+        if partitions.is_partitioned(model):
+            created += partitions.ensure_partitions(model, now, settings.PARTITION_MONTHS_AHEAD)
+    return created
+
+
+def apply_retention(now=None):
+    """Run every retention step once. Returns per-step statistics."""
+    now = now or timezone.now()
+    return {
+        'partitions_created': maintain_partitions(now),
+        'health_data': expire_health_data(now),
+        'rollups': expire_rollups(now),
+        'ecg': archive_ecg_waveforms(now),
+    }
@@ -0,0 +1,405 @@
+"""Minute, hour and day rollups of HealthData.
+
+Each typed value of HealthData (primary_value, secondary_value) is
+summarized per user, data type and UTC bucket as count, sum, min, max and a
+histogram at the field's precision (see ROLLUP_FIELDS). Percentiles come from the histogram, so they
+are exact to that precision and stay exact when buckets are merged.
+
+record_rollups() runs on the write path. It recomputes only the buckets the
+new rows fall into: minute buckets from the raw rows, hour buckets from
+minutes, day buckets from hours. Where the level below has already been
+expired, a bucket is summed from the raw rows instead. Work is proportional to the buckets
+touched, and the result is the same however often it runs. A per-user row
+lock serializes concurrent writers. rebuild_rollups() does the same for a
+whole time range, one chunk at a time, and backs the backfill_rollups
+command.
+
+Trend queries read one resolution (see choose_resolution), so a long range
+costs one row per bucket rather than one per sample. Past the day level's
+reach in HEALTH_TRENDS_MAX_POINTS buckets, day rollups are merged into
+multi-day points (see bucket_step). Rollups outlive the raw
+rows (see retention.py); each resolution has its own retention in
+HEALTH_ROLLUP_RETENTION_DAYS.
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from .models import NUMERIC_VALUE_FIELDS, HealthData, HealthDataRollup
+
+User = get_user_model()
+
+# Bucket width in seconds, finest first
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Each coarser level is built from the one below it
+SOURCE_RESOLUTION = {'hour': 'minute', 'day': 'hour'}
+
+# data_type -> {field in HealthData.value: histogram precision}
+ROLLUP_FIELDS = {
+    'heart_rate': {'bpm': 1},
+    'blood_pressure': {'systolic': 1, 'diastolic': 1},
+    'spo2': {'percentage': 1},
+    'temperature': {'fahrenheit': 0.1},
+    'steps': {'count': 100},
+    'sleep': {'minutes': 1},
+    'weight': {'kg': 0.1},
+}
+
+PERCENTILES = (50, 95)
+
+BACKFILL_CHUNK_DAYS = 31
+WRITE_BATCH_SIZE = 1000
+WINDOWS_PER_QUERY = 100  # OR-ed time ranges per statement; SQLite caps expression depth at 1000
+
+
+def bucket_start(moment, resolution):
+    seconds = RESOLUTIONS[resolution]
+    timestamp = int(moment.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=dt_timezone.utc)
+
+
+def _decimals(precision):
+    text = repr(float(precision)).rstrip('0').rstrip('.')
+    return len(text.split('.')[1]) if '.' in text else 0
+
+
+class Summary:
+    """Count, sum, min, max and histogram of one field in one bucket"""
+
+    def __init__(self, precision):
+        self.precision = precision
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.histogram = Counter()
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        self.histogram[round(value / self.precision)] += 1
+
+    def merge(self, rollup):
+        self.count += rollup.count
+        self.total += rollup.total
+        self.minimum = rollup.minimum if self.minimum is None else min(self.minimum, rollup.minimum)
+        self.maximum = rollup.maximum if self.maximum is None else max(self.maximum, rollup.maximum)
+        for bin_number, count in rollup.histogram.items():
+            self.histogram[int(bin_number)] += count
+
+    def percentile(self, percent):
+        """Nearest-rank percentile at the histogram's precision"""
+        if not self.count:
+            return None
+        rank = max(math.ceil(percent / 100 * self.count), 1)
+        seen = 0
+        for bin_number in sorted(self.histogram):
+            seen += self.histogram[bin_number]
+            if seen >= rank:
+                return round(float(bin_number * self.precision), _decimals(self.precision))
+        return self.maximum
+
+    def as_dict(self):
+        digits = _decimals(self.precision) + 1
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, digits) if self.count else None,
+            'min': self.minimum,
+            'max': self.maximum,
+            **{f'p{percent}': self.percentile(percent) for percent in PERCENTILES},
+        }
+
+    def model_fields(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'minimum': self.minimum,
+            'maximum': self.maximum,
+            'histogram': {str(bin_number): count for bin_number, count in sorted(self.histogram.items())},
+        }
+
+
+def _field_values(data_type, primary, secondary):
+    fields = ROLLUP_FIELDS[data_type]
+    for field, number in zip(NUMERIC_VALUE_FIELDS[data_type], (primary, secondary)):
+        if field in fields and number is not None:
+            yield field, number
+
+
+def _retention_start(resolution, now=None):
+    """Moment before which ``resolution``'s rollups may have been expired, or None if they are kept"""
+    days = settings.HEALTH_ROLLUP_RETENTION_DAYS.get(resolution)
+    if days is None:
+        return None
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def _windows(starts, seconds):
+    """Merge bucket starts into contiguous [start, end) windows"""
+    windows = []
+    width = timedelta(seconds=seconds)
+    for start in sorted(starts):
+        if windows and windows[-1][1] == start:
+            windows[-1][1] = start + width
+        else:
+            windows.append([start, start + width])
+    return windows
+
+
+def _within(name, windows):
+    condition = Q()
+    for start, end in windows:
+        condition |= Q(**{f'{name}__gte': start, f'{name}__lt': end})
+    return condition
+
+
+def _recompute(user_id, data_type, resolution, windows):
+    """Rebuild every bucket of ``resolution`` inside ``windows`` from the level below"""
+    return sum(
+        _recompute_windows(user_id, data_type, resolution, windows[i:i + WINDOWS_PER_QUERY])
+        for i in range(0, len(windows), WINDOWS_PER_QUERY)
+    )
+
+
+def _recompute_windows(user_id, data_type, resolution, windows):
+    precision = ROLLUP_FIELDS[data_type]
+    summaries = {}
+
+    def summary(field, start):
+        key = (field, start)
+        if key not in summaries:
+            summaries[key] = Summary(precision[field])
+        return summaries[key]
+
+    # A coarser bucket is merged from the level below while that level is still retained;
+    # older ones (a backdated reading, say) are summed from the raw rows again
+    raw_windows, source_windows = windows, []
+    if resolution != 'minute':
+        cutoff = _retention_start(SOURCE_RESOLUTION[resolution])
+        raw_windows = [window for window in windows if cutoff and window[0] < cutoff]
+        source_windows = [window for window in windows if not cutoff or window[0] >= cutoff]
+
+    if raw_windows:
+        rows = (
+            HealthData.objects
+            .filter(_within('recorded_at', raw_windows), user_id=user_id, data_type=data_type)
+            .values_list('recorded_at', 'primary_value', 'secondary_value')
+        )
+        for recorded_at, primary, secondary in rows.iterator(chunk_size=2000):
+            start = bucket_start(recorded_at, resolution)
+            for field, number in _field_values(data_type, primary, secondary):
+                summary(field, start).add(number)
+    if source_windows:
+        rows = HealthDataRollup.objects.filter(
+            _within('bucket_start', source_windows),
+            user_id=user_id,
+            data_type=data_type,
+            resolution=SOURCE_RESOLUTION[resolution],
+            field__in=list(precision)
+        )
+        for rollup in rows.iterator(chunk_size=2000):
+            summary(rollup.field, bucket_start(rollup.bucket_start, resolution)).merge(rollup)
+
+    existing = {
+        (rollup.field, rollup.bucket_start): rollup
+        for rollup in HealthDataRollup.objects.filter(
+            _within('bucket_start', windows),
+            user_id=user_id,
+            data_type=data_type,
+            resolution=resolution
+        )
+    }
+
+    now = timezone.now()
+    to_create = []
+    to_update = []
+    for (field, start), values in summaries.items():
+        rollup = existing.pop((field, start), None)
+        if rollup is None:
+            to_create.append(HealthDataRollup(
+                user_id=user_id,
+                data_type=data_type,
+                field=field,
+                resolution=resolution,
+                bucket_start=start,
+                **values.model_fields()
+            ))
+        else:
+            for name, value in values.model_fields().items():
+                setattr(rollup, name, value)
+            rollup.updated_at = now
+            to_update.append(rollup)
+
+    HealthDataRollup.objects.bulk_create(to_create, batch_size=WRITE_BATCH_SIZE)
+    HealthDataRollup.objects.bulk_update(
+        to_update,
+        ['count', 'total', 'minimum', 'maximum', 'histogram', 'updated_at'],
+        batch_size=WRITE_BATCH_SIZE
+    )
+    # Buckets whose rows are gone
+    if existing:
+        HealthDataRollup.objects.filter(id__in=[rollup.id for rollup in existing.values()]).delete()
+
+    return len(summaries)
+
+
+def _refresh(user_id, data_type, minute_starts):
+    for resolution, seconds in RESOLUTIONS.items():
+        starts = {bucket_start(start, resolution) for start in minute_starts}
+        _recompute(user_id, data_type, resolution, _windows(starts, seconds))
+
+
+def _lock_users(user_ids):
+    # Serializes rollup writers per user so a bucket is never rebuilt from a stale view
+    for user_id in sorted(user_ids):
+        User.objects.select_for_update().only('id').get(id=user_id)
+
+
+def record_rollups(readings):
+    """Refresh the rollups of the buckets newly written HealthData rows fall into.
+
+    Buckets older than the raw retention window are left alone, as in
+    rebuild_rollups(): their other rows may already be expired.
+    """
+    floor = raw_retention_start()
+    touched = defaultdict(set)
+    for reading in readings:
+        if reading.data_type in ROLLUP_FIELDS and (floor is None or reading.recorded_at >= floor):
+            touched[(reading.user_id, reading.data_type)].add(bucket_start(reading.recorded_at, 'minute'))
+    if not touched:
+        return
+
+    with transaction.atomic():
+        _lock_users({user_id for user_id, _ in touched})
+        for (user_id, data_type), minute_starts in touched.items():
+            _refresh(user_id, data_type, minute_starts)
+
+
+def raw_retention_start(now=None):
+    """Oldest moment raw HealthData is kept for, day-aligned, or None"""
+    days = settings.HEALTH_DATA_RETENTION_DAYS
+    if days is None:
+        return None
+    return bucket_start((now or timezone.now()) - timedelta(days=days), 'day')
+
+
+def rollup_range(user_id, data_type, start, end):
+    """Recompute every resolution over the day-aligned range [start, end) from the raw rows.
+
+    Returns the number of minute buckets written.
+    """
+    written = 0
+    with transaction.atomic():
+        _lock_users([user_id])
+        while start < end:
+            chunk_end = min(start + timedelta(days=BACKFILL_CHUNK_DAYS), end)
+            for resolution in RESOLUTIONS:
+                count = _recompute(user_id, data_type, resolution, [[start, chunk_end]])
+                if resolution == 'minute':
+                    written += count
+            start = chunk_end
+    return written
+
+
+def rebuild_rollups(user_id, data_types=None, since=None):
+    """Recompute a user's rollups from the raw rows, a chunk of days at a time.
+
+    Covers everything from ``since`` (or the first reading) onwards and
+    removes rollups left behind by deleted rows. Rollups older than the raw
+    retention window are left alone: their rows were expired, not deleted.
+    Returns the number of minute buckets written.
+    """
+    floor = raw_retention_start()
+    if since:
+        since = bucket_start(since, 'day')
+    if floor and (since is None or since < floor):
+        since = floor
+
+    written = 0
+    for data_type in data_types or ROLLUP_FIELDS:
+        readings = HealthData.objects.filter(user_id=user_id, data_type=data_type)
+        stale = HealthDataRollup.objects.filter(user_id=user_id, data_type=data_type)
+        if since:
+            readings = readings.filter(recorded_at__gte=since)
+            stale = stale.filter(bucket_start__gte=since)
+
+        bounds = readings.aggregate(first=Min('recorded_at'), last=Max('recorded_at'))
+        if bounds['first'] is None:
+            stale.delete()
+            continue
+
+        with transaction.atomic():
+            _lock_users([user_id])
+            first_day = bucket_start(bounds['first'], 'day')
+            end = bucket_start(bounds['last'], 'day') + timedelta(days=1)
+            # Rollups outside the data's range belong to rows that no longer exist
+            stale.filter(Q(bucket_start__lt=first_day) | Q(bucket_start__gte=end)).delete()
+            written += rollup_range(user_id, data_type, first_day, end)
+
+    return written
+
+
+def choose_resolution(start, end, max_points=None):
+    """Finest retained resolution that covers [start, end) in at most ``max_points`` buckets"""
+    max_points = max_points or settings.HEALTH_TRENDS_MAX_POINTS
+    span = (end - start).total_seconds()
+    now = timezone.now()
+    for resolution, seconds in RESOLUTIONS.items():
+        days = settings.HEALTH_ROLLUP_RETENTION_DAYS.get(resolution)
+        if days is not None and start < now - timedelta(days=days):
+            continue
+        if span / seconds <= max_points:
+            return resolution
+    return 'day'
+
+
+def trend_queryset(user_id, data_type, resolution, start, end):
+    return HealthDataRollup.objects.filter(
+        user_id=user_id,
+        data_type=data_type,
+        resolution=resolution,
+        bucket_start__gte=bucket_start(start, resolution),
+        bucket_start__lt=end
+    ).order_by('bucket_start')
+
+
+def bucket_step(resolution, start, end, max_points=None):
+    """Number of ``resolution`` buckets merged into each trend point, so [start, end) fits ``max_points``"""
+    max_points = max_points or settings.HEALTH_TRENDS_MAX_POINTS
+    buckets = math.ceil((end - start).total_seconds() / RESOLUTIONS[resolution])
+    return max(math.ceil(buckets / max_points), 1)
+
+
+def summarize_trend(data_type, rollups, point_seconds=None, origin=None):
+    """Per-field points and an overall summary for the API, from rollup rows.
+
+    With ``point_seconds`` consecutive rollups are merged into points that
+    wide, counted from ``origin``; histograms merge exactly, so percentiles do too.
+    """
+    precision = ROLLUP_FIELDS[data_type]
+    fields = {}
+    for rollup in rollups:
+        entry = fields.setdefault(rollup.field, {'summary': Summary(precision[rollup.field]), 'points': {}})
+        start = rollup.bucket_start
+        if point_seconds:
+            start = origin + timedelta(seconds=(start - origin).total_seconds() // point_seconds * point_seconds)
+        point = entry['points'].get(start)
+        if point is None:
+            point = entry['points'][start] = Summary(precision[rollup.field])
+        point.merge(rollup)
+        entry['summary'].merge(rollup)
+
+    return {
+        field: {
+            'summary': entry['summary'].as_dict(),
+            'points': [{'bucket_start': start.isoformat(), **point.as_dict()} for start, point in entry['points'].items()],
+        }
+        for field, entry in fields.items()
+    }
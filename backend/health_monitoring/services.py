@@ -0,0 +1,218 @@
+from collections import defaultdict
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import numpy as np
+from .models import HealthData
+from .rollups import raw_retention_start, record_rollups
+from .vitals import record_health_data
+
+# Required numeric fields inside HealthData.value and their plausible range
+VALUE_FIELDS = {
+    'heart_rate': [('bpm', 20, 300)],
+    'blood_pressure': [('systolic', 50, 300), ('diastolic', 20, 200)],
+    'spo2': [('percentage', 50, 100)],
+    'temperature': [('fahrenheit', 86, 113)],
+    'steps': [('count', 0, 200000)],
+    'sleep': [('minutes', 0, 1440)],
+    'weight': [('kg', 1, 500)],
+    'ecg': [],
+}
+
+DEFAULT_UNITS = {
+    'heart_rate': 'bpm',
+    'blood_pressure': 'mmHg',
+    'spo2': 'percent',
+    'temperature': 'fahrenheit',
+    'steps': 'count',
+    'sleep': 'minutes',
+    'weight': 'kg',
+    'ecg': 'mV',
+}
+
+BULK_BATCH_SIZE = 1000
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _normalize_value(data_type, value):
+    """Fill derived fields clients commonly leave out"""
+    if data_type == 'temperature' and 'fahrenheit' not in value and 'celsius' in value:
+        celsius = _as_float(value['celsius'])
+        if not np.isnan(celsius):
+            value = {**value, 'fahrenheit': round(celsius * 9 / 5 + 32, 1)}
+    return value
+
+
+def text_field_errors(name, value):
+    """Messages for a free-text field that is not a string or does not fit its column"""
+    if not isinstance(value, str):
+        return [f'{name} must be a string']
+    max_length = HealthData._meta.get_field(name).max_length
+    if len(value) > max_length:
+        return [f'{name} must be at most {max_length} characters']
+    return []
+
+
+def validate_health_readings(readings, default_source='manual'):
+    """Validate raw reading dicts.
+
+    Structural checks run per item; numeric range checks run once per
+    data_type over NumPy arrays. Returns (rows, errors) where ``rows`` maps
+    input index to cleaned field values and ``errors`` maps index to a list
+    of messages.
+    """
+    rows = {}
+    errors = defaultdict(list)
+    by_type = defaultdict(list)
+    # Older rows would land in windows retention has already folded into rollups
+    retention_start = raw_retention_start()
+
+    for index, reading in enumerate(readings):
+        if not isinstance(reading, dict):
+            errors[index].append('Reading must be an object')
+            continue
+
+        data_type = reading.get('data_type')
+        value = reading.get('value')
+        recorded_at = reading.get('recorded_at')
+
+        # Membership tests need a hashable value; a list or object here must not fail the batch
+        if not isinstance(data_type, str) or data_type not in VALUE_FIELDS:
+            errors[index].append(f'Unknown data_type: {data_type}')
+        if not isinstance(value, dict):
+            errors[index].append('value must be an object')
+
+        text = {
+            'unit': reading.get('unit') or DEFAULT_UNITS.get(data_type) if isinstance(data_type, str) else reading.get('unit'),
+            'source': reading.get('source') or default_source,
+        }
+        for name, text_value in text.items():
+            for message in text_field_errors(name, text_value) if text_value else ():
+                errors[index].append(message)
+
+        try:
+            parsed_at = parse_datetime(recorded_at) if isinstance(recorded_at, str) else None
+        except ValueError:
+            # Well-formed but impossible, such as February 30th
+            parsed_at = None
+        if parsed_at is None:
+            errors[index].append('recorded_at must be an ISO 8601 datetime')
+        else:
+            if timezone.is_naive(parsed_at):
+                parsed_at = timezone.make_aware(parsed_at)
+            if retention_start and parsed_at < retention_start:
+                errors[index].append('recorded_at is older than the retention window')
+
+        if index in errors:
+            continue
+
+        rows[index] = {
+            'data_type': data_type,
+            'value': _normalize_value(data_type, value),
+            'unit': text['unit'],
+            'source': text['source'],
+            'recorded_at': parsed_at,
+        }
+        by_type[data_type].append(index)
+
+    for data_type, indexes in by_type.items():
+        index_array = np.asarray(indexes)
+        for field, low, high in VALUE_FIELDS[data_type]:
+            values = np.fromiter(
+                (_as_float(rows[i]['value'].get(field)) for i in indexes),
+                dtype=np.float64,
+                count=len(indexes),
+            )
+            missing = np.isnan(values)
+            out_of_range = ~missing & ((values < low) | (values > high))
+
+            for i in index_array[missing]:
+                errors[int(i)].append(f'value.{field} is required and must be numeric')
+            for i in index_array[out_of_range]:
+                errors[int(i)].append(f'value.{field} must be between {low} and {high}')
+
+    for index in errors:
+        rows.pop(index, None)
+
+    return rows, dict(errors)
+
+
+def _duplicates(user, rows):
+    """Indexes of ``rows`` already stored, or repeating an earlier row, on (data_type, source, recorded_at)"""
+    duplicates = set()
+    if not rows:
+        return duplicates
+
+    recorded = [row['recorded_at'] for row in rows.values()]
+    existing = set(
+        HealthData.objects.filter(
+            user=user,
+            data_type__in={row['data_type'] for row in rows.values()},
+            recorded_at__gte=min(recorded),
+            recorded_at__lte=max(recorded),
+        ).values_list('data_type', 'source', 'recorded_at')
+    )
+    seen = set()
+    for index, row in rows.items():
+        key = (row['data_type'], row['source'], row['recorded_at'])
+        if key in existing or key in seen:
+            duplicates.add(index)
+        seen.add(key)
+    return duplicates
+
+
+def bulk_ingest_health_data(user, readings, default_source='manual'):
+    """Validate, deduplicate and insert a batch of HealthData readings.
+
+    Duplicates are detected on the natural key (data_type, source,
+    recorded_at) both inside the batch and against stored rows. Returns one
+    status entry per input item, in input order.
+    """
+    rows, errors = validate_health_readings(readings, default_source)
+    duplicates = _duplicates(user, rows)
+
+    with transaction.atomic():
+        while True:
+            to_create = [
+                HealthData(user=user, **row)
+                for index, row in rows.items()
+                if index not in duplicates
+            ]
+            # bulk_create skips save(), which fills the typed value columns
+            for reading in to_create:
+                reading.fill_numeric_values()
+            try:
+                with transaction.atomic():
+                    HealthData.objects.bulk_create(to_create, batch_size=BULK_BATCH_SIZE)
+                break
+            except IntegrityError:
+                # Another request stored some of these readings since the lookup; they are duplicates too
+                found = _duplicates(user, rows)
+                if found == duplicates:
+                    raise
+                duplicates = found
+
+        record_health_data(to_create)
+        record_rollups(to_create)
+
+    results = []
+    for index in range(len(readings)):
+        if index in errors:
+            results.append({'index': index, 'status': 'rejected', 'errors': errors[index]})
+        elif index in duplicates:
+            results.append({'index': index, 'status': 'duplicate'})
+        else:
+            results.append({'index': index, 'status': 'accepted'})
+
+    return {
+        'accepted': len(to_create),
+        'duplicates': len(duplicates),
+        'rejected': len(errors),
+        'results': results,
+    }
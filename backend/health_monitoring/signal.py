@@ -0,0 +1,195 @@
+"""ECG signal processing: filtering, R-peak detection, heart rate and HRV.
+
+Everything here is NumPy-vectorized and runs in a few milliseconds on a
+30 second strip, so it is cheap enough to call inline at ingestion time.
+"""
+import numpy as np
+
+MIN_DURATION = 2.0  # seconds of signal needed for beat detection
+REFRACTORY = 0.2  # seconds; no two R-peaks closer than this
+INTEGRATION_WINDOW = 0.15  # seconds, Pan-Tompkins moving-window integration
+PEAK_SEARCH = 0.08  # seconds either side of an integrated peak to locate the R-peak
+
+# Plausible RR intervals (seconds); anything outside is treated as noise
+MIN_RR = 0.3
+MAX_RR = 2.0
+
+TACHYCARDIA_BPM = 100
+BRADYCARDIA_BPM = 50
+PAUSE_SECONDS = 2.0
+IRREGULAR_RR_CV = 0.15  # coefficient of variation of RR intervals
+LOW_QUALITY = 0.6
+
+BEAT_WINDOW = (0.25, 0.45)  # seconds kept before and after each R-peak
+QRS_SEARCH = 0.1  # seconds either side of the R-peak searched for QRS on/offset
+
+
+def _frequency_filter(samples, sample_rate, low=None, high=None):
+    """Zero-phase FFT filter keeping the band [low, high] Hz"""
+    spectrum = np.fft.rfft(samples)
+    freqs = np.fft.rfftfreq(samples.size, d=1.0 / sample_rate)
+
+    mask = np.ones(freqs.size)
+    if low is not None:
+        mask[freqs < low] = 0.0
+    if high is not None:
+        mask[freqs > high] = 0.0
+
+    return np.fft.irfft(spectrum * mask, n=samples.size)
+
+
+def remove_baseline(samples, sample_rate, cutoff=0.5):
+    """Remove baseline wander below ``cutoff`` Hz"""
+    samples = np.asarray(samples, dtype=np.float64)
+    return _frequency_filter(samples - samples.mean(), sample_rate, low=cutoff)
+
+
+def bandpass(samples, sample_rate, low=0.5, high=40.0):
+    """Band-limit the signal to the diagnostic ECG band"""
+    samples = np.asarray(samples, dtype=np.float64)
+    return _frequency_filter(samples - samples.mean(), sample_rate, low=low, high=high)
+
+
+def _local_maxima(signal, threshold):
+    middle = signal[1:-1]
+    is_peak = (middle > signal[:-2]) & (middle >= signal[2:]) & (middle > threshold)
+    return np.flatnonzero(is_peak) + 1
+
+
+def _enforce_refractory(peaks, amplitudes, min_distance):
+    """Keep the tallest peak of any group closer together than ``min_distance``"""
+    if peaks.size < 2:
+        return peaks
+
+    kept = [0]
+    for i in range(1, peaks.size):
+        if peaks[i] - peaks[kept[-1]] >= min_distance:
+            kept.append(i)
+        elif amplitudes[i] > amplitudes[kept[-1]]:
+            kept[-1] = i
+    return peaks[kept]
+
+
+def detect_r_peaks(samples, sample_rate):
+    """Pan-Tompkins style R-peak detection. Returns sample indexes."""
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.size < MIN_DURATION * sample_rate:
+        return np.zeros(0, dtype=np.int64)
+
+    filtered = bandpass(samples, sample_rate, low=5.0, high=15.0)
+
+    # Five-point derivative, squaring and moving-window integration
+    derivative = np.convolve(filtered, np.array([1, 2, 0, -2, -1]) * (sample_rate / 8.0), mode='same')
+    window = max(int(INTEGRATION_WINDOW * sample_rate), 1)
+    integrated = np.convolve(derivative ** 2, np.ones(window) / window, mode='same')
+
+    threshold = 0.3 * np.percentile(integrated, 99)
+    candidates = _local_maxima(integrated, threshold)
+    refractory = int(REFRACTORY * sample_rate)
+    candidates = _enforce_refractory(candidates, integrated[candidates], refractory)
+    if candidates.size == 0:
+        return candidates
+
+    # Move each detection onto the largest deflection of the band-limited ECG
+    ecg = np.abs(bandpass(samples, sample_rate))
+    reach = int(PEAK_SEARCH * sample_rate)
+    offsets = np.arange(-reach, reach + 1)
+    windows = np.clip(candidates[:, None] + offsets, 0, samples.size - 1)
+    r_peaks = windows[np.arange(windows.shape[0]), np.argmax(ecg[windows], axis=1)]
+
+    r_peaks = np.unique(r_peaks)
+    return _enforce_refractory(r_peaks, ecg[r_peaks], refractory)
+
+
+def hrv_metrics(rr_intervals):
+    """Time-domain HRV from RR intervals in seconds (results in ms)"""
+    if rr_intervals.size < 2:
+        return {'sdnn': None, 'rmssd': None, 'pnn50': None}
+
+    rr_ms = rr_intervals * 1000.0
+    successive = np.abs(np.diff(rr_ms))
+    return {
+        'sdnn': round(float(np.std(rr_ms, ddof=1)), 1),
+        'rmssd': round(float(np.sqrt(np.mean(successive ** 2))), 1),
+        'pnn50': round(float(np.mean(successive > 50.0) * 100.0), 1),
+    }
+
+
+def signal_quality(samples, sample_rate, r_peaks, rr_intervals):
+    """0-1 score from RR plausibility and R-peak prominence over the noise floor"""
+    if r_peaks.size < 2:
+        return 0.0
+
+    plausible = np.mean((rr_intervals >= MIN_RR) & (rr_intervals <= MAX_RR))
+
+    ecg = bandpass(samples, sample_rate)
+    noise = 1.4826 * np.median(np.abs(ecg - np.median(ecg))) + 1e-9
+    prominence = np.median(np.abs(ecg[r_peaks])) / noise
+    prominence_score = np.clip((prominence - 2.0) / 6.0, 0.0, 1.0)
+
+    return round(float(plausible * (0.5 + 0.5 * prominence_score)), 2)
+
+
+def beat_windows(samples, sample_rate, r_peaks):
+    """Band-limited beats aligned on their R-peaks, one row per complete beat"""
+    before = int(BEAT_WINDOW[0] * sample_rate)
+    after = int(BEAT_WINDOW[1] * sample_rate)
+    r_peaks = np.asarray(r_peaks, dtype=np.int64)
+    r_peaks = r_peaks[(r_peaks >= before) & (r_peaks + after <= len(samples))]
+
+    ecg = bandpass(samples, sample_rate)
+    return ecg[r_peaks[:, None] + np.arange(-before, after)]
+
+
+def qrs_duration(beat, sample_rate):
+    """QRS width in ms, estimated from the slope envelope of an aligned beat"""
+    r = int(BEAT_WINDOW[0] * sample_rate)
+    reach = int(QRS_SEARCH * sample_rate)
+    smoothing = max(int(0.02 * sample_rate), 1)
+    slope = np.convolve(np.abs(np.gradient(beat)), np.ones(smoothing) / smoothing, mode='same')
+
+    region = slope[r - reach:r + reach + 1]
+    active = region > 0.2 * region.max()
+    # Contiguous run of steep slope containing the R-peak
+    onset = reach - np.argmin(active[reach::-1]) if not active[:reach + 1].all() else 0
+    offset = reach + np.argmin(active[reach:]) if not active[reach:].all() else region.size
+    return int(round((offset - onset) * 1000.0 / sample_rate))
+
+
+def analyze_waveform(samples, sample_rate):
+    """Heart rate, HRV, signal quality and rhythm flags for one ECG strip"""
+    samples = np.asarray(samples, dtype=np.float64)
+    r_peaks = detect_r_peaks(samples, sample_rate)
+    rr_intervals = np.diff(r_peaks) / float(sample_rate)
+
+    heart_rate = None
+    instantaneous_hr = []
+    if rr_intervals.size:
+        heart_rate = int(round(60.0 / float(np.median(rr_intervals))))
+        instantaneous_hr = np.round(60.0 / rr_intervals, 1).tolist()
+
+    quality_score = signal_quality(samples, sample_rate, r_peaks, rr_intervals)
+
+    anomalies = []
+    if heart_rate is not None:
+        if heart_rate > TACHYCARDIA_BPM:
+            anomalies.append('tachycardia')
+        if heart_rate < BRADYCARDIA_BPM:
+            anomalies.append('bradycardia')
+        if rr_intervals.size >= 4 and np.std(rr_intervals) / np.mean(rr_intervals) > IRREGULAR_RR_CV:
+            anomalies.append('irregular_rhythm')
+        if rr_intervals.max() > PAUSE_SECONDS:
+            anomalies.append('pause')
+    if quality_score < LOW_QUALITY:
+        anomalies.append('low_signal_quality')
+
+    return {
+        'heart_rate': heart_rate,
+        'beat_count': int(r_peaks.size),
+        'r_peaks': r_peaks.tolist(),
+        'rr_intervals_ms': np.round(rr_intervals * 1000.0, 1).tolist(),
+        'instantaneous_hr': instantaneous_hr,
+        'hrv': hrv_metrics(rr_intervals),
+        'quality_score': quality_score,
+        'anomalies': anomalies,
+    }
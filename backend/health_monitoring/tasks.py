@@ -1,163 +1,328 @@
 from celery import shared_task
 from django.contrib.auth import get_user_model
-from .models import ECGReading, AIAnalysis, HealthAlert
-import requests
+from .models import ECGReading, ECGSession, AIAnalysis, CurrentVitals, HealthAlert
+from . import analysis_cache
+from .alerts import claim_notification, raise_emergency_alert
+from .analysis_cache import analysis_fingerprint, clinical_inputs
+from .services import bulk_ingest_health_data
+from .prompts import ecg_summary, estimate_tokens, fit_to_budget, render_inputs, vitals_trend
+from .signal import analyze_waveform
+from .triage import LOCAL_DECISIONS, local_assessment, triage
+from .vitals import record_analysis, record_ecg_reading
+from cardiocare.cache import ANALYSIS, invalidate
+from cardiocare.http_client import CircuitOpenError, get_client
+from emergency_system.notifications import notify_contacts
 import json
+from datetime import timedelta
 from django.conf import settings
 from django.utils import timezone
 
 User = get_user_model()
 
+def prepare_analysis(user_id, ecg_reading_id=None):
+    """Gather analysis inputs and run the local triage.
+
+    Returns (health_data, analysis_result); analysis_result is already set
+    when triage settled the reading and no AI call is needed.
+    """
+    User.objects.get(id=user_id)
+    
+    # Gather recent health data
+    health_data = {
+        'user_id': user_id,
+        'timestamp': timezone.now().isoformat(),
+    }
+    
+    ecg_features = None
+    if ecg_reading_id:
+        ecg_reading = ECGReading.objects.get(id=ecg_reading_id)
+        ecg_features = analyze_waveform(ecg_reading.waveform, ecg_reading.sample_rate)
+        # Summary features rather than the raw samples, see prompts.py
+        health_data['ecg'] = ecg_summary(ecg_reading, ecg_features)
+    
+    # Local pre-screen: clearly normal readings, and requests with nothing to assess, never reach the LLM
+    vitals = CurrentVitals.objects.filter(user_id=user_id).first()
+    health_data['triage'] = triage(ecg_features, vitals)
+    
+    if health_data['triage']['decision'] in LOCAL_DECISIONS:
+        return health_data, local_assessment(
+            health_data['triage'], heart_rate=ecg_features and ecg_features['heart_rate']
+        )
+    
+    health_data['vitals_trend'] = vitals_trend(user_id)
+    return health_data, None
+
+def store_analysis(user_id, health_data, analysis_result):
+    """Persist an analysis and fan out its side effects. Returns the AIAnalysis id."""
+    ai_analysis = AIAnalysis.objects.create(
+        user_id=user_id,
+        health_data=health_data,
+        risk_level=analysis_result['risk_level'],
+        analysis_result=analysis_result['analysis'],
+        prediction=analysis_result['prediction'],
+        confidence_score=analysis_result['confidence'],
+        recommendations=analysis_result['recommendations'],
+        time_to_emergency=analysis_result.get('time_to_emergency'),
+        fingerprint=analysis_result.get('fingerprint', ''),
+        served_from_cache=analysis_result.get('cached', False)
+    )
+    record_analysis(ai_analysis)
+    invalidate(ANALYSIS, user_id)
+    
+    # Check if emergency response is needed
+    if analysis_result['risk_level'] in ['high', 'critical']:
+        trigger_emergency_alert.delay(user_id, ai_analysis.id)
+    
+    return ai_analysis.id
+
 @shared_task
 def analyze_health_data(user_id, ecg_reading_id=None):
-    """Analyze health data using OpenRouter AI"""
+    """Analyze health data, escalating to OpenRouter AI only when triage can't settle it"""
     try:
-        user = User.objects.get(id=user_id)
+        health_data, analysis_result = prepare_analysis(user_id, ecg_reading_id)
+        if analysis_result is None:
+            # Call OpenRouter AI for analysis
+            analysis_result = call_openrouter_ai(health_data)
         
-        # Gather recent health data
-        health_data = {
-            'user_id': user_id,
-            'timestamp': timezone.now().isoformat(),
-        }
-        
-        if ecg_reading_id:
-            ecg_reading = ECGReading.objects.get(id=ecg_reading_id)
-            health_data['ecg'] = {
-                'waveform': ecg_reading.waveform_data,
-                'heart_rate': ecg_reading.heart_rate,
-                'duration': ecg_reading.duration
-            }
+        return store_analysis(user_id, health_data, analysis_result)
         
-        # Call OpenRouter AI for analysis
-        analysis_result = call_openrouter_ai(health_data)
-        
-        # Create AI analysis record
-        ai_analysis = AIAnalysis.objects.create(
-            user=user,
-            health_data=health_data,
-            risk_level=analysis_result['risk_level'],
-            analysis_result=analysis_result['analysis'],
-            prediction=analysis_result['prediction'],
-            confidence_score=analysis_result['confidence'],
-            recommendations=analysis_result['recommendations'],
-            time_to_emergency=analysis_result.get('time_to_emergency')
+    except Exception as e:
+        print(f"Error in analyze_health_data: {str(e)}")
+        return None
+
+def enqueue_analysis(user_id, ecg_reading_id=None):
+    """Hand an analysis to the configured executor (Celery or the async worker)"""
+    if settings.ANALYSIS_EXECUTOR == 'async':
+        from .async_worker import push_job
+        push_job(user_id, ecg_reading_id)
+    else:
+        analyze_health_data.delay(user_id, ecg_reading_id)
+
+@shared_task
+def analyze_ecg_window(session_id, start_sample, end_sample):
+    """Store one window of a streaming ECG session as a reading and analyze it"""
+    try:
+        session = ECGSession.objects.get(id=session_id)
+        
+        ecg_reading = ECGReading(
+            user_id=session.user_id,
+            session=session,
+            heart_rate=session.heart_rate,
+            recorded_at=session.started_at + timedelta(seconds=start_sample / session.sample_rate)
+        )
+        ecg_reading.set_waveform(
+            session.read_samples(start_sample, end_sample),
+            sample_rate=session.sample_rate,
+            gain=session.gain,
+            lead=session.lead
         )
+        ecg_reading.process_signal()
+        ecg_reading.save()
+        record_ecg_reading(ecg_reading)
         
-        # Check if emergency response is needed
-        if analysis_result['risk_level'] in ['high', 'critical']:
-            trigger_emergency_alert.delay(user_id, ai_analysis.id)
+        enqueue_analysis(session.user_id, ecg_reading.id)
+        return ecg_reading.id
         
-        return ai_analysis.id
+    except Exception as e:
+        print(f"Error in analyze_ecg_window: {str(e)}")
+        return None
+
+@shared_task
+def import_health_data(user_id, readings, default_source='manual'):
+    """Ingest a large batch of readings off the request path (bulk-import queue)"""
+    try:
+        user = User.objects.get(id=user_id)
+        result = bulk_ingest_health_data(user, readings, default_source=default_source)
+        print(
+            f"Bulk import for user {user.email}: "
+            f"{result['accepted']} accepted, {result['duplicates']} duplicates, {result['rejected']} rejected"
+        )
+        return result
         
     except Exception as e:
-        print(f"Error in analyze_health_data: {str(e)}")
+        print(f"Error in import_health_data: {str(e)}")
         return None
 
-def call_openrouter_ai(health_data):
-    """Call OpenRouter AI API for health analysis"""
-    if not settings.OPENROUTER_API_KEY:
-        # Return mock analysis if no API key
-        return {
-            'risk_level': 'high',
-            'analysis': 'Abnormal QRS complex indicating potential arrhythmia',
-            'prediction': 'Immediate medical attention recommended',
-            'confidence': 0.95,
-            'recommendations': [
-                'Seek immediate medical attention',
-                'Contact emergency services',
-                'Take prescribed emergency medication if available'
-            ]
-        }
-    
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    
-    headers = {
-        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    prompt = f"""
-    Analyze the following health data and provide a medical assessment:
-    
-    Health Data: {json.dumps(health_data, indent=2)}
-    
-    Please provide:
+SYSTEM_PROMPT = "You are a medical AI assistant specialized in analyzing health data and detecting emergencies."
+
+ASSESSMENT_FIELDS = """
     1. Risk level (low, medium, high, critical)
     2. Medical analysis of the data
     3. Prediction of potential health issues
     4. Confidence score (0-1)
     5. Recommendations
     6. Time to potential emergency (if applicable)
-    
-    Respond in JSON format.
-    """
+"""
+
+ECG_NOTE = """
+    ECG values are features of the strip; representative beats are in mV at
+    the given sample rate, and their first sample lies start_ms from the
+    R-peak (negative means before it).
+"""
+
+BATCH_RESPONSE_TOKENS = 600  # max_tokens allowed per case in a batched request
+
+def _openrouter_request(prompt, max_tokens=1000):
+    headers = {
+        "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }
     
     payload = {
         "model": "anthropic/claude-3-haiku",
         "messages": [
             {
                 "role": "system",
-                "content": "You are a medical AI assistant specialized in analyzing health data and detecting emergencies."
+                "content": SYSTEM_PROMPT
             },
             {
                 "role": "user",
                 "content": prompt
             }
         ],
-        "max_tokens": 1000,
+        "max_tokens": max_tokens,
         "temperature": 0.1
     }
     
+    return headers, payload
+
+def build_openrouter_request(health_data):
+    """Headers and JSON payload for an OpenRouter chat completion"""
+    instructions = """
+    Analyze the following health data and provide a medical assessment:
+    
+    Health Data: {}
+    """ + ECG_NOTE + """
+    Please provide:""" + ASSESSMENT_FIELDS + """
+    Respond in JSON format.
+    """
+    
+    # Trim the data, not the instructions, to stay within the token budget
+    inputs = fit_to_budget(clinical_inputs(health_data), estimate_tokens(SYSTEM_PROMPT + instructions))
+    return _openrouter_request(instructions.format(render_inputs(inputs)))
+
+def build_openrouter_batch_request(cases):
+    """One request assessing several patients; cases are told apart by case_id"""
+    instructions = """
+    Analyze each of the following cases independently and provide a medical
+    assessment for every one. Each case is a different patient.
+    
+    Cases: {}
+    """ + ECG_NOTE + """
+    For each case provide its case_id and:""" + ASSESSMENT_FIELDS + """
+    Respond in JSON format as {{"results": [...]}} with one object per case.
+    """
+    
+    fixed_tokens = estimate_tokens(SYSTEM_PROMPT + instructions)
+    inputs = [
+        {'case_id': case_id, **fit_to_budget(clinical_inputs(health_data), fixed_tokens)}
+        for case_id, health_data in enumerate(cases)
+    ]
+    return _openrouter_request(
+        instructions.format(render_inputs(inputs)),
+        max_tokens=BATCH_RESPONSE_TOKENS * len(cases)
+    )
+
+def _analysis_result(analysis_result):
+    return {
+        'risk_level': analysis_result.get('risk_level', 'medium'),
+        'analysis': analysis_result.get('analysis', 'Analysis completed'),
+        'prediction': analysis_result.get('prediction', 'No immediate concerns'),
+        'confidence': analysis_result.get('confidence', 0.8),
+        'recommendations': analysis_result.get('recommendations', []),
+        'time_to_emergency': analysis_result.get('time_to_emergency')
+    }
+
+def parse_openrouter_response(ai_response):
+    """Normalize an OpenRouter chat completion into an analysis result"""
+    content = ai_response['choices'][0]['message']['content']
+    
+    # Parse JSON response
+    analysis_result = json.loads(content)
+    
+    return _analysis_result(analysis_result)
+
+def parse_openrouter_batch_response(ai_response, count):
+    """Per-case results of a batched request, None where a case is missing"""
+    content = json.loads(ai_response['choices'][0]['message']['content'])
+    
+    results = [None] * count
+    for item in content.get('results', []):
+        case_id = item.get('case_id') if isinstance(item, dict) else None
+        if isinstance(case_id, int) and 0 <= case_id < count:
+            results[case_id] = _analysis_result(item)
+    return results
+
+def fallback_analysis(health_data):
+    """Analysis used when the AI call cannot be completed"""
+    if health_data.get('triage'):
+        # Escalated readings keep their rule-based severity rather than a generic default
+        return local_assessment(health_data['triage'])
+    # Return default analysis if AI fails
+    return {
+        'risk_level': 'medium',
+        'analysis': 'Unable to complete AI analysis',
+        'prediction': 'Manual review recommended',
+        'confidence': 0.5,
+        'recommendations': ['Consult healthcare provider'],
+        'time_to_emergency': None
+    }
+
+def call_openrouter_ai(health_data):
+    """Call OpenRouter AI API for health analysis"""
+    if not settings.OPENROUTER_API_KEY:
+        # Without an API key the rule-based triage result is the analysis
+        return fallback_analysis(health_data)
+    
+    headers, payload = build_openrouter_request(health_data)
+    
+    # Identical clinical inputs reuse the earlier answer instead of a paid call
+    fingerprint = analysis_fingerprint(payload)
+    cached = analysis_cache.lookup(fingerprint)
+    if cached:
+        return cached
+    
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = get_client('openrouter').post(settings.OPENROUTER_URL, headers=headers, json=payload)
         response.raise_for_status()
+        return analysis_cache.store(fingerprint, parse_openrouter_response(response.json()))
         
-        ai_response = response.json()
-        content = ai_response['choices'][0]['message']['content']
-        
-        # Parse JSON response
-        analysis_result = json.loads(content)
-        
-        return {
-            'risk_level': analysis_result.get('risk_level', 'medium'),
-            'analysis': analysis_result.get('analysis', 'Analysis completed'),
-            'prediction': analysis_result.get('prediction', 'No immediate concerns'),
-            'confidence': analysis_result.get('confidence', 0.8),
-            'recommendations': analysis_result.get('recommendations', []),
-            'time_to_emergency': analysis_result.get('time_to_emergency')
-        }
+    except CircuitOpenError:
+        # Upstream is known to be down: answer from triage without waiting on it
+        return fallback_analysis(health_data)
         
     except Exception as e:
         print(f"Error calling OpenRouter AI: {str(e)}")
-        # Return default analysis if AI fails
-        return {
-            'risk_level': 'medium',
-            'analysis': 'Unable to complete AI analysis',
-            'prediction': 'Manual review recommended',
-            'confidence': 0.5,
-            'recommendations': ['Consult healthcare provider'],
-            'time_to_emergency': None
-        }
+        return fallback_analysis(health_data)
 
 @shared_task
-def trigger_emergency_alert(user_id, ai_analysis_id):
-    """Trigger emergency alert and notifications"""
+def trigger_emergency_alert(user_id, ai_analysis_id=None, emergency_type=None, idempotency_key=None):
+    """Raise (or coalesce into) the user's emergency alert and notify contacts"""
     try:
         user = User.objects.get(id=user_id)
-        ai_analysis = AIAnalysis.objects.get(id=ai_analysis_id)
         
-        # Create health alert
-        health_alert = HealthAlert.objects.create(
-            user=user,
-            alert_type='emergency',
+        if ai_analysis_id:
+            ai_analysis = AIAnalysis.objects.get(id=ai_analysis_id)
+            severity = 'critical' if ai_analysis.risk_level == 'critical' else 'high'
+            message = ai_analysis.analysis_result
+            idempotency_key = idempotency_key or f'analysis:{ai_analysis_id}'
+        else:
+            # Manually triggered from the emergency endpoint
+            ai_analysis = None
+            severity = 'critical'
+            message = f"Emergency reported: {(emergency_type or 'cardiac_emergency').replace('_', ' ')}"
+        
+        health_alert, notify = raise_emergency_alert(
+            user_id,
+            severity,
             title='Critical Health Alert',
-            message=ai_analysis.analysis_result,
-            severity='high',
-            ai_analysis=ai_analysis
+            message=message,
+            ai_analysis=ai_analysis,
+            idempotency_key=idempotency_key
         )
         
-        # Send notifications via Twilio
-        if user.emergency_whatsapp:
+        # Send notifications via Twilio; repeats within the coalescing window only notify on escalation
+        if notify and user.emergency_whatsapp:
             send_emergency_notifications.delay(user_id, health_alert.id)
         
         return health_alert.id
@@ -170,8 +335,6 @@ def trigger_emergency_alert(user_id, ai_analysis_id):
 def send_emergency_notifications(user_id, health_alert_id):
     """Send emergency notifications via Twilio WhatsApp"""
     try:
-        from twilio.rest import Client
-        
         user = User.objects.get(id=user_id)
         health_alert = HealthAlert.objects.get(id=health_alert_id)
         
@@ -179,7 +342,10 @@ def send_emergency_notifications(user_id, health_alert_id):
             print("Twilio credentials not configured - skipping WhatsApp notifications")
             return
         
-        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        # Only one worker notifies per alert and severity, however often this task is queued
+        if not claim_notification(health_alert.id, health_alert.severity):
+            print(f"Contacts already notified for alert {health_alert.id} at {health_alert.severity} severity")
+            return
         
         # Get emergency contacts
         emergency_contacts = user.emergency_contacts.filter(is_active=True).order_by('priority')
@@ -195,20 +361,12 @@ Time: {health_alert.created_at.strftime('%Y-%m-%d %H:%M:%S')}
 This is an automated message from CardioCare AI monitoring system.
         """
         
-        for contact in emergency_contacts:
-            try:
-                message = client.messages.create(
-                    body=message_body,
-                    from_='whatsapp:+14155238886',  # Twilio WhatsApp number
-                    to=f'whatsapp:{contact.phone}'
-                )
-                print(f"WhatsApp sent to {contact.name}: {message.sid}")
-            except Exception as e:
-                print(f"Failed to send WhatsApp to {contact.name}: {str(e)}")
+        # All contacts are messaged concurrently and each attempt is logged as an EmergencyResponse
+        notify_contacts(user, emergency_contacts, message_body, health_alert=health_alert)
         
         # Mark contacts as notified
         health_alert.contacts_notified = True
-        health_alert.save()
+        health_alert.save(update_fields=['contacts_notified'])
         
     except Exception as e:
         print(f"Error in send_emergency_notifications: {str(e)}")
@@ -0,0 +1,743 @@
+import asyncio
+import json
+import tempfile
+from datetime import timedelta
+import numpy as np
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+import redis
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from cardiocare.pagination import decode_cursor, encode_cursor
+from .models import (
+    CurrentVitals, ECGReading, ECGSession, HealthAlert, HealthData, HealthDataRollup, HealthHistoryMessage
+)
+from .vitals import diff_current_vitals, rebuild_current_vitals, record_health_data
+from django.core.cache import caches
+from . import analysis_cache, async_worker, events, services
+from .alerts import claim_notification, raise_emergency_alert
+from .batching import AnalysisBatcher
+from .prompts import estimate_tokens, render_inputs
+from .retention import expire_rollups
+from .tasks import (
+    build_openrouter_request, call_openrouter_ai, fallback_analysis, prepare_analysis, trigger_emergency_alert
+)
+from .signal import analyze_waveform, detect_r_peaks, hrv_metrics
+from .waveform import (
+    csv_waveform_fields, encode_csv_waveform, pack_waveform, unpack_waveform, waveform_fields, write_archive
+)
+from .triage import local_assessment, triage, triage_stats
+from .rollups import bucket_start, bucket_step, choose_resolution, record_rollups, summarize_trend, trend_queryset
+
+User = get_user_model()
+
+
+class BackdatedRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='backdated', email='backdated@example.com')
+        self.hour = bucket_start(timezone.now() - timedelta(days=100), 'hour')
+
+    def add_readings(self, minutes):
+        readings = []
+        for minute in minutes:
+            reading = HealthData(
+                user=self.user,
+                data_type='heart_rate',
+                value={'bpm': 70},
+                unit='bpm',
+                source='manual',
+                recorded_at=self.hour + timedelta(minutes=minute)
+            )
+            reading.save()
+            readings.append(reading)
+        record_rollups(readings)
+
+    def rollup(self, resolution):
+        return HealthDataRollup.objects.get(
+            user=self.user, data_type='heart_rate', field='bpm', resolution=resolution,
+            bucket_start=bucket_start(self.hour, resolution)
+        )
+
+    def test_reading_after_minute_buckets_expired_keeps_hour_and_day(self):
+        self.add_readings(range(30))
+        expire_rollups(timezone.now())
+        self.assertFalse(HealthDataRollup.objects.filter(resolution='minute').exists())
+
+        self.add_readings([45])
+
+        self.assertEqual(self.rollup('hour').count, 31)
+        self.assertEqual(self.rollup('day').count, 31)
+
+
+class LongRangeTrendTests(TestCase):
+    def test_two_year_range_merges_day_rollups(self):
+        user = User.objects.create_user(username='trend', email='trend@example.com')
+        end = bucket_start(timezone.now(), 'day')
+        start = end - timedelta(days=730)
+        HealthDataRollup.objects.bulk_create([
+            HealthDataRollup(
+                user=user, data_type='heart_rate', field='bpm', resolution='day',
+                bucket_start=start + timedelta(days=day), count=1, total=60 + day % 2,
+                minimum=60 + day % 2, maximum=60 + day % 2, histogram={str(60 + day % 2): 1}
+            )
+            for day in range(730)
+        ])
+
+        resolution = choose_resolution(start, end)
+        step = bucket_step(resolution, start, end)
+        fields = summarize_trend(
+            'heart_rate', trend_queryset(user.id, 'heart_rate', resolution, start, end), 86400 * step, start
+        )
+
+        self.assertEqual((resolution, step), ('day', 2))
+        self.assertEqual(len(fields['bpm']['points']), 365)
+        self.assertEqual(fields['bpm']['points'][0]['count'], 2)
+        self.assertEqual(fields['bpm']['summary']['count'], 730)
+
+
+class CurrentVitalsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='vitals', email='vitals@example.com')
+        self.now = timezone.now().replace(microsecond=0)
+
+    def store(self, data_type, value, minutes_ago):
+        reading = HealthData.objects.create(
+            user=self.user, data_type=data_type, value=value, unit='', source='manual',
+            recorded_at=self.now - timedelta(minutes=minutes_ago)
+        )
+        record_health_data([reading])
+        return reading
+
+    def test_snapshot_keeps_the_newest_reading_per_type(self):
+        self.store('heart_rate', {'bpm': 72}, minutes_ago=5)
+        self.store('heart_rate', {'bpm': 90}, minutes_ago=30)
+        self.store('blood_pressure', {'systolic': 130, 'diastolic': 85}, minutes_ago=10)
+
+        vitals = CurrentVitals.objects.get(user=self.user)
+
+        self.assertEqual((vitals.heart_rate, vitals.heart_rate_at), (72, self.now - timedelta(minutes=5)))
+        self.assertEqual((vitals.systolic, vitals.diastolic), (130, 85))
+        self.assertEqual(diff_current_vitals(self.user.id), {})
+
+    def test_rebuild_repairs_a_snapshot_left_stale_by_a_direct_delete(self):
+        self.store('heart_rate', {'bpm': 90}, minutes_ago=30)
+        newest = self.store('heart_rate', {'bpm': 72}, minutes_ago=5)
+        HealthData.objects.filter(id=newest.id).delete()
+
+        self.assertEqual(diff_current_vitals(self.user.id)['heart_rate'], (72, 90))
+
+        vitals = rebuild_current_vitals(self.user.id)
+
+        self.assertEqual(vitals.heart_rate, 90)
+        self.assertEqual(CurrentVitals.objects.get(user=self.user).heart_rate, 90)
+        self.assertEqual(diff_current_vitals(self.user.id), {})
+
+
+class ECGSessionParameterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ecg', email='ecg@example.com')
+
+    def test_zero_window_is_rejected_by_the_database(self):
+        with self.assertRaises(IntegrityError):
+            ECGSession.objects.create(user=self.user, window_seconds=0)
+
+    def test_negative_sequence_is_rejected(self):
+        session = ECGSession.objects.create(user=self.user)
+        with self.assertRaises(ValueError):
+            session.append_chunk(-1, samples=[0.1, 0.2])
+
+
+class WaveformStorageTests(SimpleTestCase):
+    def test_samples_in_int16_range_round_trip_to_one_count(self):
+        samples = np.sin(np.linspace(0, 20, 2500)) * 1.5
+
+        payload, sample_format, count = pack_waveform(samples, gain=1000.0)
+
+        self.assertEqual((sample_format, count, len(payload)), ('int16', 2500, 5000))
+        np.testing.assert_allclose(unpack_waveform(payload, sample_format, 1000.0), samples, atol=0.0005)
+
+    def test_samples_beyond_int16_fall_back_to_float32(self):
+        samples = [0.1, 40.0, -0.2]
+
+        payload, sample_format, _ = pack_waveform(samples, gain=1000.0)
+
+        self.assertEqual((sample_format, len(payload)), ('float32', 12))
+        np.testing.assert_array_equal(unpack_waveform(payload, sample_format), np.float32(samples))
+
+    def test_csv_payload_and_legacy_json_array_load_the_same(self):
+        samples = [0.0, 0.25, -0.5, 1.0]
+        reading = ECGReading(**waveform_fields(samples))
+        encoded, sample_format = encode_csv_waveform(reading)
+
+        packed = csv_waveform_fields({'waveform_data': encoded, 'sample_format': sample_format})
+        legacy = csv_waveform_fields({'waveform_data': json.dumps(samples)})
+
+        self.assertEqual(packed['waveform_blob'], legacy['waveform_blob'])
+        self.assertEqual(packed['sample_count'], 4)
+
+    def test_archived_strip_is_read_back(self):
+        payload, sample_format, count = pack_waveform([0.1, 0.2, 0.3])
+        with tempfile.TemporaryDirectory() as archive_dir, self.settings(ECG_ARCHIVE_DIR=archive_dir):
+            write_archive('1/strip.i16.gz', payload)
+            reading = ECGReading(archive_path='1/strip.i16.gz', sample_format=sample_format, sample_count=count)
+
+            np.testing.assert_allclose(reading.waveform, [0.1, 0.2, 0.3], atol=0.0005)
+
+
+def synthetic_ecg(beat_times, seconds, sample_rate=250, noise=0.02):
+    """Gaussian R waves at ``beat_times`` on a wandering baseline, in mV"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    samples = 0.3 * np.sin(2 * np.pi * 0.2 * t) + np.random.default_rng(7).normal(0, noise, t.size)
+    for beat in beat_times:
+        samples += 1.2 * np.exp(-((t - beat) / 0.012) ** 2)
+    return samples
+
+
+class SignalProcessingTests(SimpleTestCase):
+    def test_regular_rhythm_gives_rate_peaks_and_no_flags(self):
+        beats = np.arange(0.5, 10, 0.8)
+
+        features = analyze_waveform(synthetic_ecg(beats, 10), 250)
+
+        self.assertEqual(features['heart_rate'], 75)
+        self.assertEqual(features['beat_count'], beats.size)
+        np.testing.assert_allclose(features['r_peaks'], np.round(beats * 250), atol=3)
+        self.assertEqual(features['anomalies'], [])
+        self.assertGreaterEqual(features['quality_score'], 0.6)
+
+    def test_fast_rhythm_and_pause_are_flagged(self):
+        fast = analyze_waveform(synthetic_ecg(np.arange(0.3, 10, 0.5), 10), 250)
+        paused = analyze_waveform(synthetic_ecg([0.5, 1.3, 2.1, 2.9, 5.9, 6.7, 7.5, 8.3], 10), 250)
+
+        self.assertEqual(fast['heart_rate'], 120)
+        self.assertIn('tachycardia', fast['anomalies'])
+        self.assertIn('pause', paused['anomalies'])
+
+    def test_strip_too_short_for_beat_detection(self):
+        features = analyze_waveform(synthetic_ecg([0.5], 1), 250)
+
+        self.assertEqual(detect_r_peaks(synthetic_ecg([0.5], 1), 250).size, 0)
+        self.assertIsNone(features['heart_rate'])
+        self.assertEqual(features['anomalies'], ['low_signal_quality'])
+
+    def test_hrv_from_known_intervals(self):
+        self.assertEqual(hrv_metrics(np.array([0.8, 0.9, 0.8])), {'sdnn': 57.7, 'rmssd': 100.0, 'pnn50': 100.0})
+        self.assertEqual(hrv_metrics(np.array([0.8])), {'sdnn': None, 'rmssd': None, 'pnn50': None})
+
+
+class ECGSubmitTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='submit', email='submit@example.com')
+        self.client.force_login(self.user)
+
+    def test_invalid_sample_rates_are_bad_requests(self):
+        for sample_rate in ('abc', -250, 0):
+            response = self.client.post(
+                '/api/health/ecg/submit/', {'waveform_data': [0.1, 0.2], 'sample_rate': sample_rate},
+                content_type='application/json', secure=True
+            )
+            self.assertEqual(response.status_code, 400, sample_rate)
+        self.assertFalse(ECGReading.objects.exists())
+
+    @mock.patch('health_monitoring.views.enqueue_analysis')
+    def test_detected_heart_rate_replaces_the_reported_one(self, enqueue):
+        waveform = synthetic_ecg(np.arange(0.5, 10, 0.8), 10).round(3).tolist()
+        response = self.client.post(
+            '/api/health/ecg/submit/', {'waveform_data': waveform, 'heart_rate': 0, 'sample_rate': 250},
+            content_type='application/json', secure=True
+        )
+
+        self.assertEqual(response.json()['heart_rate'], 75)
+        self.assertEqual(ECGReading.objects.get(id=response.json()['ecg_id']).anomalies_detected, [])
+        enqueue.assert_called_once()
+
+    def test_set_waveform_rejects_a_zero_rate(self):
+        with self.assertRaises(ValueError):
+            ECGReading(user=self.user).set_waveform([0.1, 0.2], sample_rate=0)
+
+
+class BulkIngestTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulk', email='bulk@example.com')
+        self.recorded_at = (timezone.now() - timedelta(hours=1)).replace(microsecond=0)
+
+    def reading(self, bpm, recorded_at=None):
+        return {
+            'data_type': 'heart_rate',
+            'value': {'bpm': bpm},
+            'recorded_at': recorded_at or self.recorded_at.isoformat(),
+        }
+
+    def test_impossible_date_rejects_only_that_item(self):
+        result = services.bulk_ingest_health_data(self.user, [self.reading(70), self.reading(71, '2026-02-30T10:00:00')])
+
+        self.assertEqual([item['status'] for item in result['results']], ['accepted', 'rejected'])
+        self.assertEqual(result['results'][1]['errors'], ['recorded_at must be an ISO 8601 datetime'])
+
+    def test_malformed_text_fields_are_rejected_per_item(self):
+        readings = [
+            {**self.reading(70), 'data_type': ['heart_rate']},
+            {**self.reading(71), 'source': {'device': 'watch'}},
+            {**self.reading(72), 'unit': 'b' * 21},
+            self.reading(73),
+        ]
+
+        result = services.bulk_ingest_health_data(self.user, readings)
+
+        self.assertEqual([item['status'] for item in result['results']], ['rejected'] * 3 + ['accepted'])
+        self.assertEqual(result['results'][1]['errors'], ['source must be a string'])
+        self.assertEqual(result['results'][2]['errors'], ['unit must be at most 20 characters'])
+
+    def test_batch_with_nothing_usable_is_a_bad_request(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/api/health/data/bulk/', {'readings': [{**self.reading(70), 'source': ['watch']}]}, content_type='application/json',
+            secure=True
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['results'][0]['errors'], ['source must be a string'])
+
+    def test_reading_stored_concurrently_is_reported_as_duplicate(self):
+        HealthData.objects.create(
+            user=self.user, data_type='heart_rate', value={'bpm': 70}, unit='bpm', source='manual',
+            recorded_at=self.recorded_at
+        )
+        later = (self.recorded_at + timedelta(minutes=1)).isoformat()
+        # The first lookup misses the stored row, as if it was written after the lookup
+        lookups = iter([lambda user, rows: set(), services._duplicates])
+        with mock.patch.object(services, '_duplicates', side_effect=lambda user, rows: next(lookups)(user, rows)):
+            result = services.bulk_ingest_health_data(self.user, [self.reading(70), self.reading(72, later)])
+
+        self.assertEqual([item['status'] for item in result['results']], ['duplicate', 'accepted'])
+        self.assertEqual(HealthData.objects.filter(user=self.user).count(), 2)
+
+
+class PromptBudgetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='prompt', email='prompt@example.com')
+        now = timezone.now()
+        readings = [
+            HealthData.objects.create(
+                user=self.user, data_type='heart_rate', value={'bpm': 120 + minute % 15}, unit='bpm',
+                source='manual', recorded_at=now - timedelta(minutes=minute)
+            )
+            for minute in range(0, 600, 10)
+        ]
+        record_health_data(readings)
+        # An irregular, fast strip: escalated by triage and full of beats to summarize
+        beats = np.cumsum(np.random.default_rng(3).uniform(0.35, 0.75, 150))
+        self.reading = ECGReading(user=self.user, heart_rate=0, recorded_at=now)
+        self.reading.set_waveform(synthetic_ecg(beats[beats < 59.5], 60).round(3), sample_rate=250)
+        self.reading.save()
+
+    def prompt_tokens(self, payload):
+        return sum(estimate_tokens(message['content']) for message in payload['messages'])
+
+    def test_prompt_built_from_a_real_reading_stays_within_the_budget(self):
+        health_data, settled = prepare_analysis(self.user.id, self.reading.id)
+        self.assertIsNone(settled)
+        self.assertEqual(health_data['triage'], triage(
+            analyze_waveform(self.reading.waveform, 250), CurrentVitals.objects.get(user=self.user)
+        ))
+
+        with self.settings(AI_PROMPT_TOKEN_BUDGET=100000):
+            untrimmed = self.prompt_tokens(build_openrouter_request(health_data)[1])
+        budget = untrimmed // 2
+        with self.settings(AI_PROMPT_TOKEN_BUDGET=budget):
+            _, payload = build_openrouter_request(health_data)
+
+        self.assertLessEqual(self.prompt_tokens(payload), budget)
+        self.assertIn(render_inputs({'triage': health_data['triage']})[1:-1], payload['messages'][1]['content'])
+
+
+@override_settings(OPENROUTER_API_KEY='test-key')
+class AnalysisCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['ai_results'].clear()
+        answer = {'risk_level': 'low', 'analysis': 'Normal sinus rhythm', 'confidence': 0.9}
+        self.client_patch = mock.patch('health_monitoring.tasks.get_client')
+        self.upstream = self.client_patch.start().return_value
+        self.upstream.post.return_value.json.return_value = {
+            'choices': [{'message': {'content': json.dumps(answer)}}]
+        }
+        self.addCleanup(self.client_patch.stop)
+
+    def health_data(self, user_id, timestamp, heart_rate=72):
+        return {'user_id': user_id, 'timestamp': timestamp, 'vitals': {'heart_rate': heart_rate}}
+
+    def test_same_clinical_inputs_reuse_the_stored_answer(self):
+        first = call_openrouter_ai(self.health_data(1, '2026-01-01T10:00:00'))
+        repeat = call_openrouter_ai(self.health_data(2, '2026-01-02T11:00:00'))
+
+        self.assertEqual(self.upstream.post.call_count, 1)
+        self.assertNotIn('cached', first)
+        self.assertTrue(repeat['cached'])
+        self.assertEqual(repeat['fingerprint'], first['fingerprint'])
+
+    def test_different_inputs_and_failed_calls_are_not_reused(self):
+        call_openrouter_ai(self.health_data(1, '2026-01-01T10:00:00'))
+        self.upstream.post.side_effect = ConnectionError('unreachable')
+        fallback = call_openrouter_ai(self.health_data(1, '2026-01-01T10:00:00', heart_rate=140))
+        self.upstream.post.side_effect = None
+        call_openrouter_ai(self.health_data(1, '2026-01-01T10:00:00', heart_rate=140))
+
+        self.assertNotIn('fingerprint', fallback)
+        self.assertEqual(self.upstream.post.call_count, 3)
+
+    def test_fingerprint_ignores_key_order(self):
+        self.assertEqual(
+            analysis_cache.analysis_fingerprint({'a': 1, 'b': [1, 2]}),
+            analysis_cache.analysis_fingerprint({'b': [1, 2], 'a': 1})
+        )
+
+
+@override_settings(OPENROUTER_API_KEY='test-key')
+class AnalysisBatchTests(SimpleTestCase):
+    def setUp(self):
+        caches['ai_results'].clear()
+        self.call_single = mock.AsyncMock(return_value={'risk_level': 'high', 'single': True})
+
+    def batcher(self, answered_cases, max_size=3):
+        response = mock.Mock()
+        response.json.return_value = {'choices': [{'message': {'content': json.dumps({'results': [
+            {'case_id': case_id, 'risk_level': 'low', 'analysis': f'case {case_id}'} for case_id in answered_cases
+        ]})}}]}
+        client = mock.Mock(post=mock.AsyncMock(return_value=response))
+        return AnalysisBatcher(client, self.call_single, max_size=max_size, max_wait_ms=1000)
+
+    def routine(self, heart_rate):
+        return {'vitals': {'heart_rate': heart_rate}}
+
+    async def test_routine_cases_share_one_request(self):
+        batcher = self.batcher([2, 0, 1])
+
+        results = await asyncio.gather(*(batcher.submit(self.routine(rate)) for rate in (70, 71, 72)))
+
+        self.assertEqual(batcher.client.post.await_count, 1)
+        self.assertEqual([result['analysis'] for result in results], ['case 0', 'case 1', 'case 2'])
+        self.call_single.assert_not_awaited()
+
+    async def test_urgent_case_is_not_held_for_a_batch(self):
+        batcher = self.batcher([])
+
+        result = await batcher.submit({'vitals': {'heart_rate': 180}, 'triage': {'decision': 'abnormal'}})
+
+        self.assertTrue(result['single'])
+        batcher.client.post.assert_not_awaited()
+
+    async def test_skipped_case_is_retried_alone_and_failures_fall_back(self):
+        batcher = self.batcher([0, 2])
+        results = await asyncio.gather(*(batcher.submit(self.routine(rate)) for rate in (80, 81, 82)))
+        self.assertEqual([result.get('single', False) for result in results], [False, True, False])
+
+        failing = self.batcher([], max_size=2)
+        failing.client.post.side_effect = ConnectionError('unreachable')
+        cases = [self.routine(90), self.routine(91)]
+        results = await asyncio.gather(*(failing.submit(case) for case in cases))
+        self.assertEqual(results, [fallback_analysis(case) for case in cases])
+
+
+@override_settings(ALERT_COALESCE_WINDOW=600)
+class AlertCoalescingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alerts', email='alerts@example.com')
+        self.now = timezone.now()
+
+    def trigger(self, severity, minutes=0, key=None):
+        return raise_emergency_alert(
+            self.user.id, severity, 'Alert', f'{severity} reading', idempotency_key=key,
+            now=self.now + timedelta(minutes=minutes)
+        )
+
+    def test_repeats_fold_into_one_alert_and_notify_only_on_escalation(self):
+        alert, notify = self.trigger('high')
+        results = [self.trigger('high', 5), self.trigger('critical', 9), self.trigger('high', 12)]
+
+        self.assertTrue(notify)
+        self.assertEqual([(other.id, notify) for other, notify in results],
+                         [(alert.id, False), (alert.id, True), (alert.id, False)])
+        alert.refresh_from_db()
+        self.assertEqual((alert.occurrences, alert.severity), (4, 'critical'))
+
+    def test_trigger_after_a_quiet_window_opens_a_new_alert(self):
+        first, _ = self.trigger('high')
+        second, notify = self.trigger('high', 11)
+
+        self.assertNotEqual(first.id, second.id)
+        self.assertTrue(notify)
+
+    def test_repeated_idempotency_key_is_a_no_op(self):
+        alert, _ = self.trigger('high', key='analysis:1')
+        again, notify = self.trigger('critical', 1, key='analysis:1')
+
+        self.assertEqual((again.id, notify), (alert.id, False))
+        alert.refresh_from_db()
+        self.assertEqual((alert.occurrences, alert.severity), (1, 'high'))
+
+    @mock.patch('health_monitoring.tasks.send_emergency_notifications')
+    def test_redelivered_trigger_task_notifies_once(self, notifications):
+        self.user.emergency_whatsapp = True
+        self.user.save()
+
+        ids = [trigger_emergency_alert(self.user.id, None, idempotency_key='manual:press-1') for _ in range(2)]
+
+        self.assertEqual(ids[0], ids[1])
+        notifications.delay.assert_called_once_with(self.user.id, ids[0])
+
+    def test_each_severity_is_claimed_for_notification_once(self):
+        alert, _ = self.trigger('high')
+
+        self.assertEqual([claim_notification(alert.id, 'high') for _ in range(2)], [True, False])
+        self.assertTrue(claim_notification(alert.id, 'critical'))
+        self.assertFalse(claim_notification(alert.id, 'high'))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pages', email='pages@example.com')
+        self.client.force_login(self.user)
+        self.start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        # Pairs of alerts share a created_at, so pages must break ties on id
+        for index in range(7):
+            alert = HealthAlert.objects.create(
+                user=self.user, alert_type='emergency', title=f'Alert {index}', message='',
+                severity='high' if index % 3 else 'low'
+            )
+            HealthAlert.objects.filter(id=alert.id).update(created_at=self.start + timedelta(minutes=index // 2))
+
+    def walk(self, url):
+        """Ids of every page reached by following Link headers, and the links followed"""
+        ids, links = [], []
+        while url:
+            response = self.client.get(url, secure=True)
+            self.assertEqual(response.status_code, 200)
+            ids.append([row['id'] for row in response.json()])
+            url = response.headers.get('Link', '').removeprefix('<').split('>;')[0]
+            links.append(url)
+        return ids, links[:-1]
+
+    def test_cursor_pages_cover_every_alert_once_in_order(self):
+        expected = list(
+            HealthAlert.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+        pages, links = self.walk('/api/health/alerts/?limit=2')
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertTrue(all(link.startswith('https://testserver/api/health/alerts/?limit=2&cursor=') for link in links))
+
+    def test_filters_are_kept_in_the_next_link(self):
+        pages, links = self.walk('/api/health/alerts/?severity=high&limit=3')
+
+        self.assertEqual(sum(pages, []), list(
+            HealthAlert.objects.filter(severity='high').order_by('-created_at', '-id').values_list('id', flat=True)
+        ))
+        self.assertIn('severity=high', links[0])
+
+    def test_bad_parameters_are_rejected(self):
+        for query in ('cursor=not-a-cursor', 'limit=0', 'limit=500', 'severity=extreme', 'start=yesterday'):
+            response = self.client.get(f'/api/health/alerts/?{query}', secure=True)
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_history_pages_run_backwards_and_read_forwards(self):
+        HealthHistoryMessage.objects.bulk_create([
+            HealthHistoryMessage(user=self.user, message_type='user', content=str(index),
+                                 timestamp=self.start + timedelta(minutes=index))
+            for index in range(5)
+        ])
+
+        pages, _ = self.walk('/api/health/history/messages/?limit=2')
+
+        contents = [[HealthHistoryMessage.objects.get(id=pk).content for pk in page] for page in pages]
+        self.assertEqual(contents, [['3', '4'], ['1', '2'], ['0']])
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(self.start, 42)), (self.start, 42))
+
+
+class TriageTests(TestCase):
+    def test_no_ecg_and_no_vitals_is_insufficient_not_normal(self):
+        result = triage()
+
+        self.assertEqual(result['decision'], 'insufficient')
+        self.assertEqual(local_assessment(result)['confidence'], 0.0)
+
+    def test_fallback_without_api_key_does_not_triage_again(self):
+        health_data = {'triage': triage()}
+        screened = triage_stats()['screened']
+
+        with self.settings(OPENROUTER_API_KEY=None):
+            call_openrouter_ai(health_data)
+
+        self.assertEqual(triage_stats()['screened'], screened)
+
+
+class ReliableQueueTests(SimpleTestCase):
+    def source(self):
+        source = async_worker.RedisJobSource(url='redis://localhost:6379/15', key='test:pending', worker_name='w1')
+        source.redis = mock.AsyncMock()
+        source.redis.lmove.return_value = None
+        return source
+
+    async def test_redis_error_is_retried_and_the_job_acked_after_running(self):
+        source = self.source()
+        payload = b'{"user_id": 1, "ecg_reading_id": null}'
+        source.redis.blmove.side_effect = [redis.ConnectionError('connection reset'), payload]
+        handled = []
+
+        async def handler(job):
+            handled.append(job)
+            source.stop()
+
+        with mock.patch.object(async_worker, 'RECONNECT_DELAY', 0):
+            await async_worker.FairScheduler(handler, concurrency=1, per_user_limit=1).run(source)
+
+        self.assertEqual(handled, [{'user_id': 1, 'ecg_reading_id': None}])
+        source.redis.blmove.assert_called_with('test:pending', 'test:pending:processing:w1', 1, 'LEFT', 'RIGHT')
+        source.redis.lrem.assert_awaited_once_with('test:pending:processing:w1', 1, payload)
+
+    async def test_unfinished_jobs_are_requeued_on_startup(self):
+        source = self.source()
+        source.redis.lmove.side_effect = [b'{"user_id": 1}', b'{"user_id": 2}', None]
+
+        async def stop_after_recovery(*args):
+            source.stop()
+
+        source.redis.blmove.side_effect = stop_after_recovery
+
+        self.assertIsNone(await source.get())
+        self.assertEqual(source.redis.lmove.await_count, 3)
+        source.redis.lmove.assert_called_with('test:pending:processing:w1', 'test:pending', 'RIGHT', 'LEFT')
+
+
+class FakePubSub:
+    def __init__(self, messages, drop):
+        self.messages = messages
+        self.drop = drop
+
+    async def psubscribe(self, pattern):
+        pass
+
+    async def listen(self):
+        for message in self.messages:
+            yield message
+        if self.drop:
+            raise redis.ConnectionError('connection lost')
+        await asyncio.Event().wait()
+
+    async def aclose(self):
+        pass
+
+
+class EventPublishTests(TestCase):
+    @override_settings(EVENTS_REDIS_URL='redis://localhost:6379/15', EVENTS_STREAM_MAXLEN=100)
+    def test_event_is_streamed_and_announced_after_commit(self):
+        redis_client = mock.Mock()
+        redis_client.xadd.return_value = '5-0'
+        with mock.patch.object(events, '_client', return_value=redis_client):
+            with self.captureOnCommitCallbacks(execute=True):
+                events.publish(7, 'alert', {'id': 1})
+                redis_client.xadd.assert_not_called()
+
+        redis_client.xadd.assert_called_once_with(
+            'events:stream:7', {'type': 'alert', 'data': '{"id": 1}'}, maxlen=100, approximate=True
+        )
+        channel, message = redis_client.publish.call_args.args
+        self.assertEqual(channel, 'events:user:7')
+        self.assertEqual(json.loads(message), {'id': '5-0', 'type': 'alert', 'data': '{"id": 1}'})
+
+    @override_settings(EVENTS_REDIS_URL=None)
+    def test_publish_without_redis_is_a_no_op(self):
+        with mock.patch.object(events, '_client') as redis_client:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                events.publish(7, 'alert', {'id': 1})
+
+        self.assertEqual(callbacks, [])
+        redis_client.assert_not_called()
+
+
+class EventBrokerTests(SimpleTestCase):
+    def announcement(self, event_id):
+        return {
+            'type': 'pmessage', 'channel': 'events:user:7',
+            'data': json.dumps({'id': event_id, 'type': 'vitals', 'data': '{}'}),
+        }
+
+    @override_settings(EVENTS_REDIS_URL='redis://localhost:6379/15', EVENTS_QUEUE_SIZE=10)
+    async def test_dropped_subscription_is_restored_and_clients_told_to_replay(self):
+        broker = events.EventBroker()
+        broker.redis = mock.Mock()
+        broker.redis.pubsub.side_effect = [
+            FakePubSub([self.announcement('1-0')], drop=True),
+            FakePubSub([self.announcement('3-0')], drop=False),
+        ]
+
+        with mock.patch.object(events, 'RECONNECT_DELAY', 0):
+            queue = broker.subscribe(7)
+            received = [await asyncio.wait_for(queue.get(), 1) for _ in range(3)]
+        broker.listener.cancel()
+
+        self.assertEqual(received[0]['id'], '1-0')
+        self.assertIs(received[1], events.RECONNECTED)
+        self.assertEqual(received[2]['id'], '3-0')
+
+    @override_settings(EVENTS_REDIS_URL='redis://localhost:6379/15')
+    async def test_replay_is_refused_once_missed_events_were_trimmed(self):
+        broker = events.EventBroker()
+        broker.redis = mock.AsyncMock()
+        broker.redis.xrange.side_effect = [[('2-0', {})], [('3-0', {'type': 'vitals', 'data': '{}'})]]
+
+        self.assertEqual(await broker.replay(7, '2-0'), [{'id': '3-0', 'type': 'vitals', 'data': '{}'}])
+        broker.redis.xrange.side_effect = [[('5-0', {})]]
+        self.assertIsNone(await broker.replay(7, '2-0'))
+
+    @override_settings(EVENTS_REDIS_URL='redis://localhost:6379/15', EVENTS_QUEUE_SIZE=1)
+    async def test_slow_client_is_dropped_with_a_resync(self):
+        broker = events.EventBroker()
+        broker.listener = mock.Mock(done=mock.Mock(return_value=False))
+        queue = broker.subscribe(7)
+
+        broker._deliver(7, {'id': '1-0'})
+        broker._deliver(7, {'id': '2-0'})
+
+        self.assertIs(queue.get_nowait(), events.OVERFLOW)
+        self.assertEqual(broker.subscribers[7], set())
+
+    @override_settings(EVENTS_RETRY_MS=1000, EVENTS_KEEPALIVE=1)
+    async def test_stream_replays_missed_events_before_live_ones(self):
+        queue = asyncio.Queue()
+        for item in ({'id': '2-0', 'type': 'vitals', 'data': '{}'}, {'id': '3-0', 'type': 'alert', 'data': '{}'},
+                     events.OVERFLOW):
+            queue.put_nowait(item)
+        broker = mock.Mock()
+        broker.subscribe.return_value = queue
+        broker.replay = mock.AsyncMock(return_value=[{'id': '2-0', 'type': 'vitals', 'data': '{}'}])
+
+        with mock.patch.object(events, 'get_broker', return_value=broker):
+            sent = [chunk async for chunk in events.event_stream(7, last_event_id='1-0')]
+
+        self.assertEqual([chunk.split('\n')[0] for chunk in sent[1:]], ['id: 2-0', 'id: 3-0', 'event: resync'])
+        broker.unsubscribe.assert_called_once_with(7, queue)
+
+    @override_settings(EVENTS_RETRY_MS=1000, EVENTS_KEEPALIVE=1)
+    async def test_stream_replays_from_the_last_sent_id_after_a_reconnect(self):
+        queue = asyncio.Queue()
+        for item in ({'id': '1-0', 'type': 'vitals', 'data': '{}'}, events.RECONNECTED,
+                     {'id': '3-0', 'type': 'vitals', 'data': '{}'}):
+            queue.put_nowait(item)
+        broker = mock.Mock()
+        broker.subscribe.return_value = queue
+        broker.replay = mock.AsyncMock(return_value=[
+            {'id': '2-0', 'type': 'alert', 'data': '{}'}, {'id': '3-0', 'type': 'vitals', 'data': '{}'},
+        ])
+
+        with mock.patch.object(events, 'get_broker', return_value=broker):
+            stream = events.event_stream(7)
+            sent = [await anext(stream) for _ in range(4)]
+            await stream.aclose()
+
+        broker.replay.assert_awaited_once_with(7, '1-0')
+        self.assertEqual([chunk.split('\n')[0] for chunk in sent[1:]], ['id: 1-0', 'id: 2-0', 'id: 3-0'])
@@ -0,0 +1,196 @@
+"""Deterministic rule-based pre-screen run before the remote AI call.
+
+Clearly normal readings are settled locally, and so are requests with no ECG
+and no recent vitals, as insufficient data; anything abnormal or ambiguous
+is escalated to the LLM. Outcomes are counted so the escalation rate can be
+watched with the show_metrics command.
+"""
+from datetime import timedelta
+from django.utils import timezone
+from cardiocare import metrics
+from .signal import LOW_QUALITY
+
+SEVERITY_ORDER = ['low', 'medium', 'high', 'critical']
+
+VITALS_MAX_AGE = timedelta(hours=1)
+
+DECISIONS = ['normal', 'insufficient', 'ambiguous', 'abnormal']
+
+# Decisions settled without the LLM
+LOCAL_DECISIONS = {'normal', 'insufficient'}
+
+RECOMMENDATIONS = {
+    'low': ['Continue routine monitoring'],
+    'medium': ['Monitor closely and repeat the measurement', 'Consult healthcare provider if symptoms persist'],
+    'high': ['Contact your healthcare provider today', 'Avoid strenuous activity until reviewed'],
+    'critical': ['Seek immediate medical attention', 'Contact emergency services'],
+}
+
+PREDICTIONS = {
+    'low': 'No immediate concerns',
+    'medium': 'Continue monitoring - consider medical consultation',
+    'high': 'Medical review recommended',
+    'critical': 'Immediate medical attention recommended',
+}
+
+
+def _finding(code, severity, detail):
+    return {'code': code, 'severity': severity, 'detail': detail}
+
+
+def _heart_rate_findings(heart_rate):
+    detail = f'Heart rate {heart_rate:g} bpm'
+    if heart_rate >= 150:
+        return [_finding('tachycardia', 'critical', detail)]
+    if heart_rate > 120:
+        return [_finding('tachycardia', 'high', detail)]
+    if heart_rate > 100:
+        return [_finding('tachycardia', 'medium', detail)]
+    if heart_rate < 40:
+        return [_finding('bradycardia', 'critical', detail)]
+    if heart_rate < 50:
+        return [_finding('bradycardia', 'medium', detail)]
+    return []
+
+
+def _ecg_findings(features):
+    findings = []
+    heart_rate = features.get('heart_rate')
+    rr_ms = features.get('rr_intervals_ms') or []
+
+    if features.get('quality_score', 0.0) < LOW_QUALITY:
+        findings.append(_finding('low_signal_quality', 'medium', 'ECG signal quality too low for a confident rhythm read'))
+        return findings
+
+    if heart_rate is not None:
+        findings += _heart_rate_findings(heart_rate)
+
+    if 'irregular_rhythm' in features.get('anomalies', []):
+        findings.append(_finding('irregular_rhythm', 'high', 'Irregular RR intervals (possible atrial fibrillation)'))
+
+    if rr_ms:
+        longest = max(rr_ms) / 1000.0
+        if longest > 3.0:
+            findings.append(_finding('pause', 'critical', f'Pause of {longest:.1f} s'))
+        elif longest > 2.0:
+            findings.append(_finding('pause', 'high', f'Pause of {longest:.1f} s'))
+
+    return findings
+
+
+def _has_fresh_vitals(vitals, now):
+    return any(
+        recorded_at is not None and now - recorded_at <= VITALS_MAX_AGE
+        for recorded_at in (vitals.heart_rate_at, vitals.spo2_at, vitals.blood_pressure_at, vitals.temperature_at)
+    )
+
+
+def _vitals_findings(vitals, now, include_heart_rate):
+    findings = []
+
+    def fresh(recorded_at):
+        return recorded_at is not None and now - recorded_at <= VITALS_MAX_AGE
+
+    if include_heart_rate and vitals.heart_rate is not None and fresh(vitals.heart_rate_at):
+        findings += _heart_rate_findings(vitals.heart_rate)
+
+    if vitals.spo2 is not None and fresh(vitals.spo2_at):
+        if vitals.spo2 < 88:
+            findings.append(_finding('hypoxemia', 'critical', f'SpO2 {vitals.spo2:g}%'))
+        elif vitals.spo2 < 92:
+            findings.append(_finding('hypoxemia', 'high', f'SpO2 {vitals.spo2:g}%'))
+        elif vitals.spo2 < 95:
+            findings.append(_finding('low_spo2', 'medium', f'SpO2 {vitals.spo2:g}%'))
+
+    if vitals.systolic is not None and vitals.diastolic is not None and fresh(vitals.blood_pressure_at):
+        reading = f'Blood pressure {vitals.systolic:g}/{vitals.diastolic:g} mmHg'
+        if vitals.systolic >= 180 or vitals.diastolic >= 120:
+            findings.append(_finding('hypertensive_crisis', 'critical', reading))
+        elif vitals.systolic >= 140 or vitals.diastolic >= 90:
+            findings.append(_finding('hypertension', 'medium', reading))
+        elif vitals.systolic < 90:
+            findings.append(_finding('hypotension', 'high', reading))
+
+    if vitals.temperature is not None and fresh(vitals.temperature_at) and vitals.temperature >= 100.4:
+        findings.append(_finding('fever', 'medium', f'Temperature {vitals.temperature:g} F'))
+
+    return findings
+
+
+def triage(ecg_features=None, vitals=None, now=None):
+    """Screen ECG features and current vitals.
+
+    Returns the findings, the highest severity as ``risk_level`` and a
+    ``decision``: 'normal' or 'insufficient' (no ECG and no recent vitals;
+    both settle locally), 'ambiguous' or 'abnormal' (both escalate to the LLM).
+    """
+    now = now or timezone.now()
+    findings = []
+    if ecg_features:
+        findings += _ecg_findings(ecg_features)
+    if vitals is not None:
+        # The ECG-derived rate takes precedence over the last wearable sample
+        findings += _vitals_findings(vitals, now, include_heart_rate=not ecg_features)
+
+    risk_level = max(
+        (finding['severity'] for finding in findings),
+        key=SEVERITY_ORDER.index,
+        default='low',
+    )
+
+    if not ecg_features and (vitals is None or not _has_fresh_vitals(vitals, now)):
+        decision = 'insufficient'
+    elif not findings:
+        decision = 'normal'
+    elif SEVERITY_ORDER.index(risk_level) >= SEVERITY_ORDER.index('high'):
+        decision = 'abnormal'
+    else:
+        decision = 'ambiguous'
+
+    metrics.increment(f'triage.{decision}')
+    return {'decision': decision, 'risk_level': risk_level, 'findings': findings}
+
+
+def local_assessment(result, heart_rate=None):
+    """Analysis in the same shape as call_openrouter_ai, built from triage findings"""
+    risk_level = result['risk_level']
+
+    if result['decision'] == 'insufficient':
+        return {
+            'risk_level': risk_level,
+            'analysis': 'No ECG or recent vitals to assess',
+            'prediction': 'Not enough data for an assessment',
+            'confidence': 0.0,
+            'recommendations': ['Take a new measurement'],
+            'time_to_emergency': None,
+        }
+
+    if result['findings']:
+        analysis = '; '.join(finding['detail'] for finding in result['findings'])
+    elif heart_rate:
+        analysis = f'Regular rhythm at {heart_rate} bpm with vitals in normal range'
+    else:
+        analysis = 'Vitals in normal range'
+
+    return {
+        'risk_level': risk_level,
+        'analysis': analysis,
+        'prediction': PREDICTIONS[risk_level],
+        'confidence': 0.9 if result['decision'] == 'normal' else 0.6,
+        'recommendations': RECOMMENDATIONS[risk_level],
+        'time_to_emergency': None,
+    }
+
+
+def triage_stats():
+    counters = metrics.get_counters([f'triage.{decision}' for decision in DECISIONS])
+    total = sum(counters.values())
+    settled = sum(counters[f'triage.{decision}'] for decision in LOCAL_DECISIONS)
+    escalated = total - settled
+    return {
+        'screened': total,
+        'settled_locally': settled,
+        'escalated': escalated,
+        'escalation_rate': round(escalated / total, 3) if total else None,
+        **counters,
+    }
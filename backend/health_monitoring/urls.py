@@ -3,10 +3,16 @@ from . import views
 
 urlpatterns = [
     path('current-metrics/', views.get_current_health_metrics, name='current_metrics'),
+    path('data/bulk/', views.bulk_submit_health_data, name='bulk_submit_health_data'),
     path('ecg/submit/', views.submit_ecg_data, name='submit_ecg_data'),
+    path('ecg/sessions/', views.open_ecg_session, name='open_ecg_session'),
+    path('ecg/sessions/<int:session_id>/chunks/', views.append_ecg_chunk, name='append_ecg_chunk'),
+    path('ecg/sessions/<int:session_id>/close/', views.close_ecg_session, name='close_ecg_session'),
     path('analysis/', views.get_ai_analysis, name='get_ai_analysis'),
     path('sync/google-fit/', views.sync_google_fit_data, name='sync_google_fit'),
+    path('trends/', views.get_health_trends, name='get_health_trends'),
     path('alerts/', views.get_health_alerts, name='get_health_alerts'),
+    path('events/', views.stream_events, name='stream_events'),
     path('history/messages/', views.get_health_history_messages, name='get_health_history_messages'),
     path('history/send/', views.send_health_history_message, name='send_health_history_message'),
 ]
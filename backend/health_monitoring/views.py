@@ -1,52 +1,87 @@
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import datetime, timedelta
+import base64
 import requests
 import json
 import logging
-from .models import HealthData, ECGReading, AIAnalysis, HealthAlert, HealthHistoryMessage
-from .tasks import analyze_health_data
+from cardiocare.async_views import async_api_view, authenticate
+from cardiocare.cache import ALERTS, ANALYSIS, cached_response
+from cardiocare.pagination import keyset_page, keyset_queryset, next_link, page_limit
+from .models import HealthData, ECGReading, CurrentVitals, ECGSession, ECGSessionConflict, AIAnalysis, HealthAlert, HealthHistoryMessage
+from .services import bulk_ingest_health_data, text_field_errors
+from .events import event_stream
+from .rollups import RESOLUTIONS, ROLLUP_FIELDS, bucket_start, bucket_step, choose_resolution, summarize_trend, trend_queryset
+from .vitals import record_ecg_reading, rebuild_current_vitals
+from .tasks import analyze_ecg_window, enqueue_analysis, import_health_data
+from .triage import SEVERITY_ORDER
+from .waveform import DEFAULT_GAIN, DEFAULT_LEAD, DEFAULT_SAMPLE_RATE, SAMPLE_FORMATS
 
 logger = logging.getLogger(__name__)
 
-@api_view(['GET'])
-@permission_classes([AllowAny])  # Allow unauthenticated for demo
-def get_current_health_metrics(request):
+RISK_LABELS = dict(AIAnalysis.RISK_LEVELS)
+
+# Default page sizes of the list endpoints (?limit= up to pagination.MAX_LIMIT)
+ALERTS_PAGE_SIZE = 20
+HISTORY_PAGE_SIZE = 50
+
+# Response key -> model field of the list endpoints, in response order (see cardiocare/rows.py)
+ALERT_FIELDS = {
+    'id': 'id',
+    'type': 'alert_type',
+    'title': 'title',
+    'message': 'message',
+    'status': 'status',
+    'severity': 'severity',
+    'occurrences': 'occurrences',
+    'created_at': 'created_at',
+    'resolved_at': 'resolved_at',
+}
+HISTORY_MESSAGE_FIELDS = {
+    'id': 'id',
+    'type': 'message_type',
+    'content': 'content',
+    'attachments': 'attachments',
+    'timestamp': 'timestamp',
+}
+
+def metric_value(value, default):
+    """Snapshot number as the API has always rendered it (89, not 89.0)"""
+    if value is None:
+        return default
+    return int(value) if float(value).is_integer() else value
+
+@async_api_view(allow_anonymous=True)  # Allow unauthenticated for demo
+async def get_current_health_metrics(request):
     """Get current health metrics"""
     try:
         if request.user.is_authenticated:
             user = request.user
             
-            # Get latest readings for each metric
-            latest_heart_rate = HealthData.objects.filter(
-                user=user, data_type='heart_rate'
-            ).first()
-            
-            latest_blood_pressure = HealthData.objects.filter(
-                user=user, data_type='blood_pressure'
-            ).first()
-            
-            latest_spo2 = HealthData.objects.filter(
-                user=user, data_type='spo2'
-            ).first()
-            
-            latest_temperature = HealthData.objects.filter(
-                user=user, data_type='temperature'
-            ).first()
+            # Served from the per-user snapshot; built once on first access
+            vitals = (
+                await CurrentVitals.objects.filter(user=user).afirst()
+                or await sync_to_async(rebuild_current_vitals)(user.id)
+            )
             
             # Return current metrics (with real data if available)
             current_metrics = {
-                'heartRate': latest_heart_rate.value.get('bpm', 89) if latest_heart_rate else 89,
+                'heartRate': metric_value(vitals.heart_rate, 89),
                 'bloodPressure': {
-                    'systolic': latest_blood_pressure.value.get('systolic', 140) if latest_blood_pressure else 140,
-                    'diastolic': latest_blood_pressure.value.get('diastolic', 90) if latest_blood_pressure else 90
+                    'systolic': metric_value(vitals.systolic, 140),
+                    'diastolic': metric_value(vitals.diastolic, 90)
                 },
-                'spo2': latest_spo2.value.get('percentage', 97) if latest_spo2 else 97,
-                'temperature': latest_temperature.value.get('fahrenheit', 98.6) if latest_temperature else 98.6,
-                'riskLevel': 'High Risk'
+                'spo2': metric_value(vitals.spo2, 97),
+                'temperature': metric_value(vitals.temperature, 98.6),
+                'riskLevel': RISK_LABELS.get(vitals.risk_level, 'High Risk')
             }
         else:
             # Return demo data for unauthenticated users
@@ -67,6 +102,58 @@ def get_current_health_metrics(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_submit_health_data(request):
+    """Submit a batch of health data readings"""
+    try:
+        readings = request.data.get('readings') if isinstance(request.data, dict) else request.data
+        
+        if not isinstance(readings, list) or not readings:
+            return Response(
+                {'error': 'A non-empty list of readings is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(readings) > settings.HEALTH_DATA_BULK_MAX_ITEMS:
+            return Response(
+                {'error': f'At most {settings.HEALTH_DATA_BULK_MAX_ITEMS} readings per request'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        default_source = request.data.get('source', 'manual') if isinstance(request.data, dict) else 'manual'
+        source_errors = text_field_errors('source', default_source)
+        if source_errors:
+            return Response({'error': source_errors[0]}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if isinstance(request.data, dict) and request.data.get('background'):
+            # Large imports run on the bulk-import queue; results are not returned per item
+            task = import_health_data.delay(request.user.id, readings, default_source)
+            return Response(
+                {'status': 'queued', 'task_id': task.id, 'count': len(readings)},
+                status=status.HTTP_202_ACCEPTED
+            )
+        
+        result = bulk_ingest_health_data(request.user, readings, default_source=default_source)
+        
+        logger.info(
+            f"Bulk health data for user {request.user.email}: "
+            f"{result['accepted']} accepted, {result['duplicates']} duplicates, {result['rejected']} rejected"
+        )
+        
+        if result['rejected'] == len(readings):
+            # Nothing in the batch was usable; the per-item errors say why
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(result)
+        
+    except Exception as e:
+        logger.error(f"Error in bulk_submit_health_data: {str(e)}")
+        return Response(
+            {'error': 'Failed to submit health data'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def submit_ecg_data(request):
@@ -75,6 +162,7 @@ def submit_ecg_data(request):
         user = request.user
         waveform_data = request.data.get('waveform_data', [])
         heart_rate = request.data.get('heart_rate', 0)
+        lead = request.data.get('lead', DEFAULT_LEAD)
         
         if not waveform_data:
             return Response(
@@ -82,22 +170,37 @@ def submit_ecg_data(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create ECG reading
-        ecg_reading = ECGReading.objects.create(
+        try:
+            sample_rate = int(request.data.get('sample_rate', DEFAULT_SAMPLE_RATE))
+        except (TypeError, ValueError):
+            sample_rate = 0
+        if sample_rate <= 0:
+            return Response(
+                {'error': 'sample_rate must be a positive integer'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Create ECG reading with packed samples
+        ecg_reading = ECGReading(
             user=user,
-            waveform_data=waveform_data,
             heart_rate=heart_rate,
-            duration=len(waveform_data) // 250,  # Assuming 250 Hz sampling rate
             recorded_at=timezone.now()
         )
+        ecg_reading.set_waveform(waveform_data, sample_rate=sample_rate, lead=lead)
+        ecg_reading.process_signal()
+        ecg_reading.save()
+        record_ecg_reading(ecg_reading)
         
         # Trigger AI analysis
-        analyze_health_data.delay(user.id, ecg_reading.id)
+        enqueue_analysis(user.id, ecg_reading.id)
         
         logger.info(f"ECG data submitted for user {user.email}, reading ID: {ecg_reading.id}")
         
         return Response({
             'ecg_id': ecg_reading.id,
+            'heart_rate': ecg_reading.heart_rate,
+            'quality_score': ecg_reading.quality_score,
+            'anomalies_detected': ecg_reading.anomalies_detected,
             'message': 'ECG data submitted for analysis',
             'status': 'processing'
         })
@@ -109,14 +212,171 @@ def submit_ecg_data(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-@api_view(['GET'])
-@permission_classes([AllowAny])  # Allow unauthenticated for demo
-def get_ai_analysis(request):
+def dispatch_ecg_windows(session, windows):
+    """Queue analysis for claimed session windows once the claim is committed"""
+    for start_sample, end_sample in windows:
+        transaction.on_commit(
+            lambda start=start_sample, end=end_sample: analyze_ecg_window.delay(session.id, start, end)
+        )
+
+def ecg_session_state(session):
+    return {
+        'session_id': session.id,
+        'status': session.status,
+        'next_sequence': session.next_sequence,
+        'sample_count': session.sample_count,
+        'analyzed_samples': session.analyzed_samples,
+    }
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def open_ecg_session(request):
+    """Open a streaming ECG recording session"""
+    try:
+        sample_rate = int(request.data.get('sample_rate', DEFAULT_SAMPLE_RATE))
+        gain = float(request.data.get('gain', DEFAULT_GAIN))
+        window_seconds = int(request.data.get('window_seconds', 30))
+        if not (sample_rate > 0 and gain > 0 and window_seconds > 0):
+            return Response(
+                {'error': 'sample_rate, gain and window_seconds must be positive'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        session = ECGSession.objects.create(
+            user=request.user,
+            sample_rate=sample_rate,
+            gain=gain,
+            lead=request.data.get('lead', DEFAULT_LEAD),
+            window_seconds=window_seconds,
+        )
+        
+        logger.info(f"ECG session {session.id} opened for user {request.user.email}")
+        
+        return Response(ecg_session_state(session), status=status.HTTP_201_CREATED)
+        
+    except (TypeError, ValueError):
+        return Response(
+            {'error': 'Invalid session parameters'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except Exception as e:
+        logger.error(f"Error in open_ecg_session: {str(e)}")
+        return Response(
+            {'error': 'Failed to open ECG session'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def append_ecg_chunk(request, session_id):
+    """Append a sequence-numbered chunk of samples to a session.
+
+    Accepts either JSON (``sequence`` plus ``samples`` in mV, or a base64
+    ``payload`` with ``sample_format``) or a raw application/octet-stream
+    body with ``sequence`` and ``sample_format`` in the query string.
+    """
+    try:
+        session = ECGSession.objects.get(id=session_id, user=request.user)
+    except ECGSession.DoesNotExist:
+        return Response(
+            {'error': 'Session not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    try:
+        if request.content_type == 'application/octet-stream':
+            params = request.query_params
+            payload = request.body
+            samples = None
+        else:
+            params = request.data
+            payload = base64.b64decode(params['payload']) if params.get('payload') else None
+            samples = params.get('samples')
+        
+        sequence = int(params['sequence'])
+        sample_format = params.get('sample_format', 'int16')
+        heart_rate = params.get('heart_rate')
+        
+        if sample_format not in SAMPLE_FORMATS or (payload is None and not samples):
+            raise ValueError('Samples or a payload in a supported format are required')
+        
+        chunk, created = session.append_chunk(
+            sequence,
+            samples=samples,
+            payload=payload,
+            sample_format=sample_format,
+            heart_rate=int(heart_rate) if heart_rate is not None else None
+        )
+    except ECGSessionConflict as e:
+        return Response(
+            {'error': str(e), **ecg_session_state(session)}, 
+            status=status.HTTP_409_CONFLICT
+        )
+    except ValueError as e:
+        return Response(
+            {'error': str(e)}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except (KeyError, TypeError):
+        return Response(
+            {'error': 'Chunk sequence and samples are required'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        windows = session.claim_windows() if created else []
+        dispatch_ecg_windows(session, windows)
+        
+        return Response({
+            **ecg_session_state(session),
+            'sequence': chunk.sequence,
+            'duplicate': not created,
+            'windows_triggered': len(windows),
+        })
+        
+    except Exception as e:
+        logger.error(f"Error in append_ecg_chunk: {str(e)}")
+        return Response(
+            {'error': 'Failed to append ECG chunk'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def close_ecg_session(request, session_id):
+    """Close a streaming session and analyze its trailing window"""
+    try:
+        session = ECGSession.objects.get(id=session_id, user=request.user)
+        windows = session.close()
+        dispatch_ecg_windows(session, windows)
+        
+        logger.info(f"ECG session {session.id} closed with {session.sample_count} samples")
+        
+        return Response({
+            **ecg_session_state(session),
+            'windows_triggered': len(windows),
+        })
+        
+    except ECGSession.DoesNotExist:
+        return Response(
+            {'error': 'Session not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except Exception as e:
+        logger.error(f"Error in close_ecg_session: {str(e)}")
+        return Response(
+            {'error': 'Failed to close ECG session'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@async_api_view(allow_anonymous=True)  # Allow unauthenticated for demo
+@cached_response(ANALYSIS)
+async def get_ai_analysis(request):
     """Get latest AI analysis"""
     try:
         if request.user.is_authenticated:
             user = request.user
-            latest_analysis = AIAnalysis.objects.filter(user=user).first()
+            latest_analysis = await AIAnalysis.objects.filter(user=user).afirst()
             
             if latest_analysis:
                 return Response({
@@ -125,6 +385,7 @@ def get_ai_analysis(request):
                     'confidence_score': latest_analysis.confidence_score,
                     'recommendations': latest_analysis.recommendations,
                     'risk_level': latest_analysis.risk_level,
+                    'served_from_cache': latest_analysis.served_from_cache,
                     'created_at': latest_analysis.created_at.isoformat()
                 })
         
@@ -179,28 +440,36 @@ def sync_google_fit_data(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_health_alerts(request):
-    """Get user's health alerts"""
+@async_api_view()
+@cached_response(ALERTS)
+async def get_health_alerts(request):
+    """Get user's health alerts, newest first, one page at a time.
+
+    Filters: type, status and severity (comma-separated values) and a
+    start/end range on created_at. The next page's URL is in the Link header.
+    """
     try:
-        user = request.user
-        alerts = HealthAlert.objects.filter(user=user)[:20]
-        
-        alert_data = []
-        for alert in alerts:
-            alert_data.append({
-                'id': alert.id,
-                'type': alert.alert_type,
-                'title': alert.title,
-                'message': alert.message,
-                'status': alert.status,
-                'severity': alert.severity,
-                'created_at': alert.created_at.isoformat(),
-                'resolved_at': alert.resolved_at.isoformat() if alert.resolved_at else None
-            })
-        
-        return Response(alert_data)
+        try:
+            limit = page_limit(request, ALERTS_PAGE_SIZE)
+            alerts = HealthAlert.objects.filter(user=request.user)
+            for name, field, choices in (
+                ('type', 'alert_type', [choice for choice, _ in HealthAlert.ALERT_TYPES]),
+                ('status', 'status', [choice for choice, _ in HealthAlert.ALERT_STATUS]),
+                ('severity', 'severity', SEVERITY_ORDER),
+            ):
+                values = _query_choices(request, name, choices)
+                if values:
+                    alerts = alerts.filter(**{f'{field}__in': values})
+            alerts = keyset_queryset(_query_range(request, alerts, 'created_at'), 'created_at', request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        alert_data, cursor = await keyset_page(alerts, ALERT_FIELDS, 'created_at', limit)
+        
+        response = Response(alert_data)
+        if cursor:
+            response['Link'] = next_link(request, cursor)
+        return response
         
     except Exception as e:
         logger.error(f"Error in get_health_alerts: {str(e)}")
@@ -209,25 +478,143 @@ def get_health_alerts(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_health_history_messages(request):
-    """Get user's health history chat messages"""
+def _query_datetime(request, name):
+    """Aware datetime from a query parameter; None if absent, ValueError if malformed"""
+    raw = request.GET.get(name)
+    if not raw:
+        return None
+    parsed = parse_datetime(raw)
+    if parsed is None:
+        raise ValueError(f'{name} must be an ISO 8601 datetime')
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+def _query_choices(request, name, choices):
+    """Values of a comma-separated filter parameter; None if absent, ValueError if unknown"""
+    raw = request.GET.get(name)
+    if not raw:
+        return None
+    values = raw.split(',')
+    if any(value not in choices for value in values):
+        raise ValueError(f"{name} must be one of: {', '.join(choices)}")
+    return values
+
+def _query_range(request, queryset, field):
+    """Narrow ``queryset`` to the request's start (inclusive) and end (exclusive) on ``field``"""
+    start = _query_datetime(request, 'start')
+    end = _query_datetime(request, 'end')
+    if start and end and start >= end:
+        raise ValueError('start must be before end')
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lt': end})
+    return queryset
+
+@async_api_view()
+async def get_health_trends(request):
+    """Get min/max/mean/percentiles of a vital over time from the rollup tables"""
     try:
-        user = request.user
-        messages = HealthHistoryMessage.objects.filter(user=user).order_by('timestamp')
-        
-        message_data = []
-        for message in messages:
-            message_data.append({
-                'id': message.id,
-                'type': message.message_type,
-                'content': message.content,
-                'attachments': message.attachments,
-                'timestamp': message.timestamp.isoformat()
-            })
-        
-        return Response(message_data)
+        data_type = request.GET.get('data_type')
+        if data_type not in ROLLUP_FIELDS:
+            return Response(
+                {'error': f"data_type must be one of: {', '.join(ROLLUP_FIELDS)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            end = _query_datetime(request, 'end') or timezone.now()
+            start = _query_datetime(request, 'start') or end - timedelta(days=settings.HEALTH_TRENDS_DEFAULT_DAYS)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if start >= end:
+            return Response({'error': 'start must be before end'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Finest resolution that fits the range in HEALTH_TRENDS_MAX_POINTS buckets
+        resolution = request.GET.get('resolution') or choose_resolution(start, end)
+        if resolution not in RESOLUTIONS:
+            return Response(
+                {'error': f"resolution must be one of: {', '.join(RESOLUTIONS)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Day rollups are kept for good; longer ranges merge several days into each point
+        step = bucket_step(resolution, start, end)
+        if step > 1 and resolution != 'day':
+            return Response(
+                {'error': f'Range too long for {resolution} resolution (max {settings.HEALTH_TRENDS_MAX_POINTS} buckets)'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        rollups = [rollup async for rollup in trend_queryset(request.user.id, data_type, resolution, start, end)]
+        point_seconds = RESOLUTIONS[resolution] * step
+        
+        return Response({
+            'data_type': data_type,
+            'resolution': resolution,
+            'point_seconds': point_seconds,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'fields': summarize_trend(
+                data_type, rollups, point_seconds if step > 1 else None, bucket_start(start, resolution)
+            )
+        })
+        
+    except Exception as e:
+        logger.error(f"Error in get_health_trends: {str(e)}")
+        return Response(
+            {'error': 'Failed to get health trends'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+async def stream_events(request):
+    """Server-sent events with the user's new readings, analyses and alerts"""
+    try:
+        user, _ = await sync_to_async(authenticate)(request)
+        if not user.is_authenticated:
+            return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+
+        if not settings.EVENTS_REDIS_URL:
+            return JsonResponse({'error': 'Live updates are not enabled'}, status=503)
+
+        if 'wsgi.version' in request.META:
+            # A WSGI worker would be pinned to this connection for its whole lifetime
+            return JsonResponse({'error': 'Live updates require the ASGI server'}, status=503)
+
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        response = StreamingHttpResponse(event_stream(user.id, last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        logger.error(f"Error in stream_events: {str(e)}")
+        return JsonResponse({'error': 'Failed to open event stream'}, status=500)
+
+@async_api_view()
+async def get_health_history_messages(request):
+    """Get user's health history chat messages, a page at a time.
+
+    Each page is in chronological order. The first page holds the latest
+    messages, and the Link header points to the page before it. Filters:
+    type (user, ai) and a start/end range on timestamp.
+    """
+    try:
+        try:
+            limit = page_limit(request, HISTORY_PAGE_SIZE)
+            messages = HealthHistoryMessage.objects.filter(user=request.user)
+            message_types = _query_choices(request, 'type', [choice for choice, _ in HealthHistoryMessage.MESSAGE_TYPES])
+            if message_types:
+                messages = messages.filter(message_type__in=message_types)
+            messages = keyset_queryset(_query_range(request, messages, 'timestamp'), 'timestamp', request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        rows, cursor = await keyset_page(messages, HISTORY_MESSAGE_FIELDS, 'timestamp', limit)
+        
+        response = Response(rows[::-1])
+        if cursor:
+            response['Link'] = next_link(request, cursor)
+        return response
         
     except Exception as e:
         logger.error(f"Error in get_health_history_messages: {str(e)}")
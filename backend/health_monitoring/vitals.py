@@ -0,0 +1,154 @@
+from collections import defaultdict
+from django.db import transaction
+from .models import HealthData, ECGReading, AIAnalysis, CurrentVitals
+from .events import publish
+
+# data_type -> (timestamp field, CurrentVitals fields for HealthData.primary_value and secondary_value)
+METRIC_FIELDS = {
+    'heart_rate': ('heart_rate_at', ['heart_rate']),
+    'blood_pressure': ('blood_pressure_at', ['systolic', 'diastolic']),
+    'spo2': ('spo2_at', ['spo2']),
+    'temperature': ('temperature_at', ['temperature']),
+}
+
+SNAPSHOT_FIELDS = [
+    'heart_rate', 'heart_rate_at', 'systolic', 'diastolic', 'blood_pressure_at',
+    'spo2', 'spo2_at', 'temperature', 'temperature_at',
+    'ecg_heart_rate', 'ecg_recorded_at', 'risk_level', 'risk_assessed_at',
+]
+
+
+def _locked_vitals(user_id):
+    CurrentVitals.objects.get_or_create(user_id=user_id)
+    return CurrentVitals.objects.select_for_update().get(user_id=user_id)
+
+
+def _apply_health_data(vitals, reading):
+    """Copy a reading onto the snapshot if it is at least as new. Returns changed fields."""
+    at_field, value_fields = METRIC_FIELDS[reading.data_type]
+    current_at = getattr(vitals, at_field)
+    if current_at is not None and current_at > reading.recorded_at:
+        return []
+
+    setattr(vitals, at_field, reading.recorded_at)
+    for field, number in zip(value_fields, (reading.primary_value, reading.secondary_value)):
+        setattr(vitals, field, number)
+    return [at_field, *value_fields]
+
+
+def record_health_data(readings):
+    """Fold newly written HealthData rows into their users' snapshots and push them to clients"""
+    newest = {}
+    for reading in readings:
+        if reading.data_type not in METRIC_FIELDS:
+            continue
+        key = (reading.user_id, reading.data_type)
+        if key not in newest or reading.recorded_at > newest[key].recorded_at:
+            newest[key] = reading
+
+    by_user = defaultdict(list)
+    for (user_id, _), reading in newest.items():
+        by_user[user_id].append(reading)
+
+    with transaction.atomic():
+        for user_id, user_readings in by_user.items():
+            vitals = _locked_vitals(user_id)
+            changed = []
+            for reading in user_readings:
+                changed += _apply_health_data(vitals, reading)
+            if changed:
+                vitals.save(update_fields=[*changed, 'updated_at'])
+            publish(user_id, 'health_data', {
+                'readings': [
+                    {
+                        'data_type': reading.data_type,
+                        'value': reading.value,
+                        'unit': reading.unit,
+                        'recorded_at': reading.recorded_at,
+                    }
+                    for reading in user_readings
+                ]
+            })
+
+
+def record_ecg_reading(ecg_reading):
+    """Fold a newly written ECGReading into its user's snapshot"""
+    with transaction.atomic():
+        vitals = _locked_vitals(ecg_reading.user_id)
+        if vitals.ecg_recorded_at is None or vitals.ecg_recorded_at <= ecg_reading.recorded_at:
+            vitals.ecg_heart_rate = ecg_reading.heart_rate
+            vitals.ecg_recorded_at = ecg_reading.recorded_at
+            vitals.save(update_fields=['ecg_heart_rate', 'ecg_recorded_at', 'updated_at'])
+        publish(ecg_reading.user_id, 'ecg', {
+            'id': ecg_reading.id,
+            'heart_rate': ecg_reading.heart_rate,
+            'quality_score': ecg_reading.quality_score,
+            'anomalies_detected': ecg_reading.anomalies_detected,
+            'recorded_at': ecg_reading.recorded_at,
+        })
+
+
+def record_analysis(ai_analysis):
+    """Update the risk badge from a newly written AIAnalysis"""
+    with transaction.atomic():
+        vitals = _locked_vitals(ai_analysis.user_id)
+        if vitals.risk_assessed_at is None or vitals.risk_assessed_at <= ai_analysis.created_at:
+            vitals.risk_level = ai_analysis.risk_level
+            vitals.risk_assessed_at = ai_analysis.created_at
+            vitals.save(update_fields=['risk_level', 'risk_assessed_at', 'updated_at'])
+        publish(ai_analysis.user_id, 'analysis', {
+            'id': ai_analysis.id,
+            'analysis_result': ai_analysis.analysis_result,
+            'prediction': ai_analysis.prediction,
+            'confidence_score': ai_analysis.confidence_score,
+            'recommendations': ai_analysis.recommendations,
+            'risk_level': ai_analysis.risk_level,
+            'served_from_cache': ai_analysis.served_from_cache,
+            'created_at': ai_analysis.created_at,
+        })
+
+
+def compute_current_vitals(user_id):
+    """Build an unsaved snapshot for a user from the time-series tables"""
+    vitals = CurrentVitals(user_id=user_id)
+
+    latest = HealthData.objects.latest_per_type(user_id, list(METRIC_FIELDS))
+    for reading in latest.values():
+        _apply_health_data(vitals, reading)
+
+    ecg_reading = ECGReading.objects.filter(user_id=user_id).only(
+        'heart_rate', 'recorded_at'
+    ).order_by('-recorded_at').first()
+    if ecg_reading:
+        vitals.ecg_heart_rate = ecg_reading.heart_rate
+        vitals.ecg_recorded_at = ecg_reading.recorded_at
+
+    ai_analysis = AIAnalysis.objects.filter(user_id=user_id).only(
+        'risk_level', 'created_at'
+    ).first()
+    if ai_analysis:
+        vitals.risk_level = ai_analysis.risk_level
+        vitals.risk_assessed_at = ai_analysis.created_at
+
+    return vitals
+
+
+def rebuild_current_vitals(user_id):
+    """Recompute and store a user's snapshot from scratch"""
+    vitals = compute_current_vitals(user_id)
+    with transaction.atomic():
+        _locked_vitals(user_id)
+        vitals.save()
+    return vitals
+
+
+def diff_current_vitals(user_id):
+    """Fields whose stored snapshot value disagrees with the time-series tables"""
+    expected = compute_current_vitals(user_id)
+    stored = CurrentVitals.objects.filter(user_id=user_id).first()
+
+    return {
+        field: (getattr(stored, field) if stored else None, getattr(expected, field))
+        for field in SNAPSHOT_FIELDS
+        if (getattr(stored, field) if stored else None) != getattr(expected, field)
+    }
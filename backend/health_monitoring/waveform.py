@@ -0,0 +1,112 @@
+import base64
+import gzip
+import json
+import os
+import numpy as np
+from django.conf import settings
+
+DEFAULT_SAMPLE_RATE = 250  # Hz
+DEFAULT_GAIN = 1000.0  # ADC counts per mV
+DEFAULT_LEAD = 'I'
+
+SAMPLE_FORMATS = {
+    'int16': np.dtype('<i2'),
+    'float32': np.dtype('<f4'),
+}
+
+INT16_LIMIT = np.iinfo(np.int16).max
+
+
+def pack_waveform(samples, gain=DEFAULT_GAIN):
+    """Pack samples (in mV) into little-endian bytes.
+
+    Samples are stored as int16 counts when they fit at the given gain,
+    otherwise as float32. Returns (payload, sample_format, sample_count).
+    """
+    values = np.asarray(samples, dtype=np.float64).ravel()
+    counts = np.rint(values * gain)
+
+    if np.isfinite(counts).all() and (values.size == 0 or np.abs(counts).max() <= INT16_LIMIT):
+        packed = counts.astype(SAMPLE_FORMATS['int16'])
+        sample_format = 'int16'
+    else:
+        packed = values.astype(SAMPLE_FORMATS['float32'])
+        sample_format = 'float32'
+
+    return packed.tobytes(), sample_format, int(values.size)
+
+
+def unpack_waveform(payload, sample_format, gain=DEFAULT_GAIN):
+    """Decode a packed payload back into a float32 array of mV values"""
+    if not payload:
+        return np.zeros(0, dtype=np.float32)
+
+    raw = np.frombuffer(payload, dtype=SAMPLE_FORMATS[sample_format])
+    if sample_format == 'int16':
+        return raw.astype(np.float32) / np.float32(gain)
+    return raw.astype(np.float32)
+
+
+def waveform_fields(samples, sample_rate=DEFAULT_SAMPLE_RATE, gain=DEFAULT_GAIN, lead=DEFAULT_LEAD):
+    """Model field values for an ECGReading holding the given samples"""
+    payload, sample_format, sample_count = pack_waveform(samples, gain)
+    return {
+        'waveform_blob': payload,
+        'waveform_data': None,
+        'archive_path': '',
+        'sample_format': sample_format,
+        'sample_rate': sample_rate,
+        'sample_count': sample_count,
+        'gain': gain,
+        'lead': lead,
+    }
+
+
+def write_archive(relative_path, payload):
+    """Write a packed payload gzip-compressed under ECG_ARCHIVE_DIR.
+
+    The file is written under a temporary name and renamed into place, so a
+    reader never sees a partial strip.
+    """
+    path = os.path.join(settings.ECG_ARCHIVE_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.tmp'
+    with gzip.open(temporary, 'wb') as archive:
+        archive.write(payload)
+    os.replace(temporary, path)
+
+
+def read_archive(relative_path):
+    """Packed payload of an archived strip"""
+    with gzip.open(os.path.join(settings.ECG_ARCHIVE_DIR, relative_path), 'rb') as archive:
+        return archive.read()
+
+
+def encode_csv_waveform(reading):
+    """Base64 text of a reading's packed samples for CSV export"""
+    if reading.waveform_blob is not None:
+        payload, sample_format = bytes(reading.waveform_blob), reading.sample_format
+    elif reading.archive_path:
+        payload, sample_format = read_archive(reading.archive_path), reading.sample_format
+    else:
+        payload, sample_format, _ = pack_waveform(reading.waveform_data or [], reading.gain)
+    return base64.b64encode(payload).decode('ascii'), sample_format
+
+
+def csv_waveform_fields(row):
+    """Waveform field values from a CSV row.
+
+    Accepts both the legacy JSON array in ``waveform_data`` and the packed
+    base64 payload written by ``export_to_csv``.
+    """
+    raw = row['waveform_data'].strip()
+    sample_rate = int(row.get('sample_rate') or DEFAULT_SAMPLE_RATE)
+    gain = float(row.get('gain') or DEFAULT_GAIN)
+    lead = row.get('lead') or DEFAULT_LEAD
+
+    if raw.startswith('['):
+        samples = json.loads(raw)
+    else:
+        samples = unpack_waveform(base64.b64decode(raw), row.get('sample_format') or 'int16', gain)
+
+    return waveform_fields(samples, sample_rate=sample_rate, gain=gain, lead=lead)
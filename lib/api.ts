@@ -97,16 +97,72 @@ class APIService {
     return response.json()
   }
 
-  async getHealthAlerts() {
-    const response = await fetch(`${API_BASE_URL}/health/alerts/`, {
-      headers: this.getAuthHeaders(),
-    })
-    return response.json()
+  // Optional filters: type, status, severity (comma-separated), start, end, limit and
+  // cursor. The next page's URL is in the response's Link header.
+  async getHealthAlerts(params: Record<string, string> = {}) {
+    const query = new URLSearchParams(params).toString()
+    const response = await fetch(`${API_BASE_URL}/health/alerts/${query ? `?${query}` : ""}`, {
+      headers: this.getAuthHeaders(),
+    })
+    return response.json()
+  }
+
+  // Live updates (server-sent events). EventSource cannot send the bearer
+  // token, so the stream is read with fetch and reconnects with Last-Event-ID.
+  // "resync" means events were missed and the caller should refetch.
+  subscribeToEvents(onEvent: (type: string, data: any) => void) {
+    const controller = new AbortController()
+    let lastEventId = ""
+    let retryMs = 3000
+
+    const connect = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          const response = await fetch(`${API_BASE_URL}/health/events/`, {
+            headers: { ...this.getAuthHeaders(), ...(lastEventId && { "Last-Event-ID": lastEventId }) },
+            signal: controller.signal,
+          })
+          if (!response.ok || !response.body) return
+
+          const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+          let buffer = ""
+          while (true) {
+            const { value, done } = await reader.read()
+            if (done) break
+            buffer += value
+            const messages = buffer.split("\n\n")
+            buffer = messages.pop() || ""
+            for (const message of messages) {
+              let type = "message"
+              let data = ""
+              for (const line of message.split("\n")) {
+                const [field, ...rest] = line.split(": ")
+                const content = rest.join(": ")
+                if (field === "id") lastEventId = content
+                else if (field === "event") type = content
+                else if (field === "data") data = content
+                else if (field === "retry") retryMs = Number(content) || retryMs
+              }
+              if (data) onEvent(type, JSON.parse(data))
+            }
+          }
+        } catch (error) {
+          if (controller.signal.aborted) return
+        }
+        await new Promise((resolve) => setTimeout(resolve, retryMs))
+      }
+    }
+
+    connect()
+    return () => controller.abort()
   }
 
   // Health History endpoints
-  async getHealthHistoryMessages() {
-    const response = await fetch(`${API_BASE_URL}/health/history/messages/`, {
+  // Latest messages first page; the Link header points to older ones. Optional
+  // filters: type, start, end, limit and cursor.
+  async getHealthHistoryMessages(params: Record<string, string> = {}) {
+    const query = new URLSearchParams(params).toString()
+    const response = await fetch(`${API_BASE_URL}/health/history/messages/${query ? `?${query}` : ""}`, {
       headers: this.getAuthHeaders(),
     })
     return response.json()